@@ -0,0 +1,100 @@
+import hashlib
+import os
+import threading
+import uuid
+from typing import Callable, Optional
+import numpy as np
+import images
+
+class BandCache:
+    """
+    Persistent cache for decoded bands, stored as .npy files and opened memory-mapped.
+
+    Entries are keyed by the source path, its modification time and size and the parameters of the
+    decoding (resolution, dtype, ...), so changed images are never served from the cache.
+    The modification time of an entry is its last use, the least recently used entries are evicted
+    once the cache grows above max_bytes.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 4 * 1024**3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, path: str, **params) -> str:
+        # Bands inside of a zipped product are keyed by their /vsizip/ path and the archive
+        stat = os.stat(images.source_file(path))
+        source = path if path.startswith(images.VSIZIP) else os.path.abspath(path)
+        description = repr((source, stat.st_mtime_ns, stat.st_size, sorted(params.items())))
+        return hashlib.sha1(description.encode()).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npy")
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """
+        Returns the cached array as read-only memory map, or None if it isn't cached.
+        """
+        entry_path = self._entry_path(key)
+        try:
+            band = np.load(entry_path, mmap_mode="r")
+            os.utime(entry_path) # mark as recently used
+        except (FileNotFoundError, ValueError): # missing or evicted by another process
+            return None
+        return band
+
+    def put(self, key: str, band: np.ndarray):
+        size = band.nbytes
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._evict(self.max_bytes - size)
+            # Writing to a temporary file first, so other processes never see partial entries
+            temp_path = os.path.join(self.directory, f".{key}.{uuid.uuid4().hex}.tmp")
+            with open(temp_path, "wb") as f:
+                np.save(f, band)
+            os.replace(temp_path, self._entry_path(key))
+
+    def get_or_load(self, path: str, load: Callable[[], np.ndarray], **params) -> np.ndarray:
+        """
+        Returns the cached band for path and params, or loads, caches and returns it.
+        """
+        key = self.key(path, **params)
+        band = self.get(key)
+        if band is None:
+            band = load()
+            self.put(key, band)
+        return band
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def clear(self):
+        with self._lock:
+            self._evict(0)
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".npy"):
+                entry_path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(entry_path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry_path))
+        return entries
+
+    def _evict(self, max_bytes: int):
+        # Removing the least recently used entries until the cache fits into max_bytes
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_path in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(entry_path) # memory maps of the entry stay valid
+            except FileNotFoundError:
+                pass
+            total -= size
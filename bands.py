@@ -1,34 +1,111 @@
 import rasterio
 import numpy as np
 import images
-import os
+from band_cache import BandCache
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence
+from rasterio.enums import Resampling
+from rasterio.transform import Affine
+from rasterio.windows import Window
 
-def load_band(path: str) -> np.ndarray:
+SCALING = 10000.0 # Sentinel-2 typical scaling
+
+# Precision of the scaled and normalized bands. "float32" halves the memory of every band copy,
+# the masks then match the "float64" results within the tolerance given in benchmark_precision.py
+PRECISIONS = {"float64": np.float64, "float32": np.float32}
+
+def load_raw_band(path: str, window: Optional[Window] = None, down_scale_factor: int = 1) -> np.ndarray:
+    """
+    Loads a band, or only the given window of it, with the stored values (uint16 reflectances for Sentinel-2).
+    With a down_scale_factor > 1 the band is decoded at the reduced resolution directly,
+    GDAL then reads from the matching JP2 resolution level instead of the full resolution.
+    """
     with rasterio.open(path) as src:
-        band = src.read(1).astype(float)
+        if down_scale_factor > 1:
+            height = window.height if window is not None else src.height
+            width = window.width if window is not None else src.width
+            out_shape = (int(height) // down_scale_factor, int(width) // down_scale_factor)
+            band = src.read(1, window=window, out_shape=out_shape, resampling=Resampling.bilinear)
+        else:
+            band = src.read(1, window=window)
     return band
 
+def load_band(path: str, window: Optional[Window] = None, down_scale_factor: int = 1) -> np.ndarray:
+    """
+    Loads a band like load_raw_band, as float64.
+    """
+    return load_raw_band(path, window, down_scale_factor).astype(float)
+
+def band_shape(path: str):
+    """
+    Returns the (height, width) of a band without decoding it.
+    """
+    with rasterio.open(path) as src:
+        return src.height, src.width
+
+def band_georeference(path: str, down_scale_factor: int = 1):
+    """
+    Returns the (transform, crs) of a band, the transform matches the band as loaded with the down_scale_factor.
+    """
+    with rasterio.open(path) as src:
+        transform = src.transform
+        if down_scale_factor > 1:
+            # Same output shape as in load_band
+            transform = transform * Affine.scale(src.width / (src.width // down_scale_factor), src.height / (src.height // down_scale_factor))
+        return transform, src.crs
+
 # Normalize bands between 0 and 1
-def normalize_band(band: np.ndarray) -> np.ndarray:
-    band = band.astype(float)
-    band_min = np.min(band)
-    band_max = np.max(band)
+# band_min and band_max can be passed in to normalize a window with the range of the whole band
+# With in_place=True a band that already has the dtype is overwritten instead of copied
+def normalize_band(band: np.ndarray, band_min: Optional[float] = None, band_max: Optional[float] = None, dtype=float, in_place: bool = False) -> np.ndarray:
+    if not (in_place and band.dtype == dtype and band.flags.writeable):
+        band = band.astype(dtype)
+    band_min = np.min(band) if band_min is None else band_min
+    band_max = np.max(band) if band_max is None else band_max
     if band_max - band_min > 0:
-        band = (band - band_min) / (band_max - band_min)
+        band -= band_min
+        band /= band_max - band_min
     return band
 
-def get_bands(img: images.Image):
-    cm = None
-    b12_path, b11_path, b8a_path, b04_path, b03_path, b02_path, cm_path = images.get_band_paths(img)
-
-    scaling = 10000.0 # Sentinel-2 typical scaling
-
-    b12 = load_band(b12_path) / scaling
-    b11 = load_band(b11_path) / scaling
-    b8a = load_band(b8a_path) / scaling
-    b04 = load_band(b04_path) / scaling
-    b03 = load_band(b03_path) / scaling
-    b02 = load_band(b02_path) / scaling
-    if os.path.exists(cm_path): cm = load_band(cm_path) /scaling
-    
-    return b12, b11, b8a, b04, b03, b02, cm
\ No newline at end of file
+BAND_NAMES = ("b12", "b11", "b8a", "b04", "b03", "b02", "cm") # in the order of images.get_band_paths
+
+def load_bands(img: images.Image, names: Sequence[str], down_scale_factor: int = 1, max_workers: Optional[int] = None, cache: Optional[BandCache] = None, precision: str = "float64") -> List[Optional[np.ndarray]]:
+    """
+    Returns the scaled bands with the given names (see BAND_NAMES) in this order, "cm" is None if the image has no cloud mask.
+    The bands are decoded concurrently on a thread pool (rasterio releases the GIL while decoding).
+    With a down_scale_factor > 1 the bands are decoded at the reduced resolution only.
+    With a cache, decoded bands are stored on disk and returned as read-only memory maps on later runs.
+    With precision="float32" the raw uint16 reflectances are cached instead and scaled into writable float32 bands.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}', expected one of {list(PRECISIONS)}")
+    unknown = set(names) - set(BAND_NAMES)
+    if unknown:
+        raise ValueError(f"Unknown bands {sorted(unknown)}, expected some of {list(BAND_NAMES)}")
+
+    paths = dict(zip(BAND_NAMES, images.get_band_paths(img)))
+    if not images.has_cloud_mask(img): paths["cm"] = None
+
+    scaling = SCALING
+
+    def load_scaled(path):
+        if path is None:
+            return None
+        if precision == "float32":
+            load = lambda: load_raw_band(path, down_scale_factor=down_scale_factor)
+            raw = load() if cache is None else cache.get_or_load(path, load, down_scale_factor=down_scale_factor, raw=True)
+            return np.divide(raw, np.float32(scaling), dtype=np.float32)
+        load = lambda: load_band(path, down_scale_factor=down_scale_factor) / scaling
+        if cache is None:
+            return load()
+        return cache.get_or_load(path, load, down_scale_factor=down_scale_factor, scaling=scaling, dtype="float64")
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(names)) as executor:
+        return list(executor.map(load_scaled, [paths[name] for name in names]))
+
+def get_bands(img: images.Image, down_scale_factor: int = 1, max_workers: Optional[int] = None, cache: Optional[BandCache] = None, precision: str = "float64"):
+    """
+    Returns the scaled bands B12, B11, B8A, B04, B03, B02 and the cloud mask (None if not available), see load_bands.
+    """
+    b12, b11, b8a, b04, b03, b02, cm = load_bands(img, BAND_NAMES, down_scale_factor, max_workers, cache, precision)
+    return b12, b11, b8a, b04, b03, b02, cm
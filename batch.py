@@ -0,0 +1,275 @@
+import argparse
+import json
+import os
+import sys
+import time
+import traceback
+import zipfile
+from contextlib import ExitStack
+from datetime import date, datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+import images
+import cog_writer
+from catalog import Catalog, SCENE_NAME, resolve
+import fire_regions
+import profiling
+from bands import band_georeference, band_shape
+from detection import pipeline_halo
+from pipeline import Pipeline
+from tiling import detect_tiled
+
+# Headless detection of many scenes, without any visualization. Every scene is processed in a worker of a
+# process pool, its results (COGs, see cog_writer.py), fire regions and statistics are written to <output>/<scene>/.
+# Usage: python batch.py SCENE_OR_DIRECTORY [...] --output results --workers 2 --memory-gb 4
+#
+# A scene is given by the name of an image in images.py (e.g. Flin_Flon), by its directory (containing the
+# infrared and color folders), by a zipped SAFE product, by any directory above, which is searched for scenes,
+# or by its scene name (e.g. T13UFA_20250602T175931) in the catalog of the images folder.
+# Directories are resolved through their scene catalog (catalog.py), which can filter by tile, date and bounding box.
+# Scenes whose stats.json exists are skipped, so an interrupted run continues where it stopped.
+
+# Peak memory of the detection per pixel with some margin, measured on a full 5490x5490 tile (149 and 80 bytes)
+BYTES_PER_PIXEL = {"float64": 160, "float32": 88}
+# Memory of the stitched masks of the tiled detection per pixel of the scene (fire, labels, burnt area)
+TILED_BYTES_PER_PIXEL = 6
+TILE_SIZES = (4096, 2048, 1024, 512, 256)
+STATS_FILE = "stats.json"
+PROFILE_NAME = "profile" # profile.jsonl and profile.trace.json in the scene directory, see profiling.py
+
+@dataclass
+class Scene:
+    name: str # unique name, the tile and acquisition time of Sentinel-2 scenes
+    img: images.Image
+    pixels: int
+    size_bytes: int # size of the band files
+
+def _scene(img: images.Image) -> Scene:
+    paths = images.get_band_paths(img)[:6]
+    height, width = band_shape(paths[0])
+    return Scene(img.file_name_prefix, img, height * width, sum(images.band_size(path) for path in paths))
+
+def find_scenes(sources: Sequence[str], tile: Optional[str] = None, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                bbox: Optional[Tuple[float, float, float, float]] = None, catalog_path: Optional[str] = None, root: str = "images") -> List[Scene]:
+    """
+    Returns the scenes of the given image names, zipped products, directories and scene names, the largest first.
+    The scenes of directories are looked up in their catalog and filtered by tile, sensing time and bounding box,
+    scene names in the catalog of root.
+    """
+    found = {}
+    for source in sources:
+        scenes = []
+        if hasattr(images, source) and isinstance(getattr(images, source), images.Image):
+            imgs = [getattr(images, source)]
+        elif os.path.isfile(source) and images.is_safe_zip(source):
+            imgs = [source]
+        elif os.path.isdir(source):
+            imgs = []
+            with Catalog(source, catalog_path) as catalog:
+                catalog.refresh(verbose=True)
+                scenes = [Scene(scene.name, scene.image, scene.shape[0] * scene.shape[1], scene.size_bytes)
+                          for scene in catalog.find(tile=tile, start=start, end=end, bbox=bbox)]
+            if not scenes:
+                print(f"No scenes found in {source}")
+        elif SCENE_NAME.fullmatch(source):
+            try:
+                imgs = [resolve(source, root)]
+            except KeyError as error:
+                imgs = []
+                print(error.args[0])
+        else:
+            raise ValueError(f"'{source}' is neither an image of images.py, a zipped SAFE product, a directory nor a scene name")
+        for img in imgs:
+            try:
+                # Zipped products are opened here, so a broken archive is skipped like a scene with missing bands
+                img = images.from_safe_zip(img) if isinstance(img, str) else img
+                scenes.append(_scene(img))
+            except (OSError, zipfile.BadZipFile) as error:
+                print(f"Skipping {getattr(img, 'directory', img)}, bands are missing: {error}")
+        for scene in scenes:
+            if scene.name in found and found[scene.name].img.directory != scene.img.directory:
+                print(f"Skipping {scene.img.directory}, a scene {scene.name} was already found in {found[scene.name].img.directory}")
+                continue
+            found[scene.name] = scene
+    # Largest first, so the last scenes to finish are short ones and the workers stay busy until the end
+    return sorted(found.values(), key=lambda scene: (scene.pixels, scene.size_bytes), reverse=True)
+
+def is_done(scene: Scene, output_dir: str) -> bool:
+    return os.path.exists(os.path.join(output_dir, scene.name, STATS_FILE))
+
+def tile_size_for(pixels: int, memory_budget: int, precision: str) -> Optional[int]:
+    """
+    Returns None if the whole scene fits into the memory budget, otherwise the largest tile size that does.
+    If no tile size fits, a warning is printed and the smallest one is returned.
+    """
+    if pixels * BYTES_PER_PIXEL[precision] <= memory_budget:
+        return None
+    halo = pipeline_halo()
+    for tile_size in TILE_SIZES:
+        # The tiled detection always runs in float64
+        if pixels * TILED_BYTES_PER_PIXEL + (tile_size + 2 * halo)**2 * BYTES_PER_PIXEL["float64"] <= memory_budget:
+            return tile_size
+    needed = pixels * TILED_BYTES_PER_PIXEL + (TILE_SIZES[-1] + 2 * halo)**2 * BYTES_PER_PIXEL["float64"]
+    print(f"Warning: not even {TILE_SIZES[-1]} pixel tiles fit into the memory budget of {memory_budget / 1024**2:.0f} MB, "
+          f"the tiled detection needs about {needed / 1024**2:.0f} MB")
+    return TILE_SIZES[-1]
+
+def detect_scene(scene: Scene, output_dir: str, memory_budget: int, precision: str = "float64", down_scale_factor: int = 1, profile: bool = False) -> dict:
+    """
+    Runs the detection of a scene and writes the results as COGs (fire.tif, labels.tif, burn_index.tif, burnt_area.tif),
+    regions.geojson and stats.json to <output_dir>/<scene>.
+    Scenes that don't fit into the memory budget are processed tile by tile (only without down scaling).
+    profile records the stages to profile.jsonl and profile.trace.json next to the results.
+    """
+    scene_dir = os.path.join(output_dir, scene.name)
+    os.makedirs(scene_dir, exist_ok=True)
+    # ru_maxrss would be the peak of the parent for a forked worker, and a resident worker keeps its peak between jobs
+    profiling.reset_peak_memory()
+    if not profile:
+        return _detect_scene(scene, scene_dir, memory_budget, precision, down_scale_factor)
+    profile_path = os.path.join(scene_dir, PROFILE_NAME)
+    for path in (f"{profile_path}.jsonl", f"{profile_path}.trace.json"): # a rerun replaces the profile
+        if os.path.exists(path):
+            os.remove(path)
+    profiling.enable(f"{profile_path}.jsonl", f"{profile_path}.trace.json")
+    try:
+        with profiling.stage("scene", category="scene", scene=scene.name, pixels=scene.pixels):
+            return _detect_scene(scene, scene_dir, memory_budget, precision, down_scale_factor)
+    finally:
+        profiling.disable()
+
+def _detect_scene(scene: Scene, scene_dir: str, memory_budget: int, precision: str, down_scale_factor: int) -> dict:
+    time_start = time.time()
+    transform, crs = band_georeference(images.get_band_paths(scene.img)[0], down_scale_factor)
+
+    tile_size = tile_size_for(scene.pixels // down_scale_factor**2, memory_budget, precision) if down_scale_factor == 1 else None
+    if tile_size is None:
+        pipeline = Pipeline(scene.img, down_scale_factor=down_scale_factor, precision=precision)
+        fire_mask = pipeline.get("fire_masks").final
+        regions = pipeline.get("regions")
+        labels, records = regions.labels, regions.records
+        burnt_area = pipeline.get("burnt_area").combined_edges_opened
+        burning_area = pipeline.get("burning_area")
+        cog_writer.write_results(scene_dir, transform, crs, fire=fire_mask, labels=labels, burn_index=pipeline.get("burn_index"), burnt_area=burnt_area)
+    else:
+        # The tiles are written while they are detected, the labels once the regions are merged
+        shape = band_shape(images.get_band_paths(scene.img)[0])
+        with ExitStack() as stack:
+            writers = {name: stack.enter_context(cog_writer.result_writer(scene_dir, name, shape, transform, crs)) for name in ("fire", "burnt_area", "burn_index")}
+            result = detect_tiled(scene.img, tile_size=tile_size, max_workers=1, writers=writers)
+        fire_mask, labels, records = result.final_fire_mask, result.labeled_fire, result.regions
+        burnt_area, burning_area = result.combined_edges_opened, result.burning_area
+        cog_writer.write_results(scene_dir, transform, crs, labels=labels)
+
+    fire_regions.write_geojson(os.path.join(scene_dir, "regions.geojson"), labels, records, transform, crs)
+
+    stats = {
+        "scene": scene.name,
+        "directory": scene.img.directory,
+        "shape": list(fire_mask.shape),
+        "down_scale_factor": down_scale_factor,
+        "precision": precision if tile_size is None else "float64",
+        "tile_size": tile_size,
+        "burning_area_km2": float(burning_area),
+        "amount_regions": int(len(records)),
+        "burnt_area_pixels": int(np.count_nonzero(burnt_area)),
+        "duration_s": round(time.time() - time_start, 2),
+        "peak_memory_mb": round(profiling.total_peak_memory() / 1024),
+    }
+    # Written last and renamed into place, it marks the scene as done
+    stats_path = os.path.join(scene_dir, STATS_FILE)
+    with open(stats_path + ".tmp", "w") as f:
+        json.dump(stats, f, indent=2)
+    os.replace(stats_path + ".tmp", stats_path)
+    return stats
+
+def detect_scene_safe(*args, **kwargs):
+    # Errors are returned instead of raised, so a failing scene doesn't stop the others
+    try:
+        return detect_scene(*args, **kwargs), None
+    except Exception:
+        return None, traceback.format_exc()
+
+def run_batch(sources: Sequence[str], output_dir: str, workers: int = 1, memory_gb: float = 4, precision: str = "float64",
+              down_scale_factor: int = 1, force: bool = False, profile: bool = False, **filters) -> int:
+    """
+    Processes all scenes that are not done yet, returns the amount of scenes that failed.
+    The filters (tile, start, end, bbox, catalog_path) are passed to find_scenes.
+    """
+    scenes = find_scenes(sources, **filters)
+    pending = [scene for scene in scenes if force or not is_done(scene, output_dir)]
+    print(f"{len(scenes)} scenes, {len(scenes) - len(pending)} already done, {len(pending)} to process with {workers} workers")
+    if not pending:
+        return 0
+
+    failed = 0
+    done = 0
+    total = len(pending)
+    memory_budget = int(memory_gb * 1024**3)
+    while pending:
+        broken, retry = False, []
+        # A new process for every scene, so the memory of a large scene is released and the peak memory is the one of the scene
+        with ProcessPoolExecutor(workers, max_tasks_per_child=1) as executor:
+            # Submitted largest first, the pool starts them in this order
+            futures = {executor.submit(detect_scene_safe, scene, output_dir, memory_budget, precision, down_scale_factor, profile): scene for scene in pending}
+            for future in as_completed(futures):
+                scene = futures[future]
+                try:
+                    stats, error = future.result()
+                except BrokenProcessPool:
+                    # A worker died (e.g. killed when it ran out of memory), which breaks the pool for all scenes not done yet.
+                    # The first of them counts as failed, the others are processed again by a new pool
+                    if broken:
+                        retry.append(scene)
+                        continue
+                    broken = True
+                    stats, error = None, traceback.format_exc()
+                done += 1
+                if error is not None:
+                    failed += 1
+                    print(f"[{done}/{total}] {scene.name} failed:\n{error}")
+                    continue
+                mode = f"tiled ({stats['tile_size']})" if stats["tile_size"] else "full"
+                print(f"[{done}/{total}] {scene.name}: {stats['amount_regions']} fire regions, "
+                      f"{stats['burning_area_km2']:.2f} km^2 burning, {mode}, {stats['duration_s']:.1f} s, {stats['peak_memory_mb']} MB")
+        pending = retry
+    return failed
+
+def parse_end(value: str) -> datetime:
+    """
+    Parses the end of a sensing time range, a date without a time includes the whole day.
+    """
+    try:
+        day = date.fromisoformat(value)
+    except ValueError:
+        return datetime.fromisoformat(value)
+    return datetime.combine(day, datetime.max.time())
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Headless wildfire detection of many scenes.")
+    parser.add_argument("scenes", nargs="+", help="image names of images.py, zipped SAFE products, directories to search for scenes or scene names")
+    parser.add_argument("--output", default="results", help="directory for the results, one subdirectory per scene")
+    parser.add_argument("--workers", type=int, default=1, help="amount of scenes processed at the same time")
+    parser.add_argument("--memory-gb", type=float, default=4, help="memory budget per worker, larger scenes are processed tile by tile")
+    parser.add_argument("--precision", choices=["float64", "float32"], default="float64")
+    parser.add_argument("--down-scale-factor", type=int, default=1)
+    parser.add_argument("--force", action="store_true", help="process scenes again that are already done")
+    parser.add_argument("--profile", action="store_true", help="record the stages of every scene to profile.jsonl and profile.trace.json")
+    parser.add_argument("--tile", help="only scenes of this MGRS tile (e.g. 10TEK), for scenes found in directories")
+    parser.add_argument("--start", type=datetime.fromisoformat, help="only scenes sensed at or after this date (e.g. 2024-07-01)")
+    parser.add_argument("--end", type=parse_end, help="only scenes sensed at or before this date and time (a date includes the whole day)")
+    parser.add_argument("--bbox", type=float, nargs=4, metavar=("MIN_LON", "MIN_LAT", "MAX_LON", "MAX_LAT"), help="only scenes intersecting this bounding box")
+    parser.add_argument("--catalog", help="path of the scene catalog, by default catalog.sqlite in the searched directory")
+    parser.add_argument("--root", default="images", help="directory whose catalog holds the scenes given by name")
+    args = parser.parse_args(argv)
+    failed = run_batch(args.scenes, args.output, workers=args.workers, memory_gb=args.memory_gb, precision=args.precision,
+                       down_scale_factor=args.down_scale_factor, force=args.force, profile=args.profile, tile=args.tile, start=args.start, end=args.end,
+                       bbox=args.bbox, catalog_path=args.catalog, root=args.root)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
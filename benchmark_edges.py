@@ -0,0 +1,51 @@
+import time
+import numpy as np
+from scipy.ndimage import gaussian_filter
+import detection
+
+# Compares the burnt area detection with shared float32 gradients against the reference with separate
+# float64 smoothings for sobel and skimage's canny.
+# Usage: python benchmark_edges.py
+
+def synthetic_burn_index(size: int, seed: int = 0) -> np.ndarray:
+    # Smooth reflectances with a burn scar, similar to the infrared bands of a scene
+    rng = np.random.default_rng(seed)
+    base = gaussian_filter(rng.random((size, size)), 8)
+    base = (base - base.min()) / (base.max() - base.min())
+    b12, b11, b8a = 0.15 + 0.15 * base, 0.2 + 0.12 * base, 0.25 + 0.1 * (1 - base)
+    rows, cols = np.mgrid[:size, :size]
+    scar = (rows - size * 0.6)**2 + (cols - size * 0.4)**2 < (size * 0.15)**2
+    b12[scar] += 0.1
+    b11[scar] -= 0.02
+    return detection.burn_index(b12, b11, b8a)
+
+def best_time(function, repeats: int = 3) -> float:
+    times = []
+    for _ in range(repeats):
+        time_start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - time_start)
+    return min(times)
+
+def check_equivalence(size: int = 1500):
+    print(f"Difference to the reference ({size}x{size}):")
+    for seed in range(3):
+        burn_index = synthetic_burn_index(size, seed)
+        expected = detection.burnt_area_edges_reference(burn_index)
+        result = detection.burnt_area_edges(burn_index)
+        differing = [np.count_nonzero((e > 0) != (r > 0)) for e, r in zip(expected, result)]
+        print(f"  seed {seed}: {int(np.count_nonzero(expected[2]))} burnt area pixels, differing pixels "
+              f"sobel {differing[0]}, canny (dilated) {differing[1]}, burnt area {differing[2]}")
+
+def run(size: int = 5490):
+    burn_index = synthetic_burn_index(size)
+    print(f"Burnt area detection {size}x{size}, best of 3:")
+    time_reference = best_time(lambda: detection.burnt_area_edges_reference(burn_index))
+    print(f"  reference:                {time_reference * 1000:8.1f} ms")
+    time_shared = best_time(lambda: detection.burnt_area_edges(burn_index))
+    print(f"  shared gradients:         {time_shared * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    check_equivalence()
+    run()
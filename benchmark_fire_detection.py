@@ -0,0 +1,58 @@
+import time
+import numpy as np
+import detection
+import fire_detection_cpp
+
+# Checks the fused C++ fire mask kernel against the NumPy reference and compares the run times.
+# Usage: python benchmark_fire_detection.py
+
+def synthetic_bands(size: int, seed: int = 0):
+    # Normalized bands with a few hot spots, so that every threshold is hit somewhere
+    rng = np.random.default_rng(seed)
+    bands = [rng.random((size, size)) for _ in range(6)]
+    hot = rng.random((size, size)) < 0.001
+    bands[0][hot] = 1.0
+    bands[1][hot] *= 0.3
+    bands[2][hot] *= 0.1
+    band_max = tuple(rng.uniform(0.5, 2.0, 6))
+    return bands, band_max
+
+def best_time(function, repeats: int = 3) -> float:
+    times = []
+    for _ in range(repeats):
+        time_start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - time_start)
+    return min(times)
+
+def check_equivalence(size: int = 500):
+    print(f"Equivalence with the NumPy reference ({size}x{size}):")
+    for seed in range(5):
+        bands, band_max = synthetic_bands(size, seed)
+        expected = detection.fire_masks_reference(*bands, band_max)
+        for num_threads in (1, 3):
+            masks = detection.fire_masks(*bands, band_max, num_threads=num_threads)
+            equal = all(np.array_equal(e, m) for e, m in zip(expected, masks))
+            # float32 bands are compared by their exact value, so they match the reference on the same values in float64
+            bands32 = [band.astype(np.float32) for band in bands]
+            expected32 = detection.fire_masks_reference(*[band.astype(np.float64) for band in bands32], band_max)
+            masks32 = detection.fire_masks(*bands32, band_max, num_threads=num_threads)
+            equal32 = all(np.array_equal(e, m) for e, m in zip(expected32, masks32))
+            print(f"  seed {seed}, threads {num_threads}: {int(expected[0].sum()):>6} outer, {int(expected[1].sum()):>4} core pixels, "
+                  f"equal: {equal}, equal (float32): {equal32}")
+
+def run(size: int = 5490):
+    bands, band_max = synthetic_bands(size)
+    print(f"Fire masks {size}x{size}, best of 3:")
+    time_reference = best_time(lambda: detection.fire_masks_reference(*bands, band_max))
+    print(f"  NumPy reference:            {time_reference * 1000:8.1f} ms")
+    for num_threads in (1, 2, 4, 0):
+        time_fused = best_time(lambda: detection.fire_masks(*bands, band_max, num_threads=num_threads))
+        print(f"  fused, threads {num_threads}:           {time_fused * 1000:8.1f} ms")
+    time_kernel = best_time(lambda: fire_detection_cpp.fire_masks(*bands, band_max, num_threads=0))
+    print(f"  fused thresholds only:      {time_kernel * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    check_equivalence()
+    run()
@@ -0,0 +1,49 @@
+import time
+import numpy as np
+import cv2
+import morphology
+import binary_morphology_cpp
+
+# Compares the bit-packed binary morphology (and the morphology module, which picks OpenCV for small
+# kernels) with the OpenCV calls it replaces in the pipeline.
+# Usage: python benchmark_morphology.py
+
+KERNEL_SIZES = [2, 7, 50, 135, 200]
+OPERATIONS = {
+    "dilate": (cv2.MORPH_DILATE, binary_morphology_cpp.dilate, morphology.dilate),
+    "close": (cv2.MORPH_CLOSE, binary_morphology_cpp.close, morphology.close),
+}
+
+def synthetic_mask(size: int, seed: int = 0) -> np.ndarray:
+    # Sparse blobs, similar to fire and edge masks
+    rng = np.random.default_rng(seed)
+    mask = (rng.random((size, size)) < 0.0005).astype(np.uint8)
+    return cv2.dilate(mask, np.ones((5, 5), np.uint8))
+
+def best_time(function, repeats: int) -> float:
+    times = []
+    for _ in range(repeats):
+        time_start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - time_start)
+    return min(times)
+
+def run(size: int = 5490, repeats: int = 3):
+    mask = synthetic_mask(size)
+    print(f"Mask size: {size}x{size}, best of {repeats}")
+    print(f"{'operation':>10} {'kernel':>7} {'opencv [ms]':>12} {'packed [ms]':>12} {'morphology [ms]':>16} {'speedup':>8} {'equal':>6}")
+    for name, (cv2_op, packed_op, morphology_op) in OPERATIONS.items():
+        for kernel_size in KERNEL_SIZES:
+            kernel = np.ones((kernel_size, kernel_size), np.uint8)
+            expected = cv2.morphologyEx(mask, cv2_op, kernel)
+            equal = np.array_equal(expected, packed_op(mask, kernel_size, kernel_size)) and np.array_equal(expected, morphology_op(mask, kernel_size))
+
+            time_opencv = best_time(lambda: cv2.morphologyEx(mask, cv2_op, kernel), repeats)
+            time_packed = best_time(lambda: packed_op(mask, kernel_size, kernel_size), repeats)
+            time_morphology = best_time(lambda: morphology_op(mask, kernel_size), repeats)
+            speedup = time_opencv / time_morphology
+            print(f"{name:>10} {kernel_size:>7} {time_opencv * 1000:>12.1f} {time_packed * 1000:>12.1f} {time_morphology * 1000:>16.1f} {speedup:>7.1f}x {str(equal):>6}")
+
+
+if __name__ == "__main__":
+    run()
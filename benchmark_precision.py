@@ -0,0 +1,74 @@
+import multiprocessing
+import sys
+import time
+import numpy as np
+import images
+import detection
+import fire_regions
+from bands import get_bands, normalize_band, PRECISIONS
+from profiling import peak_memory, reset_peak_memory
+
+# Runs the detection with float64 and float32 bands, each in a fresh process, and compares the peak memory
+# and the resulting masks.
+# Usage: python benchmark_precision.py [down_scale_factor]
+
+# Share of the pixels of a mask that may differ from the float64 result. The masks only differ where a band
+# value lies within the float32 rounding error (about 1e-7 relative) of a threshold, and for the burnt area
+# where the percentile thresholds of the sobel magnitude shift by such an amount.
+MASK_TOLERANCE = {
+    "outer fire": 1e-5,
+    "core fire": 1e-5,
+    "regions": 1e-5,
+    "burnt area": 1e-4,
+}
+
+def detect(img: images.Image, precision: str, down_scale_factor: int):
+    """
+    The processing of main without the visualization, returns the masks and the peak memory in MB.
+    """
+    # ru_maxrss would include the peak of the parent, which the spawned process inherits
+    reset_peak_memory()
+    time_start = time.time()
+    b12, b11, b8a, b04, b03, b02, _ = get_bands(img, down_scale_factor=down_scale_factor, precision=precision)
+    dtype = PRECISIONS[precision]
+    band_max = tuple(band.max() for band in (b12, b11, b8a, b04, b03, b02))
+
+    normalized = [normalize_band(band, dtype=dtype) for band in (b12, b11, b8a)]
+    normalized += [normalize_band(band, dtype=dtype, in_place=True) for band in (b04, b03, b02)]
+    outer_fire_mask, core_fire_mask = detection.fire_masks(*normalized, band_max)
+    del normalized
+
+    combined_region_opened = detection.prepare_regions(outer_fire_mask | core_fire_mask)
+    labels, regions = fire_regions.region_stats(combined_region_opened, b12, b11, down_scale_factor)
+
+    burn_index = detection.burn_index(b12, b11, b8a)
+    _, _, combined_edges_opened = detection.burnt_area_edges(burn_index)
+
+    masks = {
+        "outer fire": outer_fire_mask,
+        "core fire": core_fire_mask,
+        "regions": labels > 0,
+        "burnt area": combined_edges_opened,
+    }
+    return masks, len(regions), peak_memory() / 1024, time.time() - time_start
+
+def run(img: images.Image, down_scale_factor: int = 1):
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for precision in PRECISIONS:
+        with context.Pool(1) as pool:
+            results[precision] = pool.apply(detect, (img, precision, down_scale_factor))
+        _, amount_regions, peak_memory_mb, duration = results[precision]
+        print(f"{precision}: peak memory {peak_memory_mb:8.0f} MB, {duration:6.2f} s, {amount_regions} regions")
+
+    reference = results["float64"][0]
+    masks = results["float32"][0]
+    print(f"{'mask':>12} {'pixels (float64)':>17} {'differing':>10} {'share':>10} {'tolerance':>10} {'ok':>5}")
+    for name, tolerance in MASK_TOLERANCE.items():
+        differing = np.count_nonzero((reference[name] > 0) != (masks[name] > 0))
+        share = differing / reference[name].size
+        print(f"{name:>12} {np.count_nonzero(reference[name]):>17} {differing:>10} {share:>10.2e} {tolerance:>10.0e} {str(share <= tolerance):>5}")
+
+
+if __name__ == "__main__":
+    run(images.Flin_Flon, int(sys.argv[1]) if len(sys.argv) > 1 else 1)
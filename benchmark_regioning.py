@@ -0,0 +1,61 @@
+import time
+import numpy as np
+import cv2
+import sequential_regioning_cpp
+from sequential_regioning import sequential_regioning
+
+# Checks the C++ labeling against the pure Python reference and compares the run times.
+# Usage: python benchmark_regioning.py
+
+def synthetic_mask(size: int, density: float, seed: int = 0) -> np.ndarray:
+    # Blobs of different sizes, similar to the prepared fire mask
+    rng = np.random.default_rng(seed)
+    mask = (rng.random((size, size)) < density).astype(np.uint8)
+    return cv2.dilate(mask, np.ones((3, 3), np.uint8)).astype(np.uint16)
+
+def same_regions(labels: np.ndarray, amount_regions: int, colored: np.ndarray, reference_regions: int) -> bool:
+    """
+    Returns whether a label image describes the same regions as the colored image of the Python reference.
+    """
+    if amount_regions != reference_regions:
+        return False
+    foreground = labels > 0
+    if not np.array_equal(foreground, colored.any(axis=2)):
+        return False
+    # Every label has to map to exactly one color and every color to exactly one label
+    colors = colored[foreground].astype(np.int64)
+    color_ids = (colors[:, 0] << 32) | (colors[:, 1] << 16) | colors[:, 2]
+    pairs = np.unique(np.stack((labels[foreground], color_ids), axis=1), axis=0)
+    return len(pairs) == amount_regions == len(np.unique(pairs[:, 1]))
+
+def best_time(function, repeats: int = 3) -> float:
+    times = []
+    for _ in range(repeats):
+        time_start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - time_start)
+    return min(times)
+
+def check_equivalence(size: int = 150):
+    print(f"Equivalence with the Python reference ({size}x{size}):")
+    for density in (0.01, 0.1, 0.3):
+        mask = synthetic_mask(size, density)
+        colored, reference_regions = sequential_regioning(mask, n8=True)
+        for num_threads in (1, 4):
+            labels, amount_regions = sequential_regioning_cpp.label(mask, n8=True, num_threads=num_threads)
+            equal = same_regions(labels, amount_regions, colored, reference_regions)
+            print(f"  density {density:>5}, threads {num_threads}: {amount_regions:>5} regions, equal: {equal}")
+
+def run(size: int = 5490):
+    mask = synthetic_mask(size, 0.02)
+    print(f"Labeling {size}x{size}, best of 3:")
+    time_run = best_time(lambda: sequential_regioning_cpp.run(mask, n8=True))
+    print(f"  run (labels + colors):     {time_run * 1000:8.1f} ms")
+    for num_threads in (1, 2, 4, 0):
+        time_label = best_time(lambda: sequential_regioning_cpp.label(mask, n8=True, num_threads=num_threads))
+        print(f"  label, threads {num_threads}:          {time_label * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    check_equivalence()
+    run()
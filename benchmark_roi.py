@@ -0,0 +1,42 @@
+import os
+import sys
+import time
+import numpy as np
+import images
+from benchmark_suite import SCENE_DIR
+from pipeline import Pipeline
+from roi import detect_roi
+from synthetic_scene import write_scene
+
+# Compares the region of interest fire detection (roi.py) with the full scene: run time, the share of the scene
+# processed and the recall of the fire pixels and regions of the full scene.
+# Usage: python benchmark_roi.py [image name of images.py], without a name the synthetic scene of benchmark_suite.py
+# and a mostly fire-free one with a few small fires are used
+
+def run(img: images.Image):
+    time_start = time.perf_counter()
+    pipeline = Pipeline(img)
+    fire_mask = pipeline.get("fire_masks").final > 0
+    labels = pipeline.get("regions").labels
+    time_full = time.perf_counter() - time_start
+
+    time_start = time.perf_counter()
+    result = detect_roi(img)
+    time_roi = time.perf_counter() - time_start
+
+    roi_fire_mask = result.final_fire_mask > 0
+    found_pixels = np.count_nonzero(fire_mask & roi_fire_mask)
+    regions = np.unique(labels[labels > 0])
+    found_regions = np.unique(labels[(labels > 0) & (result.labeled_fire > 0)])
+    print(f"full scene:     {time_full:6.2f} s, {np.count_nonzero(fire_mask)} fire pixels, {len(regions)} regions")
+    print(f"roi:            {time_roi:6.2f} s, {len(result.windows)} windows, {result.processed_share:.1%} of the scene processed")
+    print(f"recall: fire pixels {found_pixels / max(np.count_nonzero(fire_mask), 1):.4f}, regions {len(found_regions) / max(len(regions), 1):.4f}, "
+          f"additional fire pixels {np.count_nonzero(roi_fire_mask & ~fire_mask)}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        run(getattr(images, sys.argv[1]))
+    else:
+        run(write_scene(os.path.join(SCENE_DIR, "5490_0"), 5490, 0))
+        run(write_scene(os.path.join(SCENE_DIR, "5490_0_sparse"), 5490, 0, burn_scars=0, small_fires=3))
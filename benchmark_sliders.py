@@ -0,0 +1,61 @@
+import time
+import numpy as np
+from scipy.ndimage import gaussian_filter
+import morphology
+from visualisation import ThresholdOverlay, _to_rgb8
+
+# Compares the incremental threshold overlay of the sliders with repainting the whole image for every
+# slider value (update_img in wildfire-detection.py), with one and with three bands.
+# Usage: python benchmark_sliders.py
+
+def repaint(bands, values, base_img, col=(0, 1, 0), dilate_size=0) -> np.ndarray:
+    # update_img for any amount of bands
+    mask = np.logical_and.reduce([band > value for band, value in zip(bands, values)])
+    if dilate_size > 0:
+        mask = morphology.dilate(mask.astype(np.uint8), dilate_size)
+    img = base_img.copy()
+    img[mask > 0] = col
+    return _to_rgb8(img)
+
+def synthetic_bands(size: int, amount: int, seed: int = 0):
+    # Smooth bands, so neighbouring pixels cross a threshold together like in a scene
+    rng = np.random.default_rng(seed)
+    bands = [gaussian_filter(rng.random((size, size)), 4).astype(np.float32) for _ in range(amount)]
+    bands = [(band - band.min()) / (band.max() - band.min()) for band in bands]
+    return bands, np.dstack(bands[:3] * (3 // amount)).clip(0, 1)
+
+def check_equivalence(size: int = 700):
+    rng = np.random.default_rng(0)
+    print(f"Difference to repainting ({size}x{size}):")
+    for amount, dilate_size in [(1, 0), (1, 50), (3, 0), (3, 7)]:
+        bands, base_img = synthetic_bands(size, amount)
+        overlay = ThresholdOverlay(bands, base_img, dilate_size=dilate_size)
+        differing = 0
+        for _ in range(20):
+            values = tuple(rng.uniform(0.3, 0.7) for _ in range(amount))
+            differing += np.count_nonzero(overlay(values) != repaint(bands, values, base_img, dilate_size=dilate_size))
+        print(f"  {amount} band(s), dilation {dilate_size:>2}: differing pixels {differing}")
+
+def run(size: int = 5490):
+    for amount in (1, 3):
+        bands, base_img = synthetic_bands(size, amount)
+        time_start = time.perf_counter()
+        overlay = ThresholdOverlay(bands, base_img)
+        print(f"{amount} band(s) {size}x{size}, sorting once: {(time.perf_counter() - time_start) * 1000:.0f} ms")
+        overlay((0.5,) * amount)
+        overlay.set_viewport(slice(0, 1000), slice(0, 1500))
+        for step in (0.001, 0.01, 0.1):
+            values = (0.5 + step,) * amount
+            time_start = time.perf_counter()
+            repaint(bands, values, base_img)
+            time_repaint = time.perf_counter() - time_start
+            time_start = time.perf_counter()
+            overlay(values)
+            time_overlay = time.perf_counter() - time_start
+            overlay((0.5,) * amount)
+            print(f"  threshold step {step:<5}: repaint {time_repaint * 1000:8.1f} ms, overlay {time_overlay * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    check_equivalence()
+    run()
@@ -0,0 +1,210 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, Optional, Sequence
+import numpy as np
+import detection
+import morphology
+import sequential_regioning_cpp
+from bands import get_bands, normalize_band
+from profiling import peak_memory, reset_peak_memory
+from sequential_regioning import sequential_regioning
+from synthetic_scene import write_scene
+
+# Run time and peak memory of the detection stages on a synthetic scene (synthetic_scene.py), compared with a stored
+# baseline. Every stage runs in a fresh process, its inputs are loaded from files before it is measured, the peak
+# memory of a stage is the growth of the peak resident memory of its process above the loaded inputs.
+# Usage: python benchmark_suite.py [--size 5490] [--save-baseline] [--baseline benchmark_baseline.json]
+#
+# The baseline keeps the results per scene size, the report flags stages that got slower or need more memory than
+# the tolerances allow. Baselines are only comparable on the same machine.
+
+SCENE_DIR = "images/synthetic"
+BASELINE_PATH = "benchmark_baseline.json"
+TIME_TOLERANCE = 0.2 # 20 % slower is a regression
+MEMORY_TOLERANCE = 0.1
+# Differences below these are noise, e.g. of stages that take a few milliseconds
+MIN_TIME_DIFFERENCE = 0.02 # s
+MIN_MEMORY_DIFFERENCE = 16 # MB
+# The pure Python labeling is benchmarked on a crop of the prepared fire mask, like the C++ labeling it's compared with
+REFERENCE_CROP = 256
+
+def _load(inputs_dir: str, *names: str):
+    return [np.load(os.path.join(inputs_dir, f"{name}.npy")) for name in names]
+
+def _stage_get_bands(inputs_dir: str, img):
+    return lambda: get_bands(img)
+
+def _stage_normalize(inputs_dir: str, img):
+    scene_bands = _load(inputs_dir, "b12", "b11", "b8a", "b04", "b03", "b02")
+    return lambda: [normalize_band(band) for band in scene_bands]
+
+def _stage_fire_masks(inputs_dir: str, img):
+    normalized = _load(inputs_dir, "b12_norm", "b11_norm", "b8a_norm", "b04_norm", "b03_norm", "b02_norm")
+    band_max = tuple(np.load(os.path.join(inputs_dir, "band_max.npy")))
+    return lambda: detection.fire_masks(*normalized, band_max)
+
+def _stage_prepare_regions(inputs_dir: str, img):
+    final_fire_mask, = _load(inputs_dir, "final_fire_mask")
+    return lambda: detection.prepare_regions(final_fire_mask)
+
+def _stage_regioning_cpp(inputs_dir: str, img):
+    prepared, = _load(inputs_dir, "prepared")
+    return lambda: sequential_regioning_cpp.run(prepared, n8=True)
+
+def _crop(prepared: np.ndarray) -> np.ndarray:
+    # The crop with the most fire pixels, the labeling has something to do
+    size = min(REFERENCE_CROP, *prepared.shape)
+    counts = [(np.count_nonzero(prepared[row:row + size, col:col + size]), row, col)
+              for row in range(0, prepared.shape[0] - size + 1, size) for col in range(0, prepared.shape[1] - size + 1, size)]
+    _, row, col = max(counts)
+    return np.ascontiguousarray(prepared[row:row + size, col:col + size])
+
+def _stage_regioning_crop_cpp(inputs_dir: str, img):
+    crop = _crop(*_load(inputs_dir, "prepared"))
+    return lambda: sequential_regioning_cpp.run(crop, n8=True)
+
+def _stage_regioning_crop_python(inputs_dir: str, img):
+    crop = _crop(*_load(inputs_dir, "prepared"))
+    return lambda: sequential_regioning(crop, n8=True)
+
+def _stage_dilate(inputs_dir: str, img):
+    final_fire_mask, = _load(inputs_dir, "final_fire_mask")
+    return lambda: morphology.dilate(final_fire_mask, detection.VISUAL_DILATION_SIZE)
+
+def _stage_burn_index(inputs_dir: str, img):
+    b12, b11, b8a = _load(inputs_dir, "b12", "b11", "b8a")
+    return lambda: detection.burn_index(b12, b11, b8a)
+
+def _stage_edges(inputs_dir: str, img):
+    burn_index, = _load(inputs_dir, "burn_index")
+    return lambda: detection.burnt_area_edges(burn_index)
+
+# name -> function preparing the inputs of the stage and returning the function that is measured
+STAGES: Dict[str, Callable] = {
+    "get_bands": _stage_get_bands,
+    "normalize": _stage_normalize,
+    "fire_masks": _stage_fire_masks,
+    "prepare_regions (morphology)": _stage_prepare_regions,
+    "sequential_regioning_cpp.run": _stage_regioning_cpp,
+    f"sequential_regioning_cpp.run ({REFERENCE_CROP} crop)": _stage_regioning_crop_cpp,
+    f"sequential_regioning ({REFERENCE_CROP} crop)": _stage_regioning_crop_python,
+    "dilate (morphology)": _stage_dilate,
+    "burn_index": _stage_burn_index,
+    "burnt_area_edges": _stage_edges,
+}
+
+def prepare_inputs(img, inputs_dir: str):
+    """
+    Runs the detection once and stores the inputs of the stages.
+    """
+    b12, b11, b8a, b04, b03, b02, _ = get_bands(img)
+    scene_bands = {"b12": b12, "b11": b11, "b8a": b8a, "b04": b04, "b03": b03, "b02": b02}
+    normalized = {f"{name}_norm": normalize_band(band) for name, band in scene_bands.items()}
+    band_max = np.array([band.max() for band in scene_bands.values()])
+    outer, core = detection.fire_masks(*normalized.values(), tuple(band_max))
+    final_fire_mask = outer | core
+    arrays = {**scene_bands, **normalized, "band_max": band_max, "final_fire_mask": final_fire_mask,
+              "prepared": detection.prepare_regions(final_fire_mask), "burn_index": detection.burn_index(b12, b11, b8a)}
+    for name, array in arrays.items():
+        np.save(os.path.join(inputs_dir, f"{name}.npy"), array)
+
+def measure(name: str, inputs_dir: str, img, repeats: int) -> dict:
+    """
+    Runs a stage repeats times in this process, returns the best time and the peak memory above the loaded inputs.
+    """
+    function = STAGES[name](inputs_dir, img)
+    memory_before = reset_peak_memory()
+    times = []
+    for _ in range(repeats):
+        time_start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - time_start)
+    return {"time_s": round(min(times), 4), "peak_memory_mb": round((peak_memory() - memory_before) / 1024, 1)}
+
+def run_stages(img, repeats: int = 3, stages: Optional[Sequence[str]] = None) -> Dict[str, dict]:
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as inputs_dir:
+        with context.Pool(1) as pool:
+            pool.apply(prepare_inputs, (img, inputs_dir))
+        for name in stages or STAGES:
+            with context.Pool(1) as pool:
+                results[name] = pool.apply(measure, (name, inputs_dir, img, repeats))
+            print(f"  {name:<40} {results[name]['time_s']:9.3f} s {results[name]['peak_memory_mb']:9.1f} MB")
+    return results
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], time_tolerance: float = TIME_TOLERANCE,
+            memory_tolerance: float = MEMORY_TOLERANCE) -> int:
+    """
+    Prints the comparison with the baseline, returns the amount of regressions.
+    """
+    regressions = 0
+    print(f"{'stage':<40} {'time':>9} {'baseline':>9} {'change':>8} {'memory':>9} {'baseline':>9} {'change':>8}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<40} {result['time_s']:9.3f} {'-':>9} {'':>8} {result['peak_memory_mb']:9.1f} {'-':>9}")
+            continue
+        time_change = result["time_s"] / base["time_s"] - 1 if base["time_s"] > 0 else 0.0
+        memory_change = result["peak_memory_mb"] / base["peak_memory_mb"] - 1 if base["peak_memory_mb"] > 0 else 0.0
+        slower = time_change > time_tolerance and result["time_s"] - base["time_s"] > MIN_TIME_DIFFERENCE
+        larger = memory_change > memory_tolerance and result["peak_memory_mb"] - base["peak_memory_mb"] > MIN_MEMORY_DIFFERENCE
+        flags = " ".join(flag for flag, regressed in (("SLOWER", slower), ("MORE MEMORY", larger)) if regressed)
+        regressions += bool(flags)
+        print(f"{name:<40} {result['time_s']:9.3f} {base['time_s']:9.3f} {time_change:+8.1%} "
+              f"{result['peak_memory_mb']:9.1f} {base['peak_memory_mb']:9.1f} {memory_change:+8.1%} {flags}")
+    print(f"{regressions} regressions" if regressions else "No regressions")
+    return regressions
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks the detection stages on a synthetic scene.")
+    parser.add_argument("--size", type=int, default=5490, help="width and height of the synthetic scene")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=3, help="runs per stage, the best time is kept")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), help="only these stages")
+    parser.add_argument("--scene-dir", default=SCENE_DIR, help="directory of the synthetic scene, it's reused if it exists")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the baseline of this size")
+    parser.add_argument("--time-tolerance", type=float, default=TIME_TOLERANCE)
+    parser.add_argument("--memory-tolerance", type=float, default=MEMORY_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    img = write_scene(os.path.join(args.scene_dir, f"{args.size}_{args.seed}"), args.size, args.seed)
+    print(f"Synthetic scene {args.size}x{args.size} (seed {args.seed}), best of {args.repeats}:")
+    results = run_stages(img, args.repeats, args.stages)
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+    key = f"{args.size}_{args.seed}"
+    if args.save_baseline:
+        stored = baselines.get(key, {}).get("stages", {}) if args.stages else {}
+        baselines[key] = {"commit": _commit(), "machine": platform.platform(), "cpus": os.cpu_count(), "stages": {**stored, **results}}
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if key not in baselines:
+        print(f"No baseline for {key} in {args.baseline}, store one with --save-baseline")
+        return 0
+    print(f"Compared with the baseline of commit {baselines[key]['commit']} ({baselines[key]['machine']}):")
+    return 1 if compare(results, baselines[key]["stages"], args.time_tolerance, args.memory_tolerance) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,307 @@
+#include <pybind11/pybind11.h>
+#include <pybind11/numpy.h>
+#include <vector>
+#include <cstdint>
+#include <cstring>
+#include <stdexcept>
+#include <initializer_list>
+
+namespace py = pybind11;
+
+// Binary morphology with rectangular structuring elements on bit-packed rows.
+// Every row is packed into 64 bit words (bit b of word i is pixel 64 * i + b), so one operation
+// handles 64 pixels at once. The horizontal pass combines shifted copies of a row (doubling the
+// window size each step), the vertical pass uses the van Herk/Gil-Werman algorithm. Both only need
+// O(log(kernel width) + 3) word operations per 64 pixels, regardless of the kernel size.
+// The kernel anchor and the border handling are the same as in OpenCV (anchor at kernel_size / 2,
+// pixels outside of the image neither dilate nor erode).
+
+using Word = uint64_t;
+constexpr int WORD_BITS = 64;
+
+struct PackedImage
+{
+    py::ssize_t height;
+    py::ssize_t width;
+    py::ssize_t words_per_row;
+    std::vector<Word> words;
+
+    PackedImage(py::ssize_t height, py::ssize_t width)
+        : height(height), width(width), words_per_row((width + WORD_BITS - 1) / WORD_BITS),
+          words(height * words_per_row, 0) {}
+
+    Word *row(py::ssize_t v) { return words.data() + v * words_per_row; }
+
+    // Bits behind the last pixel of a row have to stay 0, they represent the outside of the image
+    Word tail_mask() const
+    {
+        int used_bits = width % WORD_BITS;
+        return used_bits == 0 ? ~Word(0) : (Word(1) << used_bits) - 1;
+    }
+};
+
+// Moves the bits of all 8 bytes of v to their lowest bit (any non-zero byte becomes 1)
+static inline Word bytes_to_bits(Word v)
+{
+    v |= v >> 4;
+    v |= v >> 2;
+    v |= v >> 1;
+    v &= 0x0101010101010101ULL;
+    // Gathers the lowest bit of byte i into bit i
+    return (v * 0x0102040810204080ULL) >> 56;
+}
+
+// Inverts the image in place, the bits behind the last pixel of a row stay 0
+static void invert_packed(PackedImage &packed)
+{
+    const Word tail_mask = packed.tail_mask();
+    for (py::ssize_t v = 0; v < packed.height; ++v)
+    {
+        Word *row = packed.row(v);
+        for (py::ssize_t i = 0; i < packed.words_per_row; ++i)
+            row[i] = ~row[i];
+        row[packed.words_per_row - 1] &= tail_mask;
+    }
+}
+
+static PackedImage pack(const uint8_t *img, py::ssize_t height, py::ssize_t width, bool invert)
+{
+    PackedImage packed(height, width);
+    for (py::ssize_t v = 0; v < height; ++v)
+    {
+        const uint8_t *src = img + v * width;
+        Word *dst = packed.row(v);
+        py::ssize_t u = 0;
+        for (; u + 8 <= width; u += 8)
+        {
+            Word bytes;
+            std::memcpy(&bytes, src + u, sizeof(bytes));
+            dst[u / WORD_BITS] |= bytes_to_bits(bytes) << (u % WORD_BITS);
+        }
+        for (; u < width; ++u)
+        {
+            dst[u / WORD_BITS] |= Word(src[u] != 0) << (u % WORD_BITS);
+        }
+    }
+    if (invert)
+        invert_packed(packed);
+    return packed;
+}
+
+static void unpack(PackedImage &packed, uint8_t *img, bool invert)
+{
+    // Lookup table from 8 bits to 8 bytes of 0 / 1
+    Word byte_table[256];
+    for (int b = 0; b < 256; ++b)
+    {
+        Word bytes = 0;
+        for (int i = 0; i < 8; ++i)
+            bytes |= Word((b >> i) & 1) << (8 * i);
+        byte_table[b] = bytes;
+    }
+
+    const py::ssize_t width = packed.width;
+    for (py::ssize_t v = 0; v < packed.height; ++v)
+    {
+        const Word *src = packed.row(v);
+        uint8_t *dst = img + v * width;
+        py::ssize_t u = 0;
+        for (; u + 8 <= width; u += 8)
+        {
+            Word bits = (src[u / WORD_BITS] >> (u % WORD_BITS)) & 0xFF;
+            if (invert)
+                bits ^= 0xFF;
+            std::memcpy(dst + u, &byte_table[bits], sizeof(Word));
+        }
+        for (; u < width; ++u)
+        {
+            bool bit = (src[u / WORD_BITS] >> (u % WORD_BITS)) & 1;
+            dst[u] = bit != invert;
+        }
+    }
+}
+
+// dst gets the bits of src at position x + shift (shift > 0 looks right, shift < 0 looks left)
+static void shift_row(const Word *src, Word *dst, py::ssize_t n, py::ssize_t shift)
+{
+    const py::ssize_t word_shift = (shift >= 0 ? shift : -shift) / WORD_BITS;
+    const int bit_shift = static_cast<int>((shift >= 0 ? shift : -shift) % WORD_BITS);
+    auto word = [&](py::ssize_t i) -> Word { return (i >= 0 && i < n) ? src[i] : 0; };
+
+    for (py::ssize_t i = 0; i < n; ++i)
+    {
+        if (shift >= 0)
+        {
+            Word low = word(i + word_shift);
+            Word high = word(i + word_shift + 1);
+            dst[i] = bit_shift == 0 ? low : (low >> bit_shift) | (high << (WORD_BITS - bit_shift));
+        }
+        else
+        {
+            Word high = word(i - word_shift);
+            Word low = word(i - word_shift - 1);
+            dst[i] = bit_shift == 0 ? high : (high << bit_shift) | (low >> (WORD_BITS - bit_shift));
+        }
+    }
+}
+
+// Every pixel becomes the OR of the pixels [x - anchor, x - anchor + kernel_width - 1] of its row
+static void dilate_rows(PackedImage &packed, int kernel_width)
+{
+    const py::ssize_t n = packed.words_per_row;
+    const Word tail_mask = packed.tail_mask();
+    // The windows reach up to kernel_width pixels behind the row, so the buffers are extended by that
+    const py::ssize_t extended = (packed.width + kernel_width + WORD_BITS - 1) / WORD_BITS;
+    std::vector<Word> row_buffer(extended, 0), window(extended), shifted(extended);
+
+    for (py::ssize_t v = 0; v < packed.height; ++v)
+    {
+        Word *row = packed.row(v);
+
+        // window(x) starts as row[x - anchor]
+        std::copy(row, row + n, row_buffer.begin());
+        shift_row(row_buffer.data(), window.data(), extended, -(kernel_width / 2));
+
+        // window(x) = OR of row[x - anchor .. x - anchor + covered - 1], doubling covered up to the kernel width
+        int covered = 1;
+        while (covered * 2 <= kernel_width)
+        {
+            shift_row(window.data(), shifted.data(), extended, covered);
+            for (py::ssize_t i = 0; i < extended; ++i)
+                window[i] |= shifted[i];
+            covered *= 2;
+        }
+        if (covered < kernel_width)
+        {
+            // Two overlapping windows of size covered make up the full kernel width
+            shift_row(window.data(), shifted.data(), extended, kernel_width - covered);
+            for (py::ssize_t i = 0; i < extended; ++i)
+                window[i] |= shifted[i];
+        }
+
+        std::copy(window.begin(), window.begin() + n, row);
+        row[n - 1] &= tail_mask;
+    }
+}
+
+// Every pixel becomes the OR of the rows [y - anchor, y - anchor + kernel_height - 1] (van Herk/Gil-Werman)
+static void dilate_columns(PackedImage &packed, int kernel_height)
+{
+    const py::ssize_t n = packed.words_per_row;
+    const py::ssize_t height = packed.height;
+    const py::ssize_t anchor = kernel_height / 2;
+    const py::ssize_t padded_height = height + kernel_height - 1;
+
+    // Padded row j is image row j - anchor, rows outside of the image are 0
+    auto padded_row = [&](py::ssize_t j) -> const Word * {
+        py::ssize_t v = j - anchor;
+        return (v >= 0 && v < height) ? packed.row(v) : nullptr;
+    };
+
+    // prefix: OR from the start of the block of kernel_height rows, suffix: OR up to the end of the block
+    std::vector<Word> prefix(padded_height * n), suffix(padded_height * n);
+    for (py::ssize_t j = 0; j < padded_height; ++j)
+    {
+        const Word *src = padded_row(j);
+        Word *dst = prefix.data() + j * n;
+        const Word *previous = (j % kernel_height != 0) ? dst - n : nullptr;
+        for (py::ssize_t i = 0; i < n; ++i)
+            dst[i] = (src ? src[i] : 0) | (previous ? previous[i] : 0);
+    }
+    for (py::ssize_t j = padded_height - 1; j >= 0; --j)
+    {
+        const Word *src = padded_row(j);
+        Word *dst = suffix.data() + j * n;
+        const Word *next = (j % kernel_height != kernel_height - 1 && j + 1 < padded_height) ? dst + n : nullptr;
+        for (py::ssize_t i = 0; i < n; ++i)
+            dst[i] = (src ? src[i] : 0) | (next ? next[i] : 0);
+    }
+
+    for (py::ssize_t v = 0; v < height; ++v)
+    {
+        const Word *s = suffix.data() + v * n;
+        const Word *p = prefix.data() + (v + kernel_height - 1) * n;
+        Word *dst = packed.row(v);
+        for (py::ssize_t i = 0; i < n; ++i)
+            dst[i] = s[i] | p[i];
+    }
+}
+
+static void dilate_packed(PackedImage &packed, int kernel_height, int kernel_width)
+{
+    if (kernel_width > 1)
+        dilate_rows(packed, kernel_width);
+    if (kernel_height > 1)
+        dilate_columns(packed, kernel_height);
+}
+
+using Mask = py::array_t<uint8_t, py::array::c_style | py::array::forcecast>;
+
+// Erosion is the dilation of the background, the outside of the image counts as foreground then.
+// operations is a sequence of dilations (false) and erosions (true), the image stays packed in between.
+static Mask morphology(Mask img_py, int kernel_height, int kernel_width, std::initializer_list<bool> operations)
+{
+    py::buffer_info buf = img_py.request();
+    if (buf.ndim != 2)
+        throw std::runtime_error("Input image must be 2-dimensional.");
+    if (kernel_height < 1 || kernel_width < 1)
+        throw std::runtime_error("Kernel size must be positive.");
+
+    const py::ssize_t height = buf.shape[0];
+    const py::ssize_t width = buf.shape[1];
+    Mask out_py({height, width});
+    if (height == 0 || width == 0)
+        return out_py;
+
+    const uint8_t *src = static_cast<const uint8_t *>(buf.ptr);
+    uint8_t *dst = static_cast<uint8_t *>(out_py.request().ptr);
+    {
+        py::gil_scoped_release release;
+        bool inverted = *operations.begin();
+        PackedImage packed = pack(src, height, width, inverted);
+        for (bool erode : operations)
+        {
+            if (erode != inverted)
+            {
+                invert_packed(packed);
+                inverted = erode;
+            }
+            dilate_packed(packed, kernel_height, kernel_width);
+        }
+        unpack(packed, dst, inverted);
+    }
+    return out_py;
+}
+
+static Mask dilate_mask(Mask img, int kernel_height, int kernel_width)
+{
+    return morphology(img, kernel_height, kernel_width, {false});
+}
+
+static Mask erode_mask(Mask img, int kernel_height, int kernel_width)
+{
+    return morphology(img, kernel_height, kernel_width, {true});
+}
+
+static Mask close_mask(Mask img, int kernel_height, int kernel_width)
+{
+    return morphology(img, kernel_height, kernel_width, {false, true});
+}
+
+static Mask open_mask(Mask img, int kernel_height, int kernel_width)
+{
+    return morphology(img, kernel_height, kernel_width, {true, false});
+}
+
+PYBIND11_MODULE(binary_morphology_cpp, m)
+{
+    m.doc() = "Binary morphology with rectangular kernels whose cost doesn't depend on the kernel size.";
+    m.def("dilate", &dilate_mask, "Dilates a binary 2D numpy array (non-zero is foreground) with a rectangular kernel.",
+          py::arg("img"), py::arg("kernel_height"), py::arg("kernel_width"));
+    m.def("erode", &erode_mask, "Erodes a binary 2D numpy array (non-zero is foreground) with a rectangular kernel.",
+          py::arg("img"), py::arg("kernel_height"), py::arg("kernel_width"));
+    m.def("close", &close_mask, "Closes (dilation, then erosion) a binary 2D numpy array with a rectangular kernel.",
+          py::arg("img"), py::arg("kernel_height"), py::arg("kernel_width"));
+    m.def("open", &open_mask, "Opens (erosion, then dilation) a binary 2D numpy array with a rectangular kernel.",
+          py::arg("img"), py::arg("kernel_height"), py::arg("kernel_width"));
+}
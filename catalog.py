@@ -0,0 +1,239 @@
+import glob
+import os
+import re
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+import rasterio
+from rasterio.warp import transform_bounds
+import images
+
+# Persistent index of the scenes below a root directory, stored as SQLite database (<root>/catalog.sqlite).
+# A scene is a directory with the infrared and color folders (like the images folder) or a zipped SAFE product.
+# The tile and sensing time are parsed from the band names (T10TEK_20240725T185921), the band paths, the raster
+# shape, the CRS and the bounds from the headers of the bands. refresh() only reads the scenes whose files changed
+# (modification time and size), so a scan of thousands of unchanged scenes only stats their files.
+#
+#     with Catalog("images") as catalog:
+#         catalog.refresh()
+#         for scene in catalog.find(tile="10TEK", start=datetime(2024, 7, 1), bbox=(-122, 39, -121, 40)):
+#             bands = get_bands(scene.image)
+
+CATALOG_FILE = "catalog.sqlite"
+SCENE_NAME = re.compile(r"T(\d{2}[A-Z]{3})_(\d{8}T\d{6})")
+# Zipped Sentinel-2 L2A products as downloaded from Copernicus
+SAFE_ZIP_PATTERN = "*MSIL2A*.zip"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scenes (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL, -- directory or zip file of the scene
+    prefix TEXT NOT NULL,
+    tile TEXT NOT NULL,
+    sensing_time TEXT NOT NULL, -- ISO 8601, UTC
+    band_paths TEXT NOT NULL, -- B12, B11, B8A, B04, B03, B02 and the cloud mask, one per line
+    has_cloud_mask INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    width INTEGER NOT NULL,
+    crs TEXT,
+    bounds TEXT NOT NULL, -- left, bottom, right, top in the CRS of the bands
+    size_bytes INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL, -- latest modification of the band files
+    UNIQUE (source, prefix)
+);
+CREATE INDEX IF NOT EXISTS scenes_tile_time ON scenes (tile, sensing_time);
+CREATE INDEX IF NOT EXISTS scenes_time ON scenes (sensing_time);
+CREATE VIRTUAL TABLE IF NOT EXISTS scenes_bounds USING rtree (id, min_lon, max_lon, min_lat, max_lat);
+"""
+
+@dataclass
+class CatalogScene:
+    name: str # the tile and sensing time, e.g. T10TEK_20240725T185921
+    tile: str # MGRS tile, e.g. 10TEK
+    sensing_time: datetime
+    source: str
+    band_paths: Tuple[str, ...]
+    has_cloud_mask: bool
+    shape: Tuple[int, int]
+    crs: Optional[str]
+    bounds: Tuple[float, float, float, float] # left, bottom, right, top in the CRS of the bands
+    size_bytes: int
+
+    @property
+    def image(self) -> images.Image:
+        return images.Image(self.source, self.name, band_paths=self.band_paths, has_cloud_mask=self.has_cloud_mask)
+
+def parse_scene_name(name: str) -> Tuple[str, datetime]:
+    """
+    Returns the MGRS tile and the sensing time of a scene name like T10TEK_20240725T185921.
+    """
+    match = SCENE_NAME.fullmatch(name)
+    if match is None:
+        raise ValueError(f"'{name}' is not a scene name like T10TEK_20240725T185921")
+    return match.group(1), datetime.strptime(match.group(2), "%Y%m%dT%H%M%S")
+
+def _iso(time: datetime) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S")
+
+def _scan(root: str) -> List[str]:
+    # The band folders and zipped products below root, without reading any band
+    b12_paths = glob.glob(os.path.join(root, "**", "infrared", "*_B12_20m.jp2"), recursive=True)
+    zips = glob.glob(os.path.join(root, "**", SAFE_ZIP_PATTERN), recursive=True)
+    return sorted(set(b12_paths) | set(zips))
+
+def _signature(paths: Sequence[str]) -> Tuple[int, int]:
+    # Latest modification time and total size of the files of a scene, a missing file raises OSError
+    stats = [os.stat(path) for path in paths]
+    return max(stat.st_mtime_ns for stat in stats), sum(stat.st_size for stat in stats)
+
+def _scene_files(found: str) -> Tuple[images.Image, List[str]]:
+    # The image of a scan result and the files that define its signature
+    if images.is_safe_zip(found):
+        return images.from_safe_zip(found), [found]
+    img = images.Image(os.path.dirname(os.path.dirname(found)), os.path.basename(found)[:-len("_B12_20m.jp2")])
+    paths = images.get_band_paths(img)
+    return img, [path for path in paths if os.path.exists(path)]
+
+class Catalog:
+    def __init__(self, root: str = "images", path: Optional[str] = None):
+        self.root = os.path.abspath(root)
+        self.path = path or os.path.join(self.root, CATALOG_FILE)
+        self._connection = sqlite3.connect(self.path)
+        self._connection.executescript(SCHEMA)
+
+    def refresh(self, verbose: bool = False) -> Tuple[int, int, int]:
+        """
+        Scans the root directory and updates the index, returns the amount of added, updated and removed scenes.
+        Only scenes whose files changed since the last refresh are read.
+        """
+        # Scenes of other roots sharing the database are kept
+        known = {(source, prefix): (mtime_ns, size, band_paths.split("\n")) for source, prefix, mtime_ns, size, band_paths in
+                 self._connection.execute("SELECT source, prefix, mtime_ns, size_bytes, band_paths FROM scenes")
+                 if source == self.root or source.startswith(self.root + os.sep)}
+        # A zipped product is one scene, its prefix is only known once the archive is opened
+        zips = {source: (source, prefix) for source, prefix in known if images.is_safe_zip(source)}
+        added = updated = 0
+        seen = set()
+        for found in _scan(self.root):
+            if images.is_safe_zip(found):
+                key = zips.get(found)
+            else:
+                key = (os.path.dirname(os.path.dirname(found)), os.path.basename(found)[:-len("_B12_20m.jp2")])
+            try:
+                if key in known:
+                    # Unchanged scenes are only stated, a cloud mask added later changes the signature as well
+                    files = [key[0]] if images.is_safe_zip(key[0]) else [path for path in known[key][2] if os.path.exists(path)]
+                    if _signature(files) == known[key][:2]:
+                        seen.add(key)
+                        continue
+                img, files = _scene_files(found)
+                self._insert(img, *_signature(files))
+            except (OSError, ValueError, rasterio.errors.RasterioError) as error:
+                if verbose:
+                    print(f"Skipping {found}: {error}")
+                continue
+            seen.add((img.directory, img.file_name_prefix))
+            if key in known:
+                updated += 1
+            else:
+                added += 1
+
+        removed = [key for key in known if key not in seen]
+        for source, prefix in removed:
+            self._delete(source, prefix)
+        self._connection.commit()
+        return added, updated, len(removed)
+
+    def _delete(self, source: str, prefix: str):
+        for (scene_id,) in self._connection.execute("SELECT id FROM scenes WHERE source = ? AND prefix = ?", (source, prefix)).fetchall():
+            self._connection.execute("DELETE FROM scenes WHERE id = ?", (scene_id,))
+            self._connection.execute("DELETE FROM scenes_bounds WHERE id = ?", (scene_id,))
+
+    def _insert(self, img: images.Image, mtime_ns: int, size: int):
+        tile, sensing_time = parse_scene_name(img.file_name_prefix)
+        paths = images.get_band_paths(img)
+        has_cloud_mask = images.band_exists(paths[6])
+        # Only the header of B12 is read
+        with rasterio.open(paths[0]) as src:
+            height, width, crs, bounds = src.height, src.width, src.crs, tuple(src.bounds)
+        lonlat = transform_bounds(crs, "EPSG:4326", *bounds) if crs is not None else bounds
+
+        source = img.directory
+        self._delete(source, img.file_name_prefix)
+        cursor = self._connection.execute(
+            "INSERT INTO scenes (source, prefix, tile, sensing_time, band_paths, has_cloud_mask, height, width, crs, bounds, size_bytes, mtime_ns) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (source, img.file_name_prefix, tile, _iso(sensing_time), "\n".join(paths), has_cloud_mask, height, width,
+             crs.to_string() if crs is not None else None, ",".join(map(repr, bounds)), size, mtime_ns),
+        )
+        self._connection.execute("INSERT INTO scenes_bounds VALUES (?, ?, ?, ?, ?)", (cursor.lastrowid, lonlat[0], lonlat[2], lonlat[1], lonlat[3]))
+
+    def find(self, tile: Optional[str] = None, start: Optional[datetime] = None, end: Optional[datetime] = None,
+             bbox: Optional[Tuple[float, float, float, float]] = None, name: Optional[str] = None) -> List[CatalogScene]:
+        """
+        Returns the scenes of a MGRS tile (10TEK or T10TEK), sensed in [start, end] and intersecting the bounding box
+        (min_lon, min_lat, max_lon, max_lat), ordered by the sensing time. Criteria that are None aren't checked.
+        """
+        conditions, parameters = [], []
+        if name is not None:
+            conditions.append("prefix = ?")
+            parameters.append(name)
+        if tile is not None:
+            conditions.append("tile = ?")
+            parameters.append(tile.upper().removeprefix("T"))
+        if start is not None:
+            conditions.append("sensing_time >= ?")
+            parameters.append(_iso(start))
+        if end is not None:
+            conditions.append("sensing_time <= ?")
+            parameters.append(_iso(end))
+        if bbox is not None:
+            conditions.append("id IN (SELECT id FROM scenes_bounds WHERE max_lon >= ? AND min_lon <= ? AND max_lat >= ? AND min_lat <= ?)")
+            parameters += [bbox[0], bbox[2], bbox[1], bbox[3]]
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self._connection.execute(
+            "SELECT prefix, tile, sensing_time, source, band_paths, has_cloud_mask, height, width, crs, bounds, size_bytes "
+            f"FROM scenes {where} ORDER BY sensing_time, prefix", parameters)
+        return [CatalogScene(
+            name=prefix, tile=tile, sensing_time=datetime.fromisoformat(sensing_time), source=source,
+            band_paths=tuple(band_paths.split("\n")), has_cloud_mask=bool(has_cloud_mask), shape=(height, width), crs=crs,
+            bounds=tuple(float(value) for value in bounds.split(",")), size_bytes=size_bytes,
+        ) for prefix, tile, sensing_time, source, band_paths, has_cloud_mask, height, width, crs, bounds, size_bytes in rows]
+
+    def scene(self, name: str) -> CatalogScene:
+        """
+        Returns the scene with the given name, e.g. catalog.scene("T10TEK_20240725T185921").image
+        """
+        scenes = self.find(name=name)
+        if not scenes:
+            raise KeyError(f"Scene {name} is not in the catalog of {self.root}")
+        return scenes[0]
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def resolve(scene, root: str = "images", refresh: bool = False) -> images.Image:
+    """
+    Returns the image of a scene given as images.Image, as name of an image in images.py (e.g. Flin_Flon)
+    or as scene name (e.g. T13UFA_20250602T175931), which is looked up in the catalog of root.
+    The catalog is only refreshed if the scene isn't in it yet or with refresh=True.
+    """
+    if isinstance(scene, images.Image):
+        return scene
+    if isinstance(getattr(images, scene, None), images.Image):
+        return getattr(images, scene)
+    with Catalog(root) as catalog:
+        if not refresh:
+            try:
+                return catalog.scene(scene).image
+            except KeyError:
+                pass
+        catalog.refresh()
+        return catalog.scene(scene).image
@@ -0,0 +1,110 @@
+import os
+from typing import Optional, Tuple
+import numpy as np
+import rasterio
+import rasterio.shutil
+from rasterio.transform import Affine
+from rasterio.windows import Window
+
+# Writes the results as Cloud-Optimized GeoTIFFs (internally tiled, compressed, with overviews).
+# The windows are written to a tiled GeoTIFF next to the output as they are produced, GDAL then copies it
+# block by block into the COG layout and computes the overviews, so the full raster is never held in memory.
+#
+# Binary masks are written as uint8 with 255 for set pixels (like GDAL mask bands) and averaged overviews,
+# so a single fire pixel stays visible in the overviews, labels use nearest overviews.
+
+BLOCK_SIZE = 512
+MASK_VALUE = 255
+
+class CogWriter:
+    """
+    Streaming writer of one COG band, the raster is complete once the writer is closed:
+
+        with CogWriter("fire.tif", shape, np.uint8, transform, crs, mask=True) as writer:
+            for tile, fire in tiles:
+                writer.write(fire, tile.row, tile.col)
+    """
+
+    def __init__(self, path: str, shape: Tuple[int, int], dtype, transform: Affine, crs, mask: bool = False,
+                 overview_resampling: Optional[str] = None, nodata: Optional[float] = None):
+        self.path = path
+        self.mask = mask
+        self.dtype = np.dtype(np.uint8 if mask else dtype)
+        floating = np.issubdtype(self.dtype, np.floating)
+        if overview_resampling is None:
+            overview_resampling = "average" if mask or floating else "nearest"
+        self.cog_options = {
+            "compress": "deflate",
+            "predictor": 3 if floating else 2,
+            "blocksize": BLOCK_SIZE,
+            "overview_resampling": overview_resampling,
+            "bigtiff": "if_safer",
+        }
+        self._temp_path = path + ".part.tif"
+        # Uncompressed and sparse, the windows are only compressed once, in the COG
+        self._dataset = rasterio.open(
+            self._temp_path, "w", driver="GTiff", width=shape[1], height=shape[0], count=1, dtype=self.dtype,
+            transform=transform, crs=crs, nodata=nodata, tiled=True, blockxsize=BLOCK_SIZE, blockysize=BLOCK_SIZE,
+            sparse_ok=True, bigtiff="if_safer",
+        )
+
+    def write(self, array: np.ndarray, row: int = 0, col: int = 0):
+        """
+        Writes the array at the given position of the raster.
+        """
+        if self.mask:
+            array = np.where(array > 0, np.uint8(MASK_VALUE), np.uint8(0))
+        self._dataset.write(array.astype(self.dtype, copy=False), 1, window=Window(col, row, array.shape[1], array.shape[0]))
+
+    def close(self):
+        self._dataset.close()
+        try:
+            rasterio.shutil.copy(self._temp_path, self.path, driver="COG", **self.cog_options)
+        finally:
+            os.remove(self._temp_path)
+
+    def abort(self):
+        # Removes the partial raster, the output isn't created
+        self._dataset.close()
+        os.remove(self._temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+def write_cog(path: str, array: np.ndarray, transform: Affine, crs, dtype=None, mask: bool = False, **options):
+    """
+    Writes an array that is already in memory as COG, in strips of blocks, so only one strip is converted at once.
+    """
+    with CogWriter(path, array.shape, dtype or array.dtype, transform, crs, mask=mask, **options) as writer:
+        for row in range(0, array.shape[0], BLOCK_SIZE):
+            writer.write(array[row:row + BLOCK_SIZE], row, 0)
+
+# The detection results written by main and batch.py: name -> (dtype, binary mask)
+RESULTS = {
+    "fire": (np.uint8, True), # final fire mask
+    "labels": (np.int32, False), # fire regions, 0 is background
+    "burn_index": (np.float32, False),
+    "burnt_area": (np.uint8, True), # combined edges, opened
+}
+
+def result_path(output_dir: str, name: str) -> str:
+    return os.path.join(output_dir, f"{name}.tif")
+
+def result_writer(output_dir: str, name: str, shape: Tuple[int, int], transform: Affine, crs) -> CogWriter:
+    dtype, mask = RESULTS[name]
+    return CogWriter(result_path(output_dir, name), shape, dtype, transform, crs, mask=mask)
+
+def write_results(output_dir: str, transform: Affine, crs, **results: np.ndarray):
+    """
+    Writes the given results (see RESULTS) of a detection that is in memory, e.g. write_results(dir, transform, crs, fire=mask).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    for name, array in results.items():
+        dtype, mask = RESULTS[name]
+        write_cog(result_path(output_dir, name), array, transform, crs, dtype=dtype, mask=mask)
@@ -0,0 +1,264 @@
+from dataclasses import dataclass
+from typing import Optional, Tuple
+import numpy as np
+import cv2
+import morphology
+import fire_detection_cpp
+import edge_detection_cpp
+
+# Sizes of the structuring elements used in the pipeline
+FIRE_CLOSING_SIZE = 135 # enlarges the detection radius for the core fire
+VISUAL_DILATION_SIZE = 50 # only used to make small fires visible in the plots
+EDGE_AREA_DILATION_SIZE = 200 # limits the detection radius of sobel around canny edges
+KERNEL_MEDIUM_SIZE = 7
+KERNEL_SMALL_SIZE = 2
+
+EDGE_SIGMA = 2.0 # sigma of the gaussian smoothing before sobel and canny
+GAUSSIAN_TRUNCATE = 4.0 # scipy default, defines the radius of the gaussian kernel
+
+PIXEL_AREA = 400 # Every pixel covers 20m x 20m
+
+@dataclass
+class EdgeThresholds:
+    """
+    Global statistics of the sobel magnitude that the edge detection thresholds depend on.
+    Percentiles are given relative to the normalized (0-1) sobel magnitude.
+    """
+    sobel_min: float
+    sobel_max: float
+    sobel_threshold: float # 98th percentile
+    canny_low: float # 90th percentile
+    canny_high: float # 95th percentile
+
+def _kernel_radius(size: int) -> int:
+    # OpenCV anchors a kernel of size n at n // 2, so it reaches n // 2 pixels to one side at most
+    return size // 2
+
+def fire_halo() -> int:
+    """
+    Returns the amount of pixels the fire detection and the regioning preparation look past a pixel.
+    """
+    closing = 2 * _kernel_radius(FIRE_CLOSING_SIZE)
+    region_closing = 2 * _kernel_radius(KERNEL_MEDIUM_SIZE)
+    region_opening = 2 * _kernel_radius(KERNEL_SMALL_SIZE)
+    return closing + region_closing + region_opening
+
+def smoothing_halo() -> int:
+    """
+    Returns the amount of pixels the gaussian smoothing plus sobel look past a pixel.
+    """
+    return int(GAUSSIAN_TRUNCATE * EDGE_SIGMA + 0.5) + 1
+
+def edge_halo() -> int:
+    """
+    Returns the amount of pixels the burnt area edge detection looks past a pixel.
+    The hysteresis of canny is not local, its reach is approximated by the area dilation.
+    """
+    canny_reach = smoothing_halo() + 1 # non-maximum suppression looks at the direct neighbours
+    dilations = _kernel_radius(KERNEL_MEDIUM_SIZE) + _kernel_radius(EDGE_AREA_DILATION_SIZE)
+    closing = 2 * _kernel_radius(KERNEL_MEDIUM_SIZE)
+    opening = 2 * _kernel_radius(KERNEL_SMALL_SIZE)
+    return canny_reach + dilations + closing + opening
+
+def pipeline_halo() -> int:
+    """
+    Returns the overlap a tile needs so that its core is processed exactly like the full scene.
+    """
+    return max(fire_halo(), edge_halo())
+
+
+# 1. Fire-detection
+
+def fire_masks(b12_norm, b11_norm, b8a_norm, b04_norm, b03_norm, b02_norm, band_max, num_threads: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the outer and the core fire mask (uint8) for the normalized bands.
+    band_max are the maxima of the scaled bands (B12, B11, B8A, B04, B03, B02) of the whole scene.
+    The pixel thresholds are evaluated in one pass by the C++ kernel in fire_detection.cpp (num_threads <= 0 uses all cores),
+    the results are identical to fire_masks_reference (see benchmark_fire_detection.py).
+    """
+    outer_fire_mask, core_fire_mask = fire_detection_cpp.fire_masks(b12_norm, b11_norm, b8a_norm, b04_norm, b03_norm, b02_norm, band_max, num_threads)
+
+    # Dilate the fire to enlarge the detection radius for the core fire
+    closed_fire_mask = morphology.close(outer_fire_mask, FIRE_CLOSING_SIZE)
+
+    # Only keep the yellow/white fire pixels near the red pixels
+    core_fire_mask &= closed_fire_mask
+    return outer_fire_mask, core_fire_mask
+
+def fire_masks_reference(b12_norm, b11_norm, b8a_norm, b04_norm, b03_norm, b02_norm, band_max) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    NumPy version of fire_masks, returns uint16 masks.
+    """
+    b12_max, b11_max, b8a_max, b04_max, b03_max, b02_max = band_max
+
+    # b11 threshold should be higher the hotter the fire is
+    b11_dynamic_thresh = 0.2 + 0.3 * b12_norm
+    # Low b11 and b8a (G, B) to exclude clouds and vegetation
+    outer_fire_mask = (b12_norm > (0.6 / b12_max)) & (b11_norm < (b11_dynamic_thresh / b11_max)) & (b8a_norm < (0.5 / b8a_max))
+    outer_fire_mask = outer_fire_mask.astype(np.uint16)
+
+    # Dilate the fire to enlarge the detection radius for the core fire
+    closed_fire_mask = morphology.close(outer_fire_mask, FIRE_CLOSING_SIZE)
+
+    # Search for yellow/white fire pixels near the red pixels
+    core_fire = (b12_norm > (0.9 / b12_max)) & (b11_norm > (0.8 / b11_max)) & (closed_fire_mask == 1) # searching for yellow fire pixels
+    cloud_filter = (b04_norm < (0.7 / b04_max)) & (b03_norm < (0.7 / b03_max)) & (b02_norm < (0.7 / b02_max)) # filtering the clouds
+    core_fire_mask = core_fire & cloud_filter
+    core_fire_mask = core_fire_mask.astype(np.uint16)
+
+    # TODO: Problem ==> Fehldetektierte rot-angestrahlte Wolken herausfiltern
+    # Problem an Anwendung von Cloudmask: Unter den Wolken liegende Feuer werden nicht mehr erkannt
+
+    # TODO: Groesse der Filtermasken evtl. je nach Groesse des Feuers dynamisch anpassen
+
+    return outer_fire_mask, core_fire_mask
+
+def burning_area(final_fire_mask: np.ndarray, down_scale_factor: int = 1) -> float:
+    """
+    Returns the size of the active fire area in km^2.
+    """
+    number_fire_pixels = np.count_nonzero(final_fire_mask)
+    return (PIXEL_AREA * down_scale_factor**2 * number_fire_pixels) / 1000000
+
+
+# 2. Regioning of the fires
+
+def prepare_regions(final_fire_mask: np.ndarray) -> np.ndarray:
+    """
+    Closes small gaps and removes single pixel artifacts before the regioning.
+    """
+    combined_region_closed = morphology.close(final_fire_mask, KERNEL_MEDIUM_SIZE)
+    combined_region_opened = morphology.open(combined_region_closed, KERNEL_SMALL_SIZE)
+    return combined_region_opened
+
+
+# 3. Detecting the burned area
+
+def burn_ratio(b12: np.ndarray, b11: np.ndarray) -> np.ndarray:
+    # Clip bands to ignore outliers of the fire / clouds
+    b12_clipped = np.clip(b12, 0, 1)
+    b11_clipped = np.clip(b11, 0, 1)
+
+    # Converting the bands to greyscale by dividing b12 with b11 for brightening the burned area
+    return b12_clipped / (b11_clipped + 1e-6) # added constant denominator to avoid dividing by zero
+
+def burn_index(b12, b11, b8a, ratio_range: Optional[Tuple[float, float]] = None, fill_value: Optional[float] = None) -> np.ndarray:
+    """
+    Returns the gamma corrected burn index.
+    ratio_range (min, max of the b12/b11 ratio) and fill_value (mean of the normalized index) are
+    computed from the given bands unless they are passed in, e.g. as statistics of the whole scene.
+    """
+    b11_clipped = np.clip(b11, 0, 1)
+    b8a_clipped = np.clip(b8a, 0, 1)
+    burn_index = burn_ratio(b12, b11)
+
+    # Normalize burn_index to 0–1
+    ratio_min, ratio_max = ratio_range if ratio_range is not None else (burn_index.min(), burn_index.max())
+    burn_index = (burn_index - ratio_min) / (ratio_max - ratio_min + 1e-6)
+
+    # Filtering sharp edges that aren't part of the burned area
+    if fill_value is None:
+        mean_mask = (burn_index > 0) & ((b11_clipped) >= 0.2) # avoid black areas or water for computing the mean
+        fill_value = burn_index[mean_mask].mean()
+    burn_index[(b11_clipped) < 0.2] = fill_value     # filtering water
+    burn_index[(b8a_clipped) > 0.5] = fill_value     # filtering vegetation
+    burn_index[(b11_clipped) > 0.3] = fill_value     # filtering bright areas
+
+    # Gamma correction to make the image brighter
+    return burn_index**0.5
+
+def edge_gradients(burn_index: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Returns the sobel gradients along axis 0 (y) and axis 1 (x) of the smoothed burn index and their magnitude (float32).
+    The burn index is smoothed once, sobel and canny of the burnt area detection both use these gradients.
+    """
+    radius = int(GAUSSIAN_TRUNCATE * EDGE_SIGMA + 0.5) # same kernel as gaussian_filter
+    smoothed = cv2.GaussianBlur(burn_index.astype(np.float32, copy=False), (2 * radius + 1, 2 * radius + 1), EDGE_SIGMA, borderType=cv2.BORDER_REFLECT)
+    sobely = cv2.Sobel(smoothed, cv2.CV_32F, 0, 1, ksize=3) # in y-direction
+    sobelx = cv2.Sobel(smoothed, cv2.CV_32F, 1, 0, ksize=3) # in x-direction
+    return sobely, sobelx, cv2.magnitude(sobelx, sobely)
+
+def sobel_magnitude(burn_index: np.ndarray) -> np.ndarray:
+    """
+    Returns the (not normalized) sobel gradient magnitude of the smoothed burn index.
+    """
+    return edge_gradients(burn_index)[2]
+
+def sobel_magnitude_reference(burn_index: np.ndarray) -> np.ndarray:
+    """
+    float64 version of sobel_magnitude, used by burnt_area_edges_reference.
+    """
+    # scipy and skimage are only needed by the reference versions
+    from scipy.ndimage import gaussian_filter
+    smoothed = gaussian_filter(burn_index, sigma=EDGE_SIGMA, truncate=GAUSSIAN_TRUNCATE) # applying gaussian filter to smooth small edges
+    sobelx = cv2.Sobel(smoothed, cv2.CV_64F, 1, 0, ksize=3) # in x-direction
+    sobely = cv2.Sobel(smoothed, cv2.CV_64F, 0, 1, ksize=3) # in y-direction
+    return np.hypot(sobelx, sobely) # combine filters
+
+def edge_thresholds(edges_sobel: np.ndarray) -> EdgeThresholds:
+    """
+    Returns the edge thresholds for the sobel magnitude of a whole scene.
+    """
+    sobel_min, sobel_max = float(edges_sobel.min()), float(edges_sobel.max())
+    edges_sobel = normalize_sobel(edges_sobel, sobel_min, sobel_max) # normalize
+    return EdgeThresholds(
+        sobel_min=sobel_min,
+        sobel_max=sobel_max,
+        sobel_threshold=np.percentile(edges_sobel, 98),
+        canny_low=np.percentile(edges_sobel, 90),
+        canny_high=np.percentile(edges_sobel, 95),
+    )
+
+def normalize_sobel(edges_sobel: np.ndarray, sobel_min: float, sobel_max: float) -> np.ndarray:
+    # Same as cv2.NORM_MINMAX, but the range can be the one of the whole scene
+    sobel_range = sobel_max - sobel_min
+    scale = 1.0 / sobel_range if sobel_range > np.finfo(float).eps else 0.0
+    return (edges_sobel - sobel_min) * scale
+
+def burnt_area_edges(burn_index: np.ndarray, thresholds: Optional[EdgeThresholds] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Returns the sobel edges, the dilated canny edges and the combined burnt area mask.
+    thresholds are computed from the given burn index unless they are passed in.
+    Sobel and canny share the smoothing and the gradients (see edge_gradients), the canny non-maximum
+    suppression and hysteresis run on them in edge_detection.cpp.
+    """
+    return edges_from_gradients(*edge_gradients(burn_index), thresholds)
+
+def edges_from_gradients(sobely: np.ndarray, sobelx: np.ndarray, edges_sobel: np.ndarray, thresholds: Optional[EdgeThresholds] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    burnt_area_edges for the gradients returned by edge_gradients.
+    """
+    # Applying sobel operator for edge detection of the burned area
+    if thresholds is None:
+        thresholds = edge_thresholds(edges_sobel)
+    binary_edges_sobel = normalize_sobel(edges_sobel, thresholds.sobel_min, thresholds.sobel_max) > thresholds.sobel_threshold # only keep strongest edges
+
+    # Applying canny for detecting sharp edges only
+    edges_canny = edge_detection_cpp.canny(sobely, sobelx, edges_sobel, thresholds.canny_low, thresholds.canny_high)
+    return _combine_edges(binary_edges_sobel, edges_canny)
+
+def burnt_area_edges_reference(burn_index: np.ndarray, thresholds: Optional[EdgeThresholds] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Version of burnt_area_edges with separate float64 smoothings for sobel and skimage's canny.
+    """
+    from skimage.feature import canny
+    edges_sobel = sobel_magnitude_reference(burn_index)
+    if thresholds is None:
+        thresholds = edge_thresholds(edges_sobel)
+    edges_sobel = normalize_sobel(edges_sobel, thresholds.sobel_min, thresholds.sobel_max)
+    binary_edges_sobel = edges_sobel > thresholds.sobel_threshold # only keep strongest edges
+
+    # Applying canny operator for detecting sharp edges only
+    edges_canny = canny(burn_index, sigma=EDGE_SIGMA, low_threshold=thresholds.canny_low, high_threshold=thresholds.canny_high)
+    return _combine_edges(binary_edges_sobel, edges_canny.astype(np.uint8))
+
+def _combine_edges(binary_edges_sobel: np.ndarray, edges_canny: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    dilated_edges = morphology.dilate(edges_canny, KERNEL_MEDIUM_SIZE)
+
+    # Dilate detected edges by canny in order to limit the detection radius of sobel
+    dilated_edges_canny = morphology.dilate(dilated_edges, EDGE_AREA_DILATION_SIZE)
+
+    combined_edges = binary_edges_sobel & dilated_edges_canny # Keep all sobel pixels that overlap dilated canny area
+    combined_edges_closed = morphology.close(combined_edges, KERNEL_MEDIUM_SIZE) # Close holes in burned area
+    combined_edges_opened = morphology.open(combined_edges_closed, KERNEL_SMALL_SIZE) # Remove artifacts
+    return binary_edges_sobel, dilated_edges, combined_edges_opened
@@ -0,0 +1,156 @@
+#include <pybind11/pybind11.h>
+#include <pybind11/numpy.h>
+#include <cmath>
+#include <cstdint>
+#include <stdexcept>
+#include <vector>
+
+namespace py = pybind11;
+
+// Non-maximum suppression and hysteresis of the canny edge detection on given gradients, so the burnt
+// area detection can smooth the burn index and compute its gradients once for both sobel and canny.
+// Both steps are the same as in skimage.feature.canny: the magnitude is interpolated bilinearly along
+// the gradient direction, the outermost pixels are never edges and the hysteresis keeps every
+// 8-connected group of low threshold pixels that contains a high threshold pixel.
+
+template <typename T>
+using Image = py::array_t<T, py::array::c_style | py::array::forcecast>;
+
+enum : uint8_t
+{
+    NO_EDGE = 0,
+    LOW_EDGE = 1,
+    HIGH_EDGE = 2,
+};
+
+// Magnitude interpolated between the neighbours 1 (direct) and 2 (diagonal) with the weight w.
+// The rounding is the one of skimage (neighbour_2 * w in T, the rest in double), so ties are decided alike
+template <typename T>
+static inline double interpolate(T neighbour_1, T neighbour_2, T w)
+{
+    return static_cast<T>(neighbour_2 * w) + neighbour_1 * (1.0 - w);
+}
+
+template <typename T>
+static uint8_t suppress(const T *isobel, const T *jsobel, const T *magnitude, py::ssize_t i, py::ssize_t width, T low_threshold, T high_threshold)
+{
+    const T m = magnitude[i];
+    if (!(m >= low_threshold) || !(m > 0))
+        return NO_EDGE;
+    const T di = isobel[i], dj = jsobel[i];
+    const bool is_down = di <= 0, is_up = di >= 0;
+    const bool is_left = dj <= 0, is_right = dj >= 0;
+    const bool cond1 = (is_up && is_right) || (is_down && is_left);
+    const bool cond2 = (is_down && is_right) || (is_up && is_left);
+    const T abs_i = std::fabs(di), abs_j = std::fabs(dj);
+    const uint8_t edge = m >= high_threshold ? HIGH_EDGE : LOW_EDGE;
+
+    if (cond1)
+    {
+        T w;
+        double plus, minus;
+        if (abs_i > abs_j)
+        {
+            w = abs_j / abs_i;
+            plus = interpolate(magnitude[i + width], magnitude[i + width + 1], w);
+            minus = interpolate(magnitude[i - width], magnitude[i - width - 1], w);
+        }
+        else
+        {
+            w = abs_i / abs_j;
+            plus = interpolate(magnitude[i + 1], magnitude[i + width + 1], w);
+            minus = interpolate(magnitude[i - 1], magnitude[i - width - 1], w);
+        }
+        if (plus <= m && minus <= m)
+            return edge;
+    }
+    if (cond2)
+    {
+        T w;
+        double plus, minus;
+        if (abs_i >= abs_j)
+        {
+            w = abs_j / abs_i;
+            plus = interpolate(magnitude[i + width], magnitude[i + width - 1], w);
+            minus = interpolate(magnitude[i - width], magnitude[i - width + 1], w);
+        }
+        else
+        {
+            w = abs_i / abs_j;
+            plus = interpolate(magnitude[i - 1], magnitude[i + width - 1], w);
+            minus = interpolate(magnitude[i + 1], magnitude[i - width + 1], w);
+        }
+        if (plus <= m && minus <= m)
+            return edge;
+    }
+    return NO_EDGE;
+}
+
+template <typename T>
+py::array_t<uint8_t> canny_edges(Image<T> isobel_py, Image<T> jsobel_py, Image<T> magnitude_py, double low_threshold, double high_threshold)
+{
+    py::buffer_info buf = magnitude_py.request();
+    if (buf.ndim != 2 || isobel_py.request().shape != buf.shape || jsobel_py.request().shape != buf.shape)
+    {
+        throw std::runtime_error("Gradients and magnitude must be 2-dimensional and of the same shape.");
+    }
+    const py::ssize_t height = buf.shape[0], width = buf.shape[1];
+    const T *isobel = isobel_py.data();
+    const T *jsobel = jsobel_py.data();
+    const T *magnitude = magnitude_py.data();
+
+    py::array_t<uint8_t> edges_py({height, width});
+    uint8_t *edges = edges_py.mutable_data();
+    {
+        py::gil_scoped_release release;
+        std::fill(edges, edges + height * width, NO_EDGE);
+
+        // Non-maximum suppression, the outermost pixels stay NO_EDGE.
+        // skimage passes the low threshold to its suppression as float, so it is rounded the same way
+        const T low = static_cast<T>(static_cast<float>(low_threshold));
+        const T high = static_cast<T>(high_threshold);
+        std::vector<py::ssize_t> stack;
+        for (py::ssize_t v = 1; v < height - 1; ++v)
+        {
+            for (py::ssize_t u = 1; u < width - 1; ++u)
+            {
+                const py::ssize_t i = v * width + u;
+                edges[i] = suppress(isobel, jsobel, magnitude, i, width, low, high);
+                if (edges[i] == HIGH_EDGE)
+                    stack.push_back(i);
+            }
+        }
+
+        // Hysteresis, following the low edges 8-connected to the high edges. Pixels that are reached
+        // are marked as HIGH_EDGE, so every pixel is pushed once at most
+        const py::ssize_t neighbours[8] = {-width - 1, -width, -width + 1, -1, 1, width - 1, width, width + 1};
+        while (!stack.empty())
+        {
+            const py::ssize_t i = stack.back();
+            stack.pop_back();
+            for (py::ssize_t offset : neighbours)
+            {
+                const py::ssize_t j = i + offset;
+                if (edges[j] == LOW_EDGE)
+                {
+                    edges[j] = HIGH_EDGE;
+                    stack.push_back(j);
+                }
+            }
+        }
+        for (py::ssize_t i = 0; i < height * width; ++i)
+            edges[i] = edges[i] == HIGH_EDGE;
+    }
+    return edges_py;
+}
+
+PYBIND11_MODULE(edge_detection_cpp, m)
+{
+    m.doc() = "Canny edge detection on precomputed gradients.";
+    const char *doc = "Returns the canny edges (uint8) for the gradients along axis 0 (isobel) and axis 1 (jsobel) and their magnitude.\n"
+                      "Same non-maximum suppression and hysteresis as skimage.feature.canny.";
+    m.def("canny", &canny_edges<float>, doc, py::arg("isobel").noconvert(), py::arg("jsobel").noconvert(), py::arg("magnitude").noconvert(),
+          py::arg("low_threshold"), py::arg("high_threshold"));
+    m.def("canny", &canny_edges<double>, doc, py::arg("isobel"), py::arg("jsobel"), py::arg("magnitude"),
+          py::arg("low_threshold"), py::arg("high_threshold"));
+}
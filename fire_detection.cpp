@@ -0,0 +1,110 @@
+#include <pybind11/pybind11.h>
+#include <pybind11/numpy.h>
+#include <pybind11/stl.h>
+#include <algorithm>
+#include <array>
+#include <cstdint>
+#include <stdexcept>
+#include <thread>
+#include <tuple>
+#include <vector>
+
+namespace py = pybind11;
+
+// Pixel thresholds of the fire detection (see detection.fire_masks_reference) in a single pass over the
+// normalized bands. NumPy evaluates every comparison into its own full-size temporary, here every pixel
+// is read once and only the two uint8 masks are written. The thresholds that only depend on the band
+// maxima are computed once. All comparisons are done in double precision like in the NumPy version,
+// so the masks are identical for float64 bands (float32 bands are compared by their exact value).
+
+constexpr int NUM_BANDS = 6; // B12, B11, B8A, B04, B03, B02
+
+template <typename T>
+using Band = py::array_t<T, py::array::c_style | py::array::forcecast>;
+
+struct Thresholds
+{
+    double outer_b12, b11_max, outer_b8a;
+    double core_b12, core_b11;
+    double cloud_b04, cloud_b03, cloud_b02;
+
+    explicit Thresholds(const std::array<double, NUM_BANDS> &band_max)
+        : outer_b12(0.6 / band_max[0]), b11_max(band_max[1]), outer_b8a(0.5 / band_max[2]),
+          core_b12(0.9 / band_max[0]), core_b11(0.8 / band_max[1]),
+          cloud_b04(0.7 / band_max[3]), cloud_b03(0.7 / band_max[4]), cloud_b02(0.7 / band_max[5]) {}
+};
+
+template <typename T>
+static void fire_pixels(const std::array<const T *, NUM_BANDS> &bands, const Thresholds &t, uint8_t *outer, uint8_t *core, py::ssize_t begin, py::ssize_t end)
+{
+    const T *b12 = bands[0], *b11 = bands[1], *b8a = bands[2], *b04 = bands[3], *b03 = bands[4], *b02 = bands[5];
+    for (py::ssize_t i = begin; i < end; ++i)
+    {
+        const double v12 = b12[i], v11 = b11[i];
+        // b11 threshold should be higher the hotter the fire is
+        const double b11_dynamic_thresh = 0.2 + 0.3 * v12;
+        // Low b11 and b8a (G, B) to exclude clouds and vegetation
+        outer[i] = (v12 > t.outer_b12) & (v11 < b11_dynamic_thresh / t.b11_max) & (b8a[i] < t.outer_b8a);
+        // Yellow/white fire pixels without the clouds, the closed outer mask is applied afterwards
+        core[i] = (v12 > t.core_b12) & (v11 > t.core_b11) & (b04[i] < t.cloud_b04) & (b03[i] < t.cloud_b03) & (b02[i] < t.cloud_b02);
+    }
+}
+
+template <typename T>
+std::tuple<py::array_t<uint8_t>, py::array_t<uint8_t>> fire_masks(Band<T> b12, Band<T> b11, Band<T> b8a, Band<T> b04, Band<T> b03, Band<T> b02,
+                                                                  const std::array<double, NUM_BANDS> &band_max, int num_threads)
+{
+    std::array<Band<T> *, NUM_BANDS> band_arrays = {&b12, &b11, &b8a, &b04, &b03, &b02};
+    std::array<const T *, NUM_BANDS> bands;
+    py::buffer_info first = b12.request();
+    if (first.ndim != 2)
+    {
+        throw std::runtime_error("Bands must be 2-dimensional.");
+    }
+    for (int b = 0; b < NUM_BANDS; ++b)
+    {
+        py::buffer_info buf = band_arrays[b]->request();
+        if (buf.shape != first.shape)
+        {
+            throw std::runtime_error("All bands must have the same shape.");
+        }
+        bands[b] = static_cast<const T *>(buf.ptr);
+    }
+
+    const py::ssize_t height = first.shape[0], width = first.shape[1];
+    py::array_t<uint8_t> outer_py({height, width});
+    py::array_t<uint8_t> core_py({height, width});
+    uint8_t *outer = outer_py.mutable_data();
+    uint8_t *core = core_py.mutable_data();
+    const Thresholds thresholds(band_max);
+
+    if (num_threads <= 0)
+        num_threads = std::max(1u, std::thread::hardware_concurrency());
+    num_threads = static_cast<int>(std::min<py::ssize_t>(num_threads, std::max<py::ssize_t>(height, 1)));
+    {
+        py::gil_scoped_release release;
+        // Every thread handles a chunk of whole rows
+        std::vector<std::thread> threads;
+        for (int t = 1; t < num_threads; ++t)
+            threads.emplace_back([&, t] { fire_pixels(bands, thresholds, outer, core, height * t / num_threads * width, height * (t + 1) / num_threads * width); });
+        fire_pixels(bands, thresholds, outer, core, 0, height / num_threads * width);
+        for (auto &thread : threads)
+            thread.join();
+    }
+    return std::make_tuple(outer_py, core_py);
+}
+
+PYBIND11_MODULE(fire_detection_cpp, m)
+{
+    m.doc() = "Fused pixel thresholds of the fire detection.";
+    const char *doc = "Returns the outer fire mask and the core fire candidates (uint8) of the normalized bands B12, B11, B8A, B04, B03, B02.\n"
+                      "band_max are the maxima of the scaled bands, num_threads <= 0 uses all cores.";
+    // float32 bands are used as they are, everything else is converted to float64
+    m.def("fire_masks", &fire_masks<float>, doc,
+          py::arg("b12").noconvert(), py::arg("b11").noconvert(), py::arg("b8a").noconvert(),
+          py::arg("b04").noconvert(), py::arg("b03").noconvert(), py::arg("b02").noconvert(),
+          py::arg("band_max"), py::arg("num_threads") = 0);
+    m.def("fire_masks", &fire_masks<double>, doc,
+          py::arg("b12"), py::arg("b11"), py::arg("b8a"), py::arg("b04"), py::arg("b03"), py::arg("b02"),
+          py::arg("band_max"), py::arg("num_threads") = 0);
+}
@@ -0,0 +1,144 @@
+import json
+from typing import List, Optional, Tuple
+import numpy as np
+from rasterio import features
+from rasterio.transform import Affine
+from rasterio.warp import transform_geom
+import sequential_regioning_cpp
+import detection
+
+# One record per fire region
+REGION_DTYPE = np.dtype([
+    ("label", np.int32),
+    ("pixels", np.int64),
+    ("area_km2", np.float64),
+    ("row_min", np.int32),
+    ("col_min", np.int32),
+    ("row_max", np.int32),
+    ("col_max", np.int32),
+    ("centroid_row", np.float64),
+    ("centroid_col", np.float64),
+    ("max_b12", np.float32),
+    ("max_b11", np.float32),
+])
+
+# Statistics as returned by sequential_regioning_cpp.label_stats, they can be merged across tiles
+RAW_STAT_MIN = ("row_min", "col_min")
+RAW_STAT_MAX = ("row_max", "col_max", "max_intensity")
+RAW_STAT_SUM = ("pixels", "sum_row", "sum_col")
+
+def label_regions(mask: np.ndarray, b12: np.ndarray, b11: np.ndarray, n8: bool = True, num_threads: int = 1) -> Tuple[np.ndarray, int, dict]:
+    """
+    Labels the fire regions and collects their statistics in the same pass.
+    Returns the int32 label image, the amount of regions and the raw statistics.
+    """
+    return sequential_regioning_cpp.label_stats(mask, [b12, b11], n8=n8, num_threads=num_threads)
+
+def region_records(raw_stats: dict, down_scale_factor: int = 1) -> np.ndarray:
+    """
+    Turns the raw statistics of label_regions into a record array with one entry per region.
+    """
+    amount_regions = len(raw_stats["pixels"])
+    regions = np.zeros(amount_regions, REGION_DTYPE).view(np.recarray)
+    pixels = raw_stats["pixels"]
+    regions.label = np.arange(1, amount_regions + 1)
+    regions.pixels = pixels
+    regions.area_km2 = pixels * detection.PIXEL_AREA * down_scale_factor**2 / 1000000
+    for field in ("row_min", "col_min", "row_max", "col_max"):
+        regions[field] = raw_stats[field]
+    regions.centroid_row = raw_stats["sum_row"] / np.maximum(pixels, 1)
+    regions.centroid_col = raw_stats["sum_col"] / np.maximum(pixels, 1)
+    regions.max_b12 = raw_stats["max_intensity"][:, 0]
+    regions.max_b11 = raw_stats["max_intensity"][:, 1]
+    return regions
+
+def region_stats(mask: np.ndarray, b12: np.ndarray, b11: np.ndarray, down_scale_factor: int = 1, n8: bool = True, num_threads: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the label image and the record array of the fire regions of a mask.
+    """
+    labels, _, raw_stats = label_regions(mask, b12, b11, n8=n8, num_threads=num_threads)
+    return labels, region_records(raw_stats, down_scale_factor)
+
+def shift_raw_stats(raw_stats: dict, row_offset: int, col_offset: int) -> dict:
+    """
+    Moves the raw statistics of a window to the coordinates of the whole scene.
+    """
+    shifted = dict(raw_stats)
+    shifted["sum_row"] = raw_stats["sum_row"] + raw_stats["pixels"] * row_offset
+    shifted["sum_col"] = raw_stats["sum_col"] + raw_stats["pixels"] * col_offset
+    for field in ("row_min", "row_max"):
+        shifted[field] = raw_stats[field] + row_offset
+    for field in ("col_min", "col_max"):
+        shifted[field] = raw_stats[field] + col_offset
+    return shifted
+
+def merge_raw_stats(raw_stats_parts: List[dict], final_labels: np.ndarray, amount_regions: int) -> dict:
+    """
+    Merges the raw statistics of several label images (e.g. tiles) whose labels were numbered one after
+    another. final_labels maps these labels (starting at 1) to the merged labels 1..amount_regions.
+    """
+    merged = {}
+    target = final_labels[1:] - 1
+    for field in RAW_STAT_SUM + RAW_STAT_MIN + RAW_STAT_MAX:
+        values = np.concatenate([part[field] for part in raw_stats_parts])
+        if field in RAW_STAT_SUM:
+            out = np.zeros((amount_regions,) + values.shape[1:], values.dtype)
+            np.add.at(out, target, values)
+        elif field in RAW_STAT_MIN:
+            out = np.full((amount_regions,) + values.shape[1:], np.iinfo(values.dtype).max, values.dtype)
+            np.minimum.at(out, target, values)
+        else:
+            out = np.full((amount_regions,) + values.shape[1:], -np.inf if values.dtype.kind == "f" else -1, values.dtype)
+            np.maximum.at(out, target, values)
+        merged[field] = out
+    return merged
+
+
+# Vector export
+
+def region_geometry(labels: np.ndarray, region, transform: Affine) -> dict:
+    """
+    Returns the outline of a region as GeoJSON geometry, only its bounding box is looked at.
+    """
+    rows = slice(region.row_min, region.row_max + 1)
+    cols = slice(region.col_min, region.col_max + 1)
+    region_mask = labels[rows, cols] == region.label
+    window_transform = transform * Affine.translation(region.col_min, region.row_min)
+    polygons = [
+        geometry["coordinates"]
+        for geometry, _ in features.shapes(region_mask.astype(np.uint8), mask=region_mask, connectivity=8, transform=window_transform)
+    ]
+    if len(polygons) == 1:
+        return {"type": "Polygon", "coordinates": polygons[0]}
+    return {"type": "MultiPolygon", "coordinates": polygons}
+
+def to_geojson(labels: np.ndarray, regions: np.ndarray, transform: Affine, crs, to_wgs84: bool = True) -> dict:
+    """
+    Returns a GeoJSON FeatureCollection with the outline and the statistics of every fire region.
+    transform and crs are the georeference of the label image (see bands.band_georeference).
+    """
+    features_out = []
+    for region in regions.view(np.recarray):
+        geometry = region_geometry(labels, region, transform)
+        centroid_x, centroid_y = transform * (region.centroid_col + 0.5, region.centroid_row + 0.5)
+        centroid = {"type": "Point", "coordinates": [centroid_x, centroid_y]}
+        if to_wgs84:
+            geometry = transform_geom(crs, "EPSG:4326", geometry)
+            centroid = transform_geom(crs, "EPSG:4326", centroid)
+        properties = {name: region[name].item() for name in REGION_DTYPE.names}
+        properties["centroid"] = centroid["coordinates"]
+        features_out.append({"type": "Feature", "geometry": geometry, "properties": properties})
+    return {"type": "FeatureCollection", "features": features_out}
+
+def write_geojson(path: str, labels: np.ndarray, regions: np.ndarray, transform: Affine, crs, to_wgs84: bool = True):
+    with open(path, "w") as f:
+        json.dump(to_geojson(labels, regions, transform, crs, to_wgs84), f)
+
+def print_regions(regions: np.ndarray, limit: Optional[int] = 10):
+    """
+    Prints the largest fire regions.
+    """
+    largest = np.sort(regions, order="pixels")[::-1][:limit]
+    for region in largest.view(np.recarray):
+        print(f"Fire {region.label}: {region.area_km2:.2f}km^2, centroid (row {region.centroid_row:.0f}, col {region.centroid_col:.0f}), "
+              f"max B12 {region.max_b12:.3f}, max B11 {region.max_b11:.3f}")
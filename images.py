@@ -1,9 +1,19 @@
+import os
+import posixpath
+import re
+import zipfile
+import xml.etree.ElementTree as ET
 from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
 
 @dataclass
 class Image:
     directory: str
     file_name_prefix: str
+    # Resolved by the scene catalog (catalog.py), the paths are then neither built nor checked again
+    band_paths: Optional[Tuple[str, ...]] = None
+    has_cloud_mask: Optional[bool] = None
 
 
 Cape_City_South_Africa = Image(
@@ -47,11 +57,97 @@ Montreal_Lake = Image(
 )
 
 
+# Sentinel-2 L2A products as downloaded from Copernicus (S2A_MSIL2A_..._.SAFE.zip) are read without extracting them.
+# The bands are found in the manifest of the product and read through GDAL's /vsizip/, which reads only the
+# parts of the archive it needs, so every band can be opened and decoded by its own thread.
+VSIZIP = "/vsizip/"
+SAFE_BANDS = ("B12", "B11", "B8A", "B04", "B03", "B02")
+
+def is_safe_zip(directory: str) -> bool:
+    return directory.lower().endswith(".zip")
+
+@lru_cache(maxsize=32)
+def _zip_index(zip_path: str, mtime_ns: int) -> Tuple[Dict[str, zipfile.ZipInfo], Tuple[str, ...]]:
+    # The members of the archive and the files listed in manifest.safe, only the central directory and the manifest are read
+    with zipfile.ZipFile(zip_path) as archive:
+        infos = {info.filename: info for info in archive.infolist()}
+        manifests = [name for name in infos if posixpath.basename(name) == "manifest.safe"]
+        if not manifests:
+            return infos, tuple(infos)
+        manifest = ET.fromstring(archive.read(manifests[0]))
+    root = posixpath.dirname(manifests[0])
+    hrefs = [element.get("href") for element in manifest.iter() if element.tag.endswith("fileLocation")]
+    return infos, tuple(posixpath.normpath(posixpath.join(root, href)) for href in hrefs if href)
+
+def _safe_index(zip_path: str):
+    return _zip_index(os.path.abspath(zip_path), os.stat(zip_path).st_mtime_ns)
+
+def _safe_member(members: Tuple[str, ...], folder: str, file_name: str, prefix: str) -> str:
+    # Member names differ in the case of the band (B8A, B8a), the prefix is the tile and acquisition time
+    for member in members:
+        name = posixpath.basename(member)
+        if f"/{folder}/" in member and name.lower().endswith(file_name.lower()) and name.startswith(prefix):
+            return member
+    raise FileNotFoundError(f"No {folder}/{prefix}*{file_name} in the product")
+
+def safe_zip_band_paths(zip_path: str, prefix: str = ""):
+    """
+    Returns the /vsizip/ paths of the R20m bands and the cloud mask (the path is returned even if it's missing)
+    of a zipped SAFE product. The prefix selects the granule, if there is more than one.
+    """
+    infos, members = _safe_index(zip_path)
+    base_path = VSIZIP + os.path.abspath(zip_path)
+    band_members = [_safe_member(members, "IMG_DATA/R20m", f"_{band}_20m.jp2", prefix) for band in SAFE_BANDS]
+    try:
+        cm_member = _safe_member(members, "QI_DATA", "MSK_CLDPRB_20m.jp2", "")
+    except FileNotFoundError:
+        cm_member = posixpath.join(posixpath.dirname(posixpath.dirname(posixpath.dirname(band_members[0]))), "QI_DATA", "MSK_CLDPRB_20m.jp2")
+    return tuple(f"{base_path}/{member}" for member in band_members + [cm_member])
+
+def from_safe_zip(zip_path: str) -> Image:
+    """
+    Returns the image of a zipped SAFE product, with the prefix of its (first) granule.
+    """
+    b12_path = safe_zip_band_paths(zip_path)[0]
+    return Image(directory=os.path.abspath(zip_path), file_name_prefix=posixpath.basename(b12_path)[:-len("_B12_20m.jp2")])
+
+def _split_vsizip(path: str) -> Tuple[str, str]:
+    zip_path, member = re.match(r"(.*?\.zip)/(.*)", path[len(VSIZIP):], re.IGNORECASE).groups()
+    return zip_path, member
+
+def source_file(path: str) -> str:
+    """
+    Returns the file containing a band, the archive for bands inside of a zip.
+    """
+    return _split_vsizip(path)[0] if path.startswith(VSIZIP) else path
+
+def band_exists(path: str) -> bool:
+    if path.startswith(VSIZIP):
+        zip_path, member = _split_vsizip(path)
+        return member in _safe_index(zip_path)[0]
+    return os.path.exists(path)
+
+def band_size(path: str) -> int:
+    """
+    Returns the size of a band file in bytes (as stored in the archive for zipped products).
+    """
+    if path.startswith(VSIZIP):
+        zip_path, member = _split_vsizip(path)
+        return _safe_index(zip_path)[0][member].compress_size
+    return os.path.getsize(path)
+
+
 def get_band_paths(img: Image):
     """
     Returns the paths to the bands for a given image.
+    Relative directories are inside of the images folder, absolute ones are used as they are.
+    A directory ending with .zip is a zipped SAFE product, its bands are read from the archive.
     """
-    base_path = f"images/{img.directory}"
+    if img.band_paths is not None:
+        return img.band_paths
+    base_path = img.directory if os.path.isabs(img.directory) else f"images/{img.directory}"
+    if is_safe_zip(base_path):
+        return safe_zip_band_paths(base_path, img.file_name_prefix)
     
     # Infrared bands
     b12_path = f"{base_path}/infrared/{img.file_name_prefix}_B12_20m.jp2"
@@ -66,4 +162,9 @@ def get_band_paths(img: Image):
     # Cloud mask (if available)
     cm_path = f"{base_path}/MSK_CLDPRB_20m.jp2"
     
-    return b12_path, b11_path, b8a_path, b04_path, b03_path, b02_path, cm_path
\ No newline at end of file
+    return b12_path, b11_path, b8a_path, b04_path, b03_path, b02_path, cm_path
+
+def has_cloud_mask(img: Image) -> bool:
+    if img.has_cloud_mask is not None:
+        return img.has_cloud_mask
+    return band_exists(get_band_paths(img)[6])
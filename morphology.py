@@ -0,0 +1,44 @@
+import numpy as np
+import cv2
+import binary_morphology_cpp
+
+# Binary morphology with square kernels, drop-in for cv2.morphologyEx(mask, op, np.ones((size, size)))
+# on masks with the values 0 and 1. The results keep the dtype of the input mask.
+# Large kernels use the C++ implementation on bit-packed rows, its cost doesn't depend on the kernel size
+# (see binary_morphology.cpp). OpenCV is faster for small kernels, its cost grows with the kernel size.
+# Both give the same results, see benchmark_morphology.py for the comparison.
+
+PACKED_MIN_KERNEL_SIZE = 32
+
+_OPENCV_OPERATIONS = {
+    "dilate": cv2.MORPH_DILATE,
+    "erode": cv2.MORPH_ERODE,
+    "close": cv2.MORPH_CLOSE,
+    "open": cv2.MORPH_OPEN,
+}
+
+def _morphology(mask: np.ndarray, size: int, operation: str) -> np.ndarray:
+    if size < PACKED_MIN_KERNEL_SIZE:
+        if mask.dtype == bool:
+            return cv2.morphologyEx(mask.astype(np.uint8), _OPENCV_OPERATIONS[operation], np.ones((size, size), np.uint8)).astype(bool)
+        return cv2.morphologyEx(mask, _OPENCV_OPERATIONS[operation], np.ones((size, size), np.uint8))
+    result = getattr(binary_morphology_cpp, operation)(mask, size, size)
+    return result if mask.dtype == np.uint8 else result.astype(mask.dtype)
+
+def dilate(mask: np.ndarray, size: int) -> np.ndarray:
+    return _morphology(mask, size, "dilate")
+
+def erode(mask: np.ndarray, size: int) -> np.ndarray:
+    return _morphology(mask, size, "erode")
+
+def close(mask: np.ndarray, size: int) -> np.ndarray:
+    """
+    Dilation followed by an erosion, closes gaps smaller than the kernel.
+    """
+    return _morphology(mask, size, "close")
+
+def open(mask: np.ndarray, size: int) -> np.ndarray:
+    """
+    Erosion followed by a dilation, removes structures smaller than the kernel.
+    """
+    return _morphology(mask, size, "open")
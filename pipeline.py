@@ -0,0 +1,219 @@
+import hashlib
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+import numpy as np
+import images
+import detection
+import fire_regions
+import morphology
+import profiling
+import sequential_regioning_cpp
+from band_cache import BandCache
+from bands import load_bands, normalize_band, PRECISIONS
+
+# The detection of main as a graph of named stages. A stage is only computed when it (or a stage depending
+# on it) is requested, and its result is kept together with a key hashed from its parameters and the keys of
+# its inputs. Changing a parameter only changes the keys of the stages depending on it, so e.g. new edge
+# thresholds recompute the edges, but neither the loading nor the smoothing of the burn index.
+
+@dataclass
+class Bands:
+    b12: np.ndarray
+    b11: np.ndarray
+    b8a: np.ndarray
+    cm: Optional[np.ndarray] # cloud mask, None if not available
+    # The visible bands are only used normalized, the "normalized" stage loads them itself
+
+@dataclass
+class NormalizedBands:
+    b12: np.ndarray
+    b11: np.ndarray
+    b8a: np.ndarray
+    b04: np.ndarray
+    b03: np.ndarray
+    b02: np.ndarray
+    band_max: Tuple[float, ...] # maxima of the scaled bands B12, B11, B8A, B04, B03, B02
+
+@dataclass
+class FireMasks:
+    outer: np.ndarray
+    core: np.ndarray
+    final: np.ndarray # outer | core
+
+@dataclass
+class Regions:
+    labels: np.ndarray # int32, 0 is background
+    records: np.ndarray # fire_regions.REGION_DTYPE, one per label
+
+    @property
+    def amount(self) -> int:
+        return len(self.records)
+
+@dataclass
+class EdgeGradients:
+    sobely: np.ndarray
+    sobelx: np.ndarray
+    magnitude: np.ndarray
+
+@dataclass
+class BurntArea:
+    binary_edges_sobel: np.ndarray
+    dilated_edges: np.ndarray # dilated canny edges
+    combined_edges_opened: np.ndarray
+
+@dataclass
+class VisualProducts:
+    color: np.ndarray
+    infrared: np.ndarray
+    color_marked: np.ndarray # outer fire in red, core fire in yellow
+    color_marked_dilated: np.ndarray # dilated fire in red, to see small fires
+    labeled_fire: np.ndarray # random color for every region
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    function: Callable[..., Any]
+    inputs: Tuple[str, ...] = () # stages whose results are passed to function, in this order
+    params: Tuple[str, ...] = () # parameters passed to function as keywords, part of the key
+    settings: Tuple[str, ...] = () # like params, but they don't change the result (not part of the key)
+
+
+# Stacking the image
+def stack_img(band_1, band_2, band_3):
+    img = np.dstack((band_1, band_2, band_3)) # Stacking the bands
+    img /= np.percentile(img, 98) # Optimize contrast
+    np.clip(img, 0, 1, out=img) # Normalize
+    return img
+
+def _load(img: images.Image, down_scale_factor: int, precision: str, band_cache: Optional[BandCache]) -> Bands:
+    return Bands(*load_bands(img, ("b12", "b11", "b8a", "cm"), down_scale_factor=down_scale_factor, cache=band_cache, precision=precision))
+
+def _normalize(bands: Bands, img: images.Image, down_scale_factor: int, precision: str, band_cache: Optional[BandCache]) -> NormalizedBands:
+    # The infrared bands are used unnormalized by other stages and are copied. The visible bands are loaded here
+    # and normalized in place (normalize_band copies read-only cache entries), so no unnormalized copy of them is kept
+    dtype = PRECISIONS[precision]
+    visible = load_bands(img, ("b04", "b03", "b02"), down_scale_factor=down_scale_factor, cache=band_cache, precision=precision)
+    scene_bands = [band.astype(dtype) for band in (bands.b12, bands.b11, bands.b8a)] + visible
+    band_max = tuple(band.max() for band in scene_bands)
+    normalized = [normalize_band(band, band_max=value, dtype=dtype, in_place=True) for band, value in zip(scene_bands, band_max)]
+    return NormalizedBands(*normalized, band_max=band_max)
+
+def _fire_masks(normalized: NormalizedBands) -> FireMasks:
+    outer, core = detection.fire_masks(normalized.b12, normalized.b11, normalized.b8a, normalized.b04, normalized.b03, normalized.b02, normalized.band_max)
+    return FireMasks(outer, core, outer | core)
+
+def _regions(fire_masks: FireMasks, bands: Bands, down_scale_factor: int) -> Regions:
+    combined_region_opened = detection.prepare_regions(fire_masks.final)
+    return Regions(*fire_regions.region_stats(combined_region_opened, bands.b12, bands.b11, down_scale_factor))
+
+def _burning_area(fire_masks: FireMasks, down_scale_factor: int) -> float:
+    return detection.burning_area(fire_masks.final, down_scale_factor)
+
+def _burn_index(bands: Bands) -> np.ndarray:
+    return detection.burn_index(bands.b12, bands.b11, bands.b8a)
+
+def _edge_gradients(burn_index: np.ndarray) -> EdgeGradients:
+    return EdgeGradients(*detection.edge_gradients(burn_index))
+
+def _edge_thresholds(gradients: EdgeGradients, edge_thresholds: Optional[detection.EdgeThresholds]) -> detection.EdgeThresholds:
+    # Thresholds that are set explicitly replace the percentiles of the scene
+    return edge_thresholds if edge_thresholds is not None else detection.edge_thresholds(gradients.magnitude)
+
+def _burnt_area(gradients: EdgeGradients, thresholds: detection.EdgeThresholds) -> BurntArea:
+    return BurntArea(*detection.edges_from_gradients(gradients.sobely, gradients.sobelx, gradients.magnitude, thresholds))
+
+def _visual(normalized: NormalizedBands, fire_masks: FireMasks, regions: Regions) -> VisualProducts:
+    infrared = stack_img(normalized.b12, normalized.b11, normalized.b8a)
+    color = stack_img(normalized.b04, normalized.b03, normalized.b02)
+
+    # Mark the fire in the color image in red and yellow
+    color_marked = color.copy()
+    color_marked[fire_masks.outer > 0] = [1, 0, 0] # Mark the outer fire in red
+    color_marked[fire_masks.core > 0] = [1, 1, 0] # Mark the core fire in yellow
+
+    # Increasing the size of the fire marks for visualization
+    final_fire_mask_dilated = morphology.dilate(fire_masks.final, detection.VISUAL_DILATION_SIZE)
+    color_marked_dilated = color.copy()
+    color_marked_dilated[final_fire_mask_dilated > 0] = [1, 0, 0]
+
+    labeled_fire = sequential_regioning_cpp.colorize(regions.labels, regions.amount)
+    return VisualProducts(color, infrared, color_marked, color_marked_dilated, labeled_fire)
+
+STAGES: Dict[str, Stage] = {stage.name: stage for stage in [
+    Stage("bands", _load, params=("img", "down_scale_factor", "precision"), settings=("band_cache",)),
+    Stage("normalized", _normalize, inputs=("bands",), params=("img", "down_scale_factor", "precision"), settings=("band_cache",)),
+    Stage("fire_masks", _fire_masks, inputs=("normalized",)),
+    Stage("regions", _regions, inputs=("fire_masks", "bands"), params=("down_scale_factor",)),
+    Stage("burning_area", _burning_area, inputs=("fire_masks",), params=("down_scale_factor",)),
+    Stage("burn_index", _burn_index, inputs=("bands",)),
+    Stage("edge_gradients", _edge_gradients, inputs=("burn_index",)),
+    Stage("edge_thresholds", _edge_thresholds, inputs=("edge_gradients",), params=("edge_thresholds",)),
+    Stage("burnt_area", _burnt_area, inputs=("edge_gradients", "edge_thresholds")),
+    Stage("visual", _visual, inputs=("normalized", "fire_masks", "regions")),
+]}
+
+class Pipeline:
+    """
+    Lazily evaluated, memoized detection of one image.
+
+        pipeline = Pipeline(images.Flin_Flon)
+        pipeline.get("regions").amount # only loads, normalizes, detects and labels the fires
+        pipeline.update(edge_thresholds=thresholds)
+        pipeline.get("burnt_area") # reuses the bands, the burn index and its gradients
+
+    The last result of every stage is kept, results are returned as they are and must not be modified.
+    """
+
+    def __init__(self, img: images.Image, down_scale_factor: int = 1, precision: str = "float64",
+                 edge_thresholds: Optional[detection.EdgeThresholds] = None, band_cache: Optional[BandCache] = None):
+        self.params = {
+            "img": img,
+            "down_scale_factor": down_scale_factor,
+            "precision": precision,
+            "edge_thresholds": edge_thresholds,
+            "band_cache": band_cache,
+        }
+        self._results: Dict[str, Tuple[str, Any]] = {} # stage name -> (key, result)
+        self.computed: Dict[str, int] = {name: 0 for name in STAGES} # how often every stage was computed
+
+    def update(self, **params):
+        """
+        Changes parameters, the stages depending on them are recomputed when they are requested next.
+        """
+        unknown = set(params) - set(self.params)
+        if unknown:
+            raise ValueError(f"Unknown pipeline parameters: {sorted(unknown)}")
+        self.params.update(params)
+
+    def key(self, name: str) -> str:
+        """
+        Returns the key of the result of a stage for the current parameters, without computing anything.
+        """
+        stage = STAGES[name]
+        params = [(param, self.params[param]) for param in stage.params]
+        description = repr((name, params, [self.key(input_name) for input_name in stage.inputs]))
+        return hashlib.sha1(description.encode()).hexdigest()
+
+    def get(self, name: str) -> Any:
+        """
+        Returns the result of a stage, computing it and the stages it depends on only if their key changed.
+        """
+        if name not in STAGES:
+            raise KeyError(f"Unknown pipeline stage '{name}', expected one of {list(STAGES)}")
+        key = self.key(name)
+        result = self._results.get(name)
+        if result is not None and result[0] == key:
+            return result[1]
+
+        stage = STAGES[name]
+        inputs = [self.get(input_name) for input_name in stage.inputs]
+        kwargs = {param: self.params[param] for param in stage.params + stage.settings}
+        with profiling.stage(name) as record:
+            value = stage.function(*inputs, **kwargs)
+            record.output(value)
+        self._results[name] = (key, value)
+        self.computed[name] += 1
+        return value
+
+    def clear(self):
+        self._results.clear()
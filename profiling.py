@@ -0,0 +1,276 @@
+import dataclasses
+import json
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+# Opt-in measurement of the detection stages. The stages are wrapped in profiling.stage(name), which does nothing
+# unless profiling is enabled. Then every stage records its wall and CPU time, the peak resident memory of the
+# process while it ran, its growth (and that of the memory traced by tracemalloc, if enabled) above the start of the
+# stage and the sizes of the arrays it returns. The phases of the C++ labeling are recorded through sequential_regioning_cpp.set_timing_callback.
+#
+#     profiling.enable("profile.jsonl", "profile.trace.json")
+#     with profiling.stage("fire_masks") as record:
+#         fire_masks = detection.fire_masks(...)
+#         record.output(fire_masks)
+#     profiling.disable()
+#
+# Every finished stage is appended to the JSON lines file, the trace of all stages is written by disable() in the
+# Chrome trace event format (chrome://tracing or https://ui.perfetto.dev). The CPU time is the one of the whole
+# process, it includes the threads a stage starts (and those of stages running at the same time).
+
+def memory_kb(field: str) -> int:
+    """
+    Returns a field of /proc/self/status in kB, e.g. VmRSS or VmHWM (the peak resident memory).
+    """
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    raise KeyError(field)
+
+def reset_peak_memory() -> int:
+    """
+    Resets the peak resident memory to the current one and returns it in kB. ru_maxrss can't be used, Linux keeps
+    it across fork and exec, so a new process starts with the peak of its parent.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return memory_kb("VmRSS")
+    except OSError: # not Linux, the peak since the start of the process
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def peak_memory() -> int:
+    try:
+        return memory_kb("VmHWM")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def total_peak_memory() -> int:
+    """
+    Returns the peak resident memory in kB since the last reset_peak_memory, also while the stages of an enabled
+    profiler reset it.
+    """
+    peak = peak_memory()
+    if _profiler is not None:
+        peak = max(peak, _profiler.reset_peak_rss_kb)
+    return peak
+
+def array_sizes(value: Any, name: str = "") -> Dict[str, dict]:
+    """
+    Returns the shape, dtype and bytes of the arrays in a result: an array, a dataclass or a tuple of them.
+    """
+    if hasattr(value, "shape") and hasattr(value, "nbytes"):
+        return {name or "result": {"shape": list(value.shape), "dtype": str(value.dtype), "bytes": int(value.nbytes)}}
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        items = [(field.name, getattr(value, field.name)) for field in dataclasses.fields(value)]
+    elif isinstance(value, (tuple, list)):
+        items = [(str(i), item) for i, item in enumerate(value)]
+    else:
+        return {}
+    sizes = {}
+    for item_name, item in items:
+        sizes.update(array_sizes(item, f"{name}.{item_name}" if name else item_name))
+    return sizes
+
+class _Record:
+    # An open stage, the peaks are raised by stages of other threads resetting the peaks while it runs
+    def __init__(self, name: str, category: str, args: dict):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.arrays: Dict[str, dict] = {}
+        self.thread = threading.get_ident()
+        self.peak_rss_kb = 0
+        self.peak_traced = 0
+
+    def output(self, value: Any, name: str = ""):
+        """
+        Records the sizes of the arrays of a result of the stage.
+        """
+        self.arrays.update(array_sizes(value, name))
+
+    def set(self, **args):
+        self.args.update(args)
+
+class _NullRecord:
+    def output(self, value: Any, name: str = ""):
+        pass
+
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_RECORD = _NullRecord()
+
+class Profiler:
+    def __init__(self, jsonl_path: Optional[str] = None, trace_path: Optional[str] = None, trace_memory: bool = False):
+        self.jsonl_path = jsonl_path
+        self.trace_path = trace_path
+        self.trace_memory = trace_memory
+        self.events: List[dict] = []
+        self._open: List[_Record] = []
+        self._lock = threading.Lock()
+        self.reset_peak_rss_kb = 0 # the highest peak before the stages reset it
+        self._start_ns = time.perf_counter_ns()
+        self._jsonl = open(jsonl_path, "a") if jsonl_path else None
+        self._started_tracemalloc = trace_memory and not tracemalloc.is_tracing()
+        if self._started_tracemalloc:
+            tracemalloc.start()
+        try:
+            import sequential_regioning_cpp
+            # Offset of the clock of the C++ timings to perf_counter_ns
+            self._native_offset_ns = time.perf_counter_ns() - sequential_regioning_cpp.clock_ns()
+            sequential_regioning_cpp.set_timing_callback(self._native_phase)
+        except (ImportError, AttributeError): # not built, or built before the timings were added
+            self._native_offset_ns = None
+
+    def _reset_peaks(self) -> tuple:
+        # The peaks are process wide, before they are reset the current ones are passed on to all open stages
+        peak_rss_kb = peak_memory()
+        peak_traced = tracemalloc.get_traced_memory()[1] if self.trace_memory else 0
+        self.reset_peak_rss_kb = max(self.reset_peak_rss_kb, peak_rss_kb)
+        for record in self._open:
+            record.peak_rss_kb = max(record.peak_rss_kb, peak_rss_kb)
+            record.peak_traced = max(record.peak_traced, peak_traced)
+        rss_kb = reset_peak_memory()
+        traced = 0
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            traced = tracemalloc.get_traced_memory()[0]
+        return rss_kb, traced
+
+    @contextmanager
+    def run(self, record: _Record):
+        with self._lock:
+            rss_kb, traced = self._reset_peaks()
+            self._open.append(record)
+        start_ns = time.perf_counter_ns()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        finally:
+            cpu = time.process_time() - cpu_start
+            end_ns = time.perf_counter_ns()
+            with self._lock:
+                self._open.remove(record)
+                peak_rss_kb = max(record.peak_rss_kb, peak_memory())
+                peak_traced = max(record.peak_traced, tracemalloc.get_traced_memory()[1]) if self.trace_memory else 0
+                event = {
+                    "name": record.name,
+                    "category": record.category,
+                    "start_s": round((start_ns - self._start_ns) / 1e9, 6),
+                    "wall_s": round((end_ns - start_ns) / 1e9, 6),
+                    "cpu_s": round(cpu, 6),
+                    "rss_mb": round(rss_kb / 1024, 1),
+                    "peak_rss_delta_mb": round(max(peak_rss_kb - rss_kb, 0) / 1024, 1),
+                    "peak_rss_mb": round(peak_rss_kb / 1024, 1), # peak of the process while the stage ran
+                    "pid": os.getpid(),
+                    "thread": record.thread,
+                    **record.args,
+                }
+                if self.trace_memory:
+                    event["peak_traced_delta_mb"] = round(max(peak_traced - traced, 0) / 1024**2, 1)
+                if record.arrays:
+                    event["output_bytes"] = sum(size["bytes"] for size in record.arrays.values())
+                    event["arrays"] = record.arrays
+                self._add(event)
+
+    def _native_phase(self, name: str, start_ns: int, end_ns: int):
+        # Called by the C++ labeling after every phase, the phases don't measure memory or CPU time
+        with self._lock:
+            self._add({
+                "name": f"sequential_regioning_cpp.{name}",
+                "category": "native",
+                "start_s": round((start_ns + self._native_offset_ns - self._start_ns) / 1e9, 6),
+                "wall_s": round((end_ns - start_ns) / 1e9, 6),
+                "pid": os.getpid(),
+                "thread": threading.get_ident(),
+            })
+
+    def _add(self, event: dict):
+        self.events.append(event)
+        if self._jsonl is not None:
+            self._jsonl.write(json.dumps(event) + "\n")
+            self._jsonl.flush()
+
+    def trace(self) -> dict:
+        """
+        Returns the stages as Chrome trace events, one complete event ("X") per stage.
+        """
+        events = []
+        for event in self.events:
+            args = {key: value for key, value in event.items() if key not in ("name", "category", "start_s", "wall_s", "pid", "thread")}
+            events.append({"name": event["name"], "cat": event["category"], "ph": "X", "ts": event["start_s"] * 1e6,
+                           "dur": event["wall_s"] * 1e6, "pid": event["pid"], "tid": event["thread"], "args": args})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def close(self):
+        if self._native_offset_ns is not None:
+            import sequential_regioning_cpp
+            sequential_regioning_cpp.set_timing_callback(None)
+        if self._jsonl is not None:
+            self._jsonl.close()
+        if self.trace_path:
+            with open(self.trace_path, "w") as f:
+                json.dump(self.trace(), f)
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+
+_profiler: Optional[Profiler] = None
+
+def enable(jsonl_path: Optional[str] = None, trace_path: Optional[str] = None, trace_memory: bool = False) -> Profiler:
+    """
+    Starts recording the stages to the JSON lines file (appended) and the trace file (written by disable).
+    trace_memory also traces the Python and numpy allocations with tracemalloc, which slows down Python code.
+    """
+    global _profiler
+    disable()
+    _profiler = Profiler(jsonl_path, trace_path, trace_memory)
+    return _profiler
+
+def disable() -> Optional[Profiler]:
+    """
+    Stops recording, writes the trace file and returns the profiler with its events.
+    """
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is not None:
+        profiler.close()
+    return profiler
+
+def _disable_in_child():
+    # Forked workers (e.g. of the tiled detection) don't write to the files of their parent
+    global _profiler
+    if _profiler is not None:
+        _profiler = None
+        try:
+            import sequential_regioning_cpp
+            sequential_regioning_cpp.set_timing_callback(None)
+        except (ImportError, AttributeError):
+            pass
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_disable_in_child)
+
+def enabled() -> bool:
+    return _profiler is not None
+
+def stage(name: str, category: str = "stage", **args):
+    """
+    Context manager recording a stage, the keywords are stored with it. It yields a record, whose output(value)
+    stores the sizes of the arrays of a result. Without profiling, the same do-nothing record is returned.
+    """
+    if _profiler is None:
+        return _NULL_RECORD
+    return _profiler.run(_Record(name, category, args))
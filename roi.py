@@ -0,0 +1,165 @@
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+import numpy as np
+from scipy import ndimage
+import images
+import detection
+import fire_regions
+import profiling
+from bands import load_raw_band, normalize_band, SCALING
+from tiling import Tile, merge_regions
+
+# Region of interest fire detection: the fires cover a tiny part of a scene, so the outer fire threshold of B12
+# marks candidate blocks and only windows around them go through the fire detection and the regioning, a scene
+# without candidates is done after the gate.
+#
+# The thresholds depend on the band ranges of the whole scene, so every band is decoded once at full resolution
+# and kept with its stored uint16 values, which the windows are cut from. The gate is the exact outer fire test
+# of the full scene and the windows cover everything the detection of a candidate reaches, so the fire masks and
+# regions are those of the full scene (benchmark_roi.py compares them). A reduced JP2 resolution level can't be
+# used for the gate or the ranges: it averages small fires below the threshold, and the wavelet filter of JP2
+# over- and undershoots at sharp edges like fires, so its extremes aren't those of the scene.
+
+ROI_BLOCK_SIZE = 256
+# MSK_CLDPRB is the cloud probability in percent, fires below fully certain clouds aren't visible
+CLOUD_SATURATED = 100
+
+@dataclass
+class RoiResult:
+    final_fire_mask: np.ndarray
+    labeled_fire: np.ndarray # int32 labels, 0 is background
+    amount_regions: int
+    regions: np.ndarray # fire_regions.REGION_DTYPE records, one per label
+    burning_area: float # km^2
+    windows: List[Tile] # the parts of the scene processed at full resolution, without the halo
+    processed_share: float # share of the scene inside the windows
+
+def outer_fire_gate(b12_min: float, b12_max: float) -> int:
+    """
+    Returns the smallest stored B12 value that passes the outer fire test (b12_norm > 0.6 / b12_max) of the
+    normalized band, 65536 if no value does. The values are normalized like the band, so the gate is exact.
+    """
+    values = normalize_band(np.arange(65536) / SCALING, b12_min, b12_max)
+    passing = np.flatnonzero(values > 0.6 / b12_max)
+    return int(passing[0]) if len(passing) else 65536
+
+def candidate_blocks(b12: np.ndarray, cm: Optional[np.ndarray], gate: int) -> np.ndarray:
+    """
+    Returns the blocks (ROI_BLOCK_SIZE) with candidates of the outer fire in the stored values of B12.
+    """
+    candidates = b12 >= gate
+    if cm is not None:
+        candidates &= cm < CLOUD_SATURATED
+    blocks = np.zeros((-(-b12.shape[0] // ROI_BLOCK_SIZE), -(-b12.shape[1] // ROI_BLOCK_SIZE)), bool)
+    rows, cols = np.nonzero(candidates)
+    blocks[rows // ROI_BLOCK_SIZE, cols // ROI_BLOCK_SIZE] = True
+    return blocks
+
+def candidate_windows(blocks: np.ndarray, shape: Tuple[int, int]) -> List[Tile]:
+    """
+    Returns disjoint windows covering the candidate blocks and everything their fire detection can reach.
+    """
+    # The closing of the outer fire and the region morphology reach up to fire_halo past a candidate
+    reach = -(-detection.fire_halo() // ROI_BLOCK_SIZE)
+    blocks = ndimage.binary_dilation(blocks, np.ones((3, 3), bool), iterations=reach) if blocks.any() else blocks
+    boxes = [[s[0].start, s[1].start, s[0].stop, s[1].stop] for s in ndimage.find_objects(ndimage.label(blocks, np.ones((3, 3)))[0])]
+
+    # Bounding boxes of neighbouring groups can overlap, they are merged until all windows are disjoint
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                a, b = boxes[i], boxes[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    boxes[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del boxes[j]
+                    merged = True
+                    break
+            if merged:
+                break
+
+    windows = []
+    for row_start, col_start, row_end, col_end in boxes:
+        row, col = row_start * ROI_BLOCK_SIZE, col_start * ROI_BLOCK_SIZE
+        windows.append(Tile(row, col, min(row_end * ROI_BLOCK_SIZE, shape[0]) - row, min(col_end * ROI_BLOCK_SIZE, shape[1]) - col))
+    return windows
+
+def _detect_window(bands, tile: Tile, shape, band_min, band_max, halo: int):
+    # The fire detection of main on a window read with the halo, only its core is kept (like tiling._detect_tile)
+    b12, b11 = bands[0], bands[1]
+    core = tile.core(shape, halo)
+    normalized = [normalize_band(band, low, high) for band, low, high in zip(bands, band_min, band_max)]
+    outer_fire_mask, core_fire_mask = detection.fire_masks(*normalized, band_max)
+    del normalized
+    final_fire_mask = outer_fire_mask | core_fire_mask
+
+    combined_region_opened = detection.prepare_regions(final_fire_mask)[core]
+    labeled_fire, amount_regions, region_stats = fire_regions.label_regions(combined_region_opened, b12[core], b11[core], n8=True)
+    region_stats = fire_regions.shift_raw_stats(region_stats, tile.row, tile.col)
+    return final_fire_mask[core], labeled_fire, amount_regions, region_stats
+
+def _read_raw(paths) -> List[np.ndarray]:
+    # The stored values of the whole scene, decoded concurrently (rasterio releases the GIL while decoding)
+    with ThreadPoolExecutor(max_workers=len(paths)) as executor:
+        return list(executor.map(load_raw_band, paths))
+
+def detect_roi(img: images.Image) -> RoiResult:
+    """
+    Runs the fire detection and regioning only in windows around the fire candidates of the gate (see above),
+    with the band ranges of the whole scene.
+    """
+    paths = images.get_band_paths(img)
+    band_paths = paths[:7] if images.has_cloud_mask(img) else paths[:6]
+
+    with profiling.stage("roi.read_bands") as record:
+        raw_bands = _read_raw(band_paths)
+        record.output(raw_bands, "raw")
+    raw_bands, cm = raw_bands[:6], raw_bands[6] if len(raw_bands) > 6 else None
+    shape = raw_bands[0].shape
+    band_min = tuple(band.min() / SCALING for band in raw_bands) # scaling keeps the order of the values
+    band_max = tuple(band.max() / SCALING for band in raw_bands)
+
+    with profiling.stage("roi.gate") as record:
+        blocks = candidate_blocks(raw_bands[0], cm, outer_fire_gate(band_min[0], band_max[0]))
+        record.set(candidate_blocks=int(blocks.sum()))
+    del cm
+
+    final_fire_mask = np.zeros(shape, np.uint8)
+    labeled_fire = np.zeros(shape, np.int32)
+    windows = candidate_windows(blocks, shape)
+    if not windows:
+        return RoiResult(final_fire_mask, labeled_fire, 0, np.zeros(0, fire_regions.REGION_DTYPE), 0.0, [], 0.0)
+
+    halo = detection.fire_halo()
+    amount_labels = 0
+    region_stats = []
+    for tile in windows:
+        with profiling.stage("roi.detect_window", row=tile.row, col=tile.col, height=tile.height, width=tile.width) as record:
+            window = tile.window(shape, halo).toslices()
+            bands = [band[window] / SCALING for band in raw_bands]
+            record.output(bands, "bands")
+            fire, labels, amount, stats_of_window = _detect_window(bands, tile, shape, band_min, band_max, halo)
+            del bands
+        rows, cols = slice(tile.row, tile.row + tile.height), slice(tile.col, tile.col + tile.width)
+        final_fire_mask[rows, cols] = fire
+        labels[labels > 0] += amount_labels # unique labels over all windows
+        labeled_fire[rows, cols] = labels
+        region_stats.append(stats_of_window)
+        amount_labels += amount
+    del raw_bands
+
+    with profiling.stage("roi.merge_regions") as record:
+        amount_regions, components = merge_regions(labeled_fire, windows, amount_labels)
+        regions = fire_regions.region_records(fire_regions.merge_raw_stats(region_stats, components, amount_regions))
+        record.set(regions=amount_regions)
+    return RoiResult(
+        final_fire_mask=final_fire_mask,
+        labeled_fire=labeled_fire,
+        amount_regions=amount_regions,
+        regions=regions,
+        burning_area=detection.burning_area(final_fire_mask),
+        windows=windows,
+        processed_share=sum(tile.height * tile.width for tile in windows) / (shape[0] * shape[1]),
+    )
@@ -2,164 +2,522 @@
 #include <pybind11/numpy.h>
 #include <pybind11/stl.h>
 #include <vector>
-#include <set>
-#include <map>
-#include <numeric>
 #include <random>
 #include <algorithm>
 #include <chrono>
-#include <iostream>
+#include <thread>
+#include <cstdint>
+#include <limits>
 
 namespace py = pybind11;
 
+// Durations of the phases of the labeling, passed to the callback set with set_timing_callback (see profiling.py).
+// The phases run without the GIL, so they are collected first and reported once the GIL is held again.
+// Without a callback nothing is measured.
+static py::object *timing_callback = nullptr;
+
+static int64_t clock_ns()
+{
+    return std::chrono::duration_cast<std::chrono::nanoseconds>(std::chrono::steady_clock::now().time_since_epoch()).count();
+}
+
+struct Timings
+{
+    bool enabled = timing_callback != nullptr;
+    std::vector<std::tuple<const char *, int64_t, int64_t>> phases; // name, start and end in clock_ns
+
+    // Ends the phase started at start and returns the start of the next one
+    int64_t add(const char *name, int64_t start)
+    {
+        if (!enabled)
+            return 0;
+        int64_t end = clock_ns();
+        phases.emplace_back(name, start, end);
+        return end;
+    }
+
+    int64_t start() const { return enabled ? clock_ns() : 0; }
+
+    void report()
+    {
+        if (timing_callback != nullptr)
+            for (auto &[name, start, end] : phases)
+                (*timing_callback)(name, start, end);
+        phases.clear();
+    }
+};
+
+// Flat union-find over provisional labels. The root of a set is always its smallest label
+// (larger roots are linked to smaller ones), so parent[i] <= i holds for every label.
+// Label 0 is the background.
 struct UnionFind
 {
-    std::vector<int> parent;
+    std::vector<int32_t> parent;
+
+    UnionFind() : parent(1, 0) {}
 
-    UnionFind(int n)
+    int32_t make_label()
     {
-        parent.resize(n);
-        std::iota(parent.begin(), parent.end(), 0);
+        int32_t label = static_cast<int32_t>(parent.size());
+        parent.push_back(label);
+        return label;
     }
 
-    int find(int i)
+    int32_t find(int32_t i)
     {
-        if (parent[i] == i)
-            return i;
-        return parent[i] = find(parent[i]); // Path compression
+        int32_t *p = parent.data();
+        int32_t root = i;
+        while (p[root] != root)
+            root = p[root];
+        while (p[i] != root) // Path compression
+        {
+            int32_t next = p[i];
+            p[i] = root;
+            i = next;
+        }
+        return root;
     }
 
-    void unite(int i, int j)
+    int32_t unite(int32_t i, int32_t j)
     {
-        int root_i = find(i);
-        int root_j = find(j);
-        if (root_i != root_j)
+        int32_t root_i = find(i);
+        int32_t root_j = find(j);
+        if (root_i < root_j)
         {
-            parent[root_i] = root_j;
+            parent[root_j] = root_i;
+            return root_i;
         }
+        parent[root_i] = root_j;
+        return root_j;
+    }
+
+    // Turns the parents into consecutive final labels (1..n, in order of the first pixel of every region)
+    // and returns n. Works in one pass, since every parent is smaller than its child.
+    int32_t flatten()
+    {
+        int32_t *p = parent.data();
+        int32_t count = 0;
+        for (size_t i = 1; i < parent.size(); ++i)
+            p[i] = (p[i] == static_cast<int32_t>(i)) ? ++count : p[p[i]];
+        return count;
     }
 };
 
-std::tuple<py::array_t<uint16_t>, size_t> sequential_regioning_cpp(py::array_t<uint16_t> img_py_in, bool n8, int random_seed)
+// Intensity image whose maximum is collected per region, float32 images are read without a conversion
+struct Intensity
 {
-    auto start_time = std::chrono::high_resolution_clock::now();
+    const void *data;
+    bool single_precision;
 
-    // Request buffer info from the input array
-    py::buffer_info buf_in = img_py_in.request();
-    if (buf_in.ndim != 2)
+    double operator[](py::ssize_t index) const
     {
-        throw std::runtime_error("Input image must be 2-dimensional.");
+        return single_precision ? static_cast<const float *>(data)[index] : static_cast<const double *>(data)[index];
+    }
+};
+
+// Statistics of the pixels of every label, collected while labeling. They are indexed like the
+// union-find, so the statistics of the provisional labels are merged into their final labels afterwards.
+struct RegionStats
+{
+    std::vector<Intensity> intensities; // images of the size of the labeled image, their maximum is collected
+    std::vector<int64_t> pixels;
+    std::vector<double> sum_row, sum_col;
+    std::vector<int32_t> row_min, col_min, row_max, col_max;
+    std::vector<double> max_intensity; // intensities.size() values per label
+
+    explicit RegionStats(std::vector<Intensity> intensities) : intensities(std::move(intensities))
+    {
+        add_label(); // background
+    }
+
+    size_t size() const { return pixels.size(); }
+
+    void add_label()
+    {
+        pixels.push_back(0);
+        sum_row.push_back(0);
+        sum_col.push_back(0);
+        row_min.push_back(std::numeric_limits<int32_t>::max());
+        col_min.push_back(std::numeric_limits<int32_t>::max());
+        row_max.push_back(-1);
+        col_max.push_back(-1);
+        max_intensity.resize(max_intensity.size() + intensities.size(), -std::numeric_limits<double>::infinity());
     }
 
-    py::ssize_t height = buf_in.shape[0];
-    py::ssize_t width = buf_in.shape[1];
+    void add_pixel(int32_t label, py::ssize_t v, py::ssize_t u, py::ssize_t index)
+    {
+        pixels[label] += 1;
+        sum_row[label] += v;
+        sum_col[label] += u;
+        row_min[label] = std::min(row_min[label], static_cast<int32_t>(v));
+        col_min[label] = std::min(col_min[label], static_cast<int32_t>(u));
+        row_max[label] = std::max(row_max[label], static_cast<int32_t>(v));
+        col_max[label] = std::max(col_max[label], static_cast<int32_t>(u));
+        double *maxima = max_intensity.data() + label * intensities.size();
+        for (size_t k = 0; k < intensities.size(); ++k)
+            maxima[k] = std::max(maxima[k], intensities[k][index]);
+    }
 
-    // Create a mutable copy of the input image for labeling
-    // This explicitly creates a new array and copies the data, ensuring it's writable.
-    py::array_t<uint16_t> img_labels({height, width});
-    std::memcpy(static_cast<uint16_t *>(img_labels.request().ptr),
-                static_cast<const uint16_t *>(buf_in.ptr),
-                height * width * sizeof(uint16_t));
+    // Adds the statistics of label `from` of other to label `to`
+    void merge(size_t to, const RegionStats &other, size_t from)
+    {
+        pixels[to] += other.pixels[from];
+        sum_row[to] += other.sum_row[from];
+        sum_col[to] += other.sum_col[from];
+        row_min[to] = std::min(row_min[to], other.row_min[from]);
+        col_min[to] = std::min(col_min[to], other.col_min[from]);
+        row_max[to] = std::max(row_max[to], other.row_max[from]);
+        col_max[to] = std::max(col_max[to], other.col_max[from]);
+        for (size_t k = 0; k < intensities.size(); ++k)
+            max_intensity[to * intensities.size() + k] = std::max(max_intensity[to * intensities.size() + k], other.max_intensity[from * intensities.size() + k]);
+    }
 
-    int next_label = 2;
-    std::vector<std::pair<int, int>> equivalences;
+    // Returns the statistics of the final labels, final_labels maps every provisional label to its final label
+    RegionStats reduce(const int32_t *final_labels, int32_t count) const
+    {
+        RegionStats reduced(intensities);
+        for (int32_t i = 0; i < count; ++i)
+            reduced.add_label();
+        for (size_t i = 1; i < size(); ++i)
+            reduced.merge(final_labels[i], *this, i);
+        return reduced;
+    }
+};
 
-    for (py::ssize_t v = 0; v < height; ++v)
+// First pass over the rows [row_start, row_end): assigns provisional labels to the foreground pixels
+// and records which of them touch. Pixels above row_start are not looked at.
+template <typename T>
+static void label_rows(const T *img, int32_t *labels, py::ssize_t width, py::ssize_t row_start, py::ssize_t row_end, bool n8, UnionFind &uf, RegionStats *stats)
+{
+    for (py::ssize_t v = row_start; v < row_end; ++v)
     {
+        const T *img_row = img + v * width;
+        int32_t *row = labels + v * width;
+        const int32_t *up = (v > row_start) ? row - width : nullptr;
+
         for (py::ssize_t u = 0; u < width; ++u)
         {
-            if (img_labels.at(v, u) == 1)
+            if (img_row[u] == 0)
             {
-                std::set<int> neighbors_labels;
+                row[u] = 0;
+                continue;
+            }
 
-                if (u > 0 && img_labels.at(v, u - 1) > 1) // Left
-                    neighbors_labels.insert(img_labels.at(v, u - 1));
-                if (v > 0 && img_labels.at(v - 1, u) > 1) // Top
-                    neighbors_labels.insert(img_labels.at(v - 1, u));
+            int32_t label = 0;
+            auto merge = [&](int32_t neighbor) {
+                if (neighbor == 0)
+                    return;
+                label = (label == 0) ? neighbor : uf.unite(label, neighbor);
+            };
 
+            if (u > 0)
+                merge(row[u - 1]); // Left
+            if (up)
+            {
+                merge(up[u]); // Top
                 if (n8)
                 {
-                    if (v > 0 && u > 0 && img_labels.at(v - 1, u - 1) > 1) // Top-Left
-                        neighbors_labels.insert(img_labels.at(v - 1, u - 1));
-                    if (v > 0 && u < width - 1 && img_labels.at(v - 1, u + 1) > 1) // Top-Right
-                        neighbors_labels.insert(img_labels.at(v - 1, u + 1));
-                }
-
-                if (neighbors_labels.empty())
-                {
-                    img_labels.mutable_at(v, u) = next_label++;
-                }
-                else
-                {
-                    int min_label = *neighbors_labels.begin();
-                    img_labels.mutable_at(v, u) = min_label;
-
-                    // Record equivalences if multiple neighbor labels are found
-                    for (int label : neighbors_labels)
-                    {
-                        if (label != min_label)
-                        {
-                            equivalences.push_back({min_label, label});
-                        }
-                    }
+                    if (u > 0)
+                        merge(up[u - 1]); // Top-Left
+                    if (u < width - 1)
+                        merge(up[u + 1]); // Top-Right
                 }
             }
+            if (label == 0)
+            {
+                label = uf.make_label();
+                if (stats)
+                    stats->add_label();
+            }
+            row[u] = label;
+            if (stats)
+                stats->add_pixel(label, v, u, v * width + u);
         }
     }
+}
+
+template <typename T>
+static int32_t label_image(const T *img, int32_t *labels, py::ssize_t height, py::ssize_t width, bool n8, int num_threads, Timings &timings, RegionStats *stats = nullptr)
+{
+    int64_t start = timings.start();
+    if (num_threads <= 0)
+        num_threads = std::max(1u, std::thread::hardware_concurrency());
+    num_threads = static_cast<int>(std::min<py::ssize_t>(num_threads, std::max<py::ssize_t>(height, 1)));
 
-    UnionFind uf(next_label); // next_label is the size needed for UF (max label + 1)
-    for (const auto &col : equivalences)
+    if (num_threads == 1)
     {
-        uf.unite(col.first, col.second);
+        UnionFind uf;
+        label_rows(img, labels, width, 0, height, n8, uf, stats);
+        start = timings.add("label_rows", start);
+        int32_t count = uf.flatten();
+        const int32_t *final_labels = uf.parent.data();
+        for (py::ssize_t i = 0; i < height * width; ++i)
+            labels[i] = final_labels[labels[i]];
+        if (stats)
+            *stats = stats->reduce(final_labels, count);
+        timings.add("relabel", start);
+        return count;
     }
 
-    // Collect unique representative labels and assign colors
-    std::map<int, std::vector<uint16_t>> representative_to_color;
-    std::mt19937 gen(random_seed);
-    std::uniform_int_distribution<> distrib(50, 255);
+    // Block-parallel mode: every thread labels a strip of rows with its own union-find
+    std::vector<py::ssize_t> strip_start(num_threads + 1);
+    for (int t = 0; t <= num_threads; ++t)
+        strip_start[t] = height * t / num_threads;
 
-    py::array_t<uint16_t> out_img_py({height, width, (py::ssize_t)3});
+    std::vector<UnionFind> strips(num_threads);
+    std::vector<RegionStats> strip_stats(stats ? num_threads : 0, RegionStats(stats ? stats->intensities : std::vector<Intensity>()));
+    std::vector<std::thread> threads;
+    for (int t = 0; t < num_threads; ++t)
+        threads.emplace_back([&, t] { label_rows(img, labels, width, strip_start[t], strip_start[t + 1], n8, strips[t], stats ? &strip_stats[t] : nullptr); });
+    for (auto &thread : threads)
+        thread.join();
+    threads.clear();
+    start = timings.add("label_rows", start);
 
-    std::set<int> unique_root_labels;
+    // Joining the union-finds, the labels of strip t are shifted behind the labels of the strips before
+    std::vector<int32_t> offsets(num_threads, 0);
+    UnionFind uf;
+    for (int t = 0; t < num_threads; ++t)
+    {
+        offsets[t] = static_cast<int32_t>(uf.parent.size()) - 1;
+        for (size_t i = 1; i < strips[t].parent.size(); ++i)
+            uf.parent.push_back(strips[t].parent[i] + offsets[t]);
+        strips[t].parent = std::vector<int32_t>();
+        if (stats)
+        {
+            for (size_t i = 1; i < strip_stats[t].size(); ++i)
+            {
+                stats->add_label();
+                stats->merge(stats->size() - 1, strip_stats[t], i);
+            }
+        }
+    }
+    for (int t = 1; t < num_threads; ++t)
+        threads.emplace_back([&, t] {
+            for (py::ssize_t i = strip_start[t] * width; i < strip_start[t + 1] * width; ++i)
+                if (labels[i] != 0)
+                    labels[i] += offsets[t];
+        });
+    for (auto &thread : threads)
+        thread.join();
+    threads.clear();
 
-    // Second Pass: Relabeling and Coloring
-    for (py::ssize_t v = 0; v < height; ++v)
+    // Merging the regions that touch along the strip borders
+    for (int t = 1; t < num_threads; ++t)
     {
+        py::ssize_t v = strip_start[t];
+        if (v == strip_start[t - 1] || v >= height)
+            continue;
+        const int32_t *row = labels + v * width;
+        const int32_t *up = row - width;
         for (py::ssize_t u = 0; u < width; ++u)
         {
-            uint16_t current_label = img_labels.at(v, u);
-
-            if (current_label > 1)
+            if (row[u] == 0)
+                continue;
+            if (up[u] != 0)
+                uf.unite(row[u], up[u]);
+            if (n8)
             {
-                int representative_label = uf.find(current_label);
-                unique_root_labels.insert(representative_label); // Track unique roots for final count
+                if (u > 0 && up[u - 1] != 0)
+                    uf.unite(row[u], up[u - 1]);
+                if (u < width - 1 && up[u + 1] != 0)
+                    uf.unite(row[u], up[u + 1]);
+            }
+        }
+    }
 
-                if (representative_to_color.find(representative_label) == representative_to_color.end())
-                {
-                    representative_to_color[representative_label] = {
-                        static_cast<uint16_t>(distrib(gen)),
-                        static_cast<uint16_t>(distrib(gen)),
-                        static_cast<uint16_t>(distrib(gen))};
-                }
+    int32_t count = uf.flatten();
+    start = timings.add("merge_strips", start);
+    const int32_t *final_labels = uf.parent.data();
+    for (int t = 0; t < num_threads; ++t)
+        threads.emplace_back([&, t] {
+            for (py::ssize_t i = strip_start[t] * width; i < strip_start[t + 1] * width; ++i)
+                labels[i] = final_labels[labels[i]];
+        });
+    for (auto &thread : threads)
+        thread.join();
+    if (stats)
+        *stats = stats->reduce(final_labels, count);
+    timings.add("relabel", start);
+    return count;
+}
 
-                out_img_py.mutable_at(v, u, 0) = representative_to_color[representative_label][0];
-                out_img_py.mutable_at(v, u, 1) = representative_to_color[representative_label][1];
-                out_img_py.mutable_at(v, u, 2) = representative_to_color[representative_label][2];
-            }
+template <typename T>
+std::tuple<py::array_t<int32_t>, size_t> label(py::array_t<T, py::array::c_style | py::array::forcecast> img_py, bool n8, int num_threads)
+{
+    py::buffer_info buf = img_py.request();
+    if (buf.ndim != 2)
+    {
+        throw std::runtime_error("Input image must be 2-dimensional.");
+    }
+
+    py::ssize_t height = buf.shape[0];
+    py::ssize_t width = buf.shape[1];
+    py::array_t<int32_t> labels_py({height, width});
+    const T *img = static_cast<const T *>(buf.ptr);
+    int32_t *labels = static_cast<int32_t *>(labels_py.request().ptr);
+
+    Timings timings;
+    int32_t count;
+    {
+        py::gil_scoped_release release;
+        count = label_image(img, labels, height, width, n8, num_threads, timings);
+    }
+    timings.report();
+    return std::make_tuple(labels_py, static_cast<size_t>(count));
+}
+
+template <typename T>
+std::tuple<py::array_t<int32_t>, size_t, py::dict> label_stats(py::array_t<T, py::array::c_style | py::array::forcecast> img_py, std::vector<py::array> intensities_py, bool n8, int num_threads)
+{
+    py::buffer_info buf = img_py.request();
+    if (buf.ndim != 2)
+    {
+        throw std::runtime_error("Input image must be 2-dimensional.");
+    }
+
+    py::ssize_t height = buf.shape[0];
+    py::ssize_t width = buf.shape[1];
+    std::vector<Intensity> intensities;
+    for (auto &intensity_py : intensities_py)
+    {
+        using Float = py::array_t<float, py::array::c_style>;
+        bool single_precision = Float::check_(intensity_py);
+        if (!single_precision) // the converted image is kept alive in intensities_py
+        {
+            intensity_py = py::array_t<double, py::array::c_style | py::array::forcecast>::ensure(intensity_py);
+            if (!intensity_py)
+                throw py::error_already_set();
         }
+        if (intensity_py.ndim() != 2 || intensity_py.shape(0) != height || intensity_py.shape(1) != width)
+        {
+            throw std::runtime_error("Intensity images must have the shape of the input image.");
+        }
+        intensities.push_back({intensity_py.data(), single_precision});
     }
-    size_t num_regions = unique_root_labels.size();
-    auto end_time = std::chrono::high_resolution_clock::now();
-    auto elapsed_ms = std::chrono::duration_cast<std::chrono::milliseconds>(end_time - start_time);
 
-    std::cout << "sequential regioning:     Regions found: " << num_regions << std::endl;
-    std::cout << "sequential regioning:     Elapsed time: " << elapsed_ms.count() << " milliseconds" << std::endl;
+    py::array_t<int32_t> labels_py({height, width});
+    const T *img = static_cast<const T *>(buf.ptr);
+    int32_t *labels = static_cast<int32_t *>(labels_py.request().ptr);
+
+    RegionStats stats(intensities);
+    Timings timings;
+    int32_t count;
+    {
+        py::gil_scoped_release release;
+        count = label_image(img, labels, height, width, n8, num_threads, timings, &stats);
+    }
+    timings.report();
+
+    // Statistics of the regions 1..n, the background is dropped
+    auto region_array = [count](const auto &values) {
+        using V = typename std::decay_t<decltype(values)>::value_type;
+        py::array_t<V> out(count);
+        std::copy(values.begin() + 1, values.end(), out.mutable_data());
+        return out;
+    };
+    const py::ssize_t num_intensities = static_cast<py::ssize_t>(intensities.size());
+    py::array_t<double> max_intensity({static_cast<py::ssize_t>(count), num_intensities});
+    std::copy(stats.max_intensity.begin() + num_intensities, stats.max_intensity.end(), max_intensity.mutable_data());
+
+    py::dict stats_py;
+    stats_py["pixels"] = region_array(stats.pixels);
+    stats_py["sum_row"] = region_array(stats.sum_row);
+    stats_py["sum_col"] = region_array(stats.sum_col);
+    stats_py["row_min"] = region_array(stats.row_min);
+    stats_py["col_min"] = region_array(stats.col_min);
+    stats_py["row_max"] = region_array(stats.row_max);
+    stats_py["col_max"] = region_array(stats.col_max);
+    stats_py["max_intensity"] = max_intensity;
+    return std::make_tuple(labels_py, static_cast<size_t>(count), stats_py);
+}
+
+py::array_t<uint16_t> colorize(py::array_t<int32_t, py::array::c_style | py::array::forcecast> labels_py, size_t num_regions, int random_seed)
+{
+    py::buffer_info buf = labels_py.request();
+    if (buf.ndim != 2)
+    {
+        throw std::runtime_error("Label image must be 2-dimensional.");
+    }
+
+    py::ssize_t height = buf.shape[0];
+    py::ssize_t width = buf.shape[1];
+    const int32_t *labels = static_cast<const int32_t *>(buf.ptr);
+
+    // Random colors for every region, in the order of the labels (the order of the first pixel of the regions)
+    std::mt19937 gen(random_seed);
+    std::uniform_int_distribution<> distrib(50, 255);
+    std::vector<uint16_t> colors(3 * (num_regions + 1), 0);
+    for (size_t i = 3; i < colors.size(); ++i)
+        colors[i] = static_cast<uint16_t>(distrib(gen));
+
+    py::array_t<uint16_t> out_img_py({height, width, (py::ssize_t)3});
+    uint16_t *out = static_cast<uint16_t *>(out_img_py.request().ptr);
+    Timings timings;
+    int64_t start = timings.start();
+    {
+        py::gil_scoped_release release;
+        for (py::ssize_t i = 0; i < height * width; ++i)
+        {
+            int32_t label = labels[i];
+            if (label < 0 || static_cast<size_t>(label) > num_regions)
+                label = 0;
+            std::copy_n(colors.data() + 3 * label, 3, out + 3 * i);
+        }
+    }
+    timings.add("colorize", start);
+    timings.report();
+    return out_img_py;
+}
+
+std::tuple<py::array_t<uint16_t>, size_t> sequential_regioning_cpp(py::array_t<uint16_t, py::array::c_style | py::array::forcecast> img_py_in, bool n8, int random_seed)
+{
+    auto [labels, num_regions] = label<uint16_t>(img_py_in, n8, 1);
+    py::array_t<uint16_t> out_img_py = colorize(labels, num_regions, random_seed);
     return std::make_tuple(out_img_py, num_regions);
 }
 
+// Binary images of other types are converted to a uint8 mask first, a cast would make e.g. 256 or 0.5 background
+static py::array_t<uint8_t, py::array::c_style | py::array::forcecast> foreground(py::object img)
+{
+    return py::module_::import("numpy").attr("not_equal")(img, 0).cast<py::array_t<uint8_t, py::array::c_style | py::array::forcecast>>();
+}
+
 PYBIND11_MODULE(sequential_regioning_cpp, m)
 {
     m.doc() = "A fast C++ implementation of sequential regioning, callable from Python.";
-    m.def("run", &sequential_regioning_cpp, "Performs sequential regioning on a 2D numpy array.",
+    m.def("run", &sequential_regioning_cpp, "Performs sequential regioning on a 2D numpy array and returns a colored image.",
           py::arg("img"), py::arg("n8"), py::arg("random_seed") = 20);
-}
\ No newline at end of file
+
+    // Binary images of the common mask types are labeled without a copy, everything else is converted to a uint8 mask
+    const char *label_doc = "Labels the regions of a binary 2D numpy array (non-zero is foreground).\n"
+                            "Returns an int32 label image (0 is background, regions are 1..n in order of their first pixel) and n.\n"
+                            "num_threads > 1 labels strips of rows in parallel and merges them along their borders (0 uses all cores).";
+    m.def("label", &label<uint8_t>, label_doc, py::arg("img").noconvert(), py::arg("n8") = true, py::arg("num_threads") = 1);
+    m.def("label", &label<uint16_t>, label_doc, py::arg("img").noconvert(), py::arg("n8") = true, py::arg("num_threads") = 1);
+    m.def("label", [](py::object img, bool n8, int num_threads) { return label<uint8_t>(foreground(img), n8, num_threads); },
+          label_doc, py::arg("img"), py::arg("n8") = true, py::arg("num_threads") = 1);
+
+    const char *label_stats_doc = "Labels like label and collects the statistics of every region in the same pass.\n"
+                                  "Returns the label image, n and a dict of arrays with one entry per region: pixels, sum_row, sum_col,\n"
+                                  "row_min, col_min, row_max, col_max and max_intensity (region x intensity image).\n"
+                                  "float32 intensity images are read as they are, others are converted to float64.";
+    m.def("label_stats", &label_stats<uint8_t>, label_stats_doc, py::arg("img").noconvert(), py::arg("intensities"), py::arg("n8") = true, py::arg("num_threads") = 1);
+    m.def("label_stats", &label_stats<uint16_t>, label_stats_doc, py::arg("img").noconvert(), py::arg("intensities"), py::arg("n8") = true, py::arg("num_threads") = 1);
+    m.def("label_stats", [](py::object img, std::vector<py::array> intensities, bool n8, int num_threads) {
+              return label_stats<uint8_t>(foreground(img), intensities, n8, num_threads); },
+          label_stats_doc, py::arg("img"), py::arg("intensities"), py::arg("n8") = true, py::arg("num_threads") = 1);
+
+    m.def("colorize", &colorize, "Colors every region of a label image with a random color, the background stays black.",
+          py::arg("labels"), py::arg("num_regions"), py::arg("random_seed") = 20);
+
+    m.def("set_timing_callback", [](py::object callback) {
+              // The last callback is never destroyed, it must not outlive the interpreter at exit
+              delete timing_callback;
+              timing_callback = callback.is_none() ? nullptr : new py::object(callback);
+          },
+          "Sets a function called with (phase, start_ns, end_ns) after every phase of label, label_stats and colorize\n"
+          "(label_rows, merge_strips, relabel, colorize), the times are those of clock_ns. None disables the timing.",
+          py::arg("callback"));
+    m.def("clock_ns", &clock_ns, "The monotonic clock of the timings in nanoseconds.");
+}
@@ -1,10 +1,16 @@
 import numpy as np
 import random
-import time
+import profiling
 
 
 def sequential_regioning(img, n8, random_seed = 20):
-    time_start = time.time_ns()
+    with profiling.stage("sequential_regioning") as record:
+        out_img, amount_regions = _sequential_regioning(img, n8, random_seed)
+        record.set(regions=amount_regions)
+        record.output(out_img)
+    return out_img, amount_regions
+
+def _sequential_regioning(img, n8, random_seed):
     img = img.copy()
     (height, width) = img.shape
     out_img = np.zeros((height, width, 3), dtype=np.uint16)
@@ -76,9 +82,4 @@ def sequential_regioning(img, n8, random_seed = 20):
                         out_img[v, u] = label_to_color[base_label]
                         break
 
-    time_end = time.time_ns()
-    elapsed_ms = (time_end - time_start) // 1_000_000  # Convert to milliseconds
-
-    print( "sequential regioning:     Regions found:", len(R))
-    print(f"sequential regioning:     Elapsed time: {elapsed_ms} milliseconds")
     return out_img, len(R)
\ No newline at end of file
@@ -0,0 +1,262 @@
+import argparse
+import json
+import signal
+import sys
+import threading
+import time
+import traceback
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Queue
+from typing import Dict, List, Optional
+import numpy as np
+import batch
+
+# Resident detection service: a local HTTP API queues scenes, a pool of worker processes that imported the
+# detection (cv2, scipy, rasterio and the C++ extensions) once at startup processes them like batch.py and writes
+# the results to <output>/<scene>/. So a small scene doesn't pay the imports of a new process.
+# Usage: python service.py --output results --workers 2 --port 8765
+#
+#     curl -X POST localhost:8765/jobs -d '{"scene": "T13UFA_20250602T175931"}'
+#     curl localhost:8765/jobs/<id>
+#     curl localhost:8765/status
+#
+# A job is created for every scene of a reference (see batch.find_scenes), directories can be filtered with
+# "tile", "start", "end" and "bbox" like in batch.py. The status reports the queue depth and the latencies of the
+# last jobs, from their submission until their results are written. The workers are kept between the jobs, the
+# peak memory in the stats of a job is reset when the job starts. Only the last finished jobs are kept, older ones
+# are only counted in the status.
+
+LATENCY_WINDOW = 1000 # latest finished jobs of the latency statistics
+JOB_WINDOW = 1000 # latest finished jobs kept for /jobs
+
+@dataclass
+class Job:
+    id: str
+    scene: batch.Scene
+    submitted: float
+    state: str = "queued" # queued, running, done or failed
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    stats: Optional[dict] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        now = time.time()
+        return {
+            "id": self.id,
+            "scene": self.scene.name,
+            "state": self.state,
+            "queued_s": round((self.started or now) - self.submitted, 3),
+            "run_s": round((self.finished or now) - self.started, 3) if self.started is not None else None,
+            "latency_s": round(self.finished - self.submitted, 3) if self.finished is not None else None,
+            "stats": self.stats,
+            "error": self.error,
+        }
+
+def _warm_up():
+    # Runs once in every worker, the detection is imported before the first scene arrives
+    import pipeline, tiling, cog_writer, fire_regions # noqa: F401
+    # Ctrl+C reaches the whole process group, the service lets the running jobs finish before it stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def _ready() -> bool:
+    return True
+
+class DetectionService:
+    def __init__(self, output_dir: str, workers: int = 1, memory_gb: float = 4, precision: str = "float64",
+                 down_scale_factor: int = 1, profile: bool = False, root: str = "images"):
+        self.output_dir = output_dir
+        self.workers = workers
+        self.memory_budget = int(memory_gb * 1024**3)
+        self.precision = precision
+        self.down_scale_factor = down_scale_factor
+        self.profile = profile
+        self.root = root
+        self.started = time.time()
+        self.jobs: Dict[str, Job] = {}
+        self._queue: Queue = Queue()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._finished = deque() # ids of the kept finished jobs, oldest first
+        self._forgotten = {"done": 0, "failed": 0} # finished jobs that are no longer kept
+        self._lock = threading.Lock()
+        self._executor = self._start_pool()
+        # One dispatcher per worker, so a job is only started when a worker is free and its queue time is exact
+        self._dispatchers = [threading.Thread(target=self._dispatch, daemon=True) for _ in range(workers)]
+        for dispatcher in self._dispatchers:
+            dispatcher.start()
+
+    def _start_pool(self) -> ProcessPoolExecutor:
+        executor = ProcessPoolExecutor(self.workers, initializer=_warm_up)
+        # Every worker is started and warmed up before the service accepts jobs
+        for future in [executor.submit(_ready) for _ in range(self.workers)]:
+            future.result()
+        return executor
+
+    def submit(self, reference: str, **filters) -> List[Job]:
+        """
+        Queues a job for every scene of the reference, raises ValueError if it has no scenes.
+        """
+        scenes = batch.find_scenes([reference], root=self.root, **filters)
+        if not scenes:
+            raise ValueError(f"No scenes found for '{reference}'")
+        jobs = [Job(uuid.uuid4().hex[:12], scene, time.time()) for scene in scenes]
+        with self._lock:
+            for job in jobs:
+                self.jobs[job.id] = job
+        for job in jobs:
+            self._queue.put(job)
+        return jobs
+
+    def _dispatch(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            job.started = time.time()
+            job.state = "running"
+            executor = self._executor
+            try:
+                future = executor.submit(batch.detect_scene_safe, job.scene, self.output_dir, self.memory_budget,
+                                         self.precision, self.down_scale_factor, self.profile)
+                job.stats, job.error = future.result()
+            except BrokenProcessPool:
+                # A worker died (e.g. killed when it ran out of memory), the pool is replaced for the next jobs
+                job.error = traceback.format_exc()
+                with self._lock:
+                    if executor is self._executor:
+                        self._executor = self._start_pool()
+                executor.shutdown(wait=False)
+            job.finished = time.time()
+            job.state = "failed" if job.error is not None else "done"
+            with self._lock:
+                self._latencies.append(job.finished - job.submitted)
+                self._finish(job)
+            print(f"{job.scene.name}: {job.state}, queued {job.started - job.submitted:.1f} s, run {job.finished - job.started:.1f} s")
+
+    def _finish(self, job: Job):
+        # Called with the lock held, the oldest finished jobs beyond JOB_WINDOW are forgotten
+        self._finished.append(job.id)
+        while len(self._finished) > JOB_WINDOW:
+            forgotten = self.jobs.pop(self._finished.popleft())
+            self._forgotten[forgotten.state] += 1
+
+    def job_list(self) -> List[Job]:
+        with self._lock:
+            return list(self.jobs.values())
+
+    def job(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def status(self) -> dict:
+        with self._lock:
+            states = [job.state for job in self.jobs.values()]
+            forgotten = dict(self._forgotten)
+            latencies = np.array(self._latencies)
+        status = {
+            "workers": self.workers,
+            "uptime_s": round(time.time() - self.started, 1),
+            "queue_depth": self._queue.qsize(),
+            **{state: states.count(state) + forgotten.get(state, 0) for state in ("queued", "running", "done", "failed")},
+        }
+        if len(latencies):
+            status["latency_s"] = {"jobs": len(latencies), "mean": round(float(latencies.mean()), 3),
+                                   "p50": round(float(np.percentile(latencies, 50)), 3),
+                                   "p95": round(float(np.percentile(latencies, 95)), 3), "max": round(float(latencies.max()), 3)}
+        return status
+
+    def close(self):
+        """
+        Fails the queued jobs and waits for the running ones.
+        """
+        while not self._queue.empty():
+            job = self._queue.get_nowait()
+            job.state, job.error, job.finished = "failed", "The service stopped", time.time()
+            with self._lock:
+                self._finish(job)
+        for _ in self._dispatchers:
+            self._queue.put(None)
+        for dispatcher in self._dispatchers:
+            dispatcher.join()
+        self._executor.shutdown()
+
+def _filters(body: dict) -> dict:
+    # The directory filters of batch.find_scenes from a job request
+    filters = {"tile": body.get("tile")}
+    filters["start"] = datetime.fromisoformat(body["start"]) if body.get("start") else None
+    filters["end"] = batch.parse_end(body["end"]) if body.get("end") else None
+    filters["bbox"] = tuple(float(value) for value in body["bbox"]) if body.get("bbox") else None
+    return filters
+
+class _Handler(BaseHTTPRequestHandler):
+    service: DetectionService
+
+    def _reply(self, code: int, body):
+        data = json.dumps(body, indent=2).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/status":
+            return self._reply(200, self.service.status())
+        if self.path == "/jobs":
+            return self._reply(200, [job.to_dict() for job in self.service.job_list()])
+        if self.path.startswith("/jobs/"):
+            job = self.service.job(self.path[len("/jobs/"):])
+            return self._reply(200, job.to_dict()) if job is not None else self._reply(404, {"error": "unknown job"})
+        self._reply(404, {"error": "unknown path"})
+
+    def do_POST(self):
+        if self.path != "/jobs":
+            return self._reply(404, {"error": "unknown path"})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            jobs = self.service.submit(body["scene"], **_filters(body))
+        except (KeyError, TypeError, ValueError) as error:
+            return self._reply(400, {"error": str(error)})
+        self._reply(202, {"jobs": [job.to_dict() for job in jobs]})
+
+def _stop(signum, frame):
+    # SIGTERM stops the service like Ctrl+C
+    raise KeyboardInterrupt
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Resident wildfire detection service with a local HTTP API.")
+    parser.add_argument("--output", default="results", help="directory for the results, one subdirectory per scene")
+    parser.add_argument("--workers", type=int, default=1, help="amount of scenes processed at the same time")
+    parser.add_argument("--memory-gb", type=float, default=4, help="memory budget per worker, larger scenes are processed tile by tile")
+    parser.add_argument("--precision", choices=["float64", "float32"], default="float64")
+    parser.add_argument("--down-scale-factor", type=int, default=1)
+    parser.add_argument("--profile", action="store_true", help="record the stages of every scene to profile.jsonl and profile.trace.json")
+    parser.add_argument("--root", default="images", help="directory whose catalog holds the scenes given by name")
+    parser.add_argument("--host", default="127.0.0.1", help="only local clients by default")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args(argv)
+
+    service = DetectionService(args.output, workers=args.workers, memory_gb=args.memory_gb, precision=args.precision,
+                               down_scale_factor=args.down_scale_factor, profile=args.profile, root=args.root)
+    _Handler.service = service
+    server = ThreadingHTTPServer((args.host, args.port), _Handler)
+    print(f"Listening on http://{args.host}:{server.server_address[1]} with {args.workers} warm workers")
+    signal.signal(signal.SIGTERM, _stop)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -15,6 +15,30 @@ ext_modules = [
         language='c++',
         extra_compile_args=cpp_args,
     ),
+    Extension(
+        # Binary morphology for large kernels: import binary_morphology_cpp
+        'binary_morphology_cpp',
+        ['binary_morphology.cpp'],
+        include_dirs=[pybind11.get_include()],
+        language='c++',
+        extra_compile_args=cpp_args,
+    ),
+    Extension(
+        # Fused pixel thresholds of the fire detection: import fire_detection_cpp
+        'fire_detection_cpp',
+        ['fire_detection.cpp'],
+        include_dirs=[pybind11.get_include()],
+        language='c++',
+        extra_compile_args=cpp_args,
+    ),
+    Extension(
+        # Canny on precomputed gradients for the burnt area detection: import edge_detection_cpp
+        'edge_detection_cpp',
+        ['edge_detection.cpp'],
+        include_dirs=[pybind11.get_include()],
+        language='c++',
+        extra_compile_args=cpp_args,
+    ),
 ]
 
 setup(
@@ -0,0 +1,118 @@
+import json
+import os
+from typing import Dict, Tuple
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from scipy import ndimage
+import images
+from bands import SCALING
+
+# Deterministic synthetic Sentinel-2 L2A scenes for benchmarks: vegetation and bare soil, water, burn scars with fire
+# fronts, small isolated fires and clouds with the matching cloud probability. The bands are written like the images
+# folder (infrared, color, MSK_CLDPRB_20m.jp2) as lossless JP2, so the scenes are read by the same code as real ones.
+# The same size and seed always give the same scene.
+
+SCENE_PREFIX = "T99SYN_20240801T120000"
+PARAMS_FILE = "synthetic.json"
+
+# Reflectances of the land covers: B12, B11, B8A, B04, B03, B02
+BAND_NAMES = ("B12", "B11", "B8a", "B04", "B03", "B02")
+VEGETATION = (0.08, 0.18, 0.35, 0.04, 0.06, 0.03)
+SOIL = (0.25, 0.32, 0.25, 0.15, 0.11, 0.08)
+WATER = (0.005, 0.01, 0.02, 0.03, 0.05, 0.06)
+BURN_SCAR = (0.18, 0.2, 0.12, 0.06, 0.05, 0.04)
+CLOUD = (0.28, 0.4, 0.6, 0.55, 0.55, 0.55)
+
+WATER_SHARE = 0.05
+CLOUD_SHARE = 0.08
+
+def _smooth_noise(rng: np.random.Generator, size: int, scale: int) -> np.ndarray:
+    # Noise with structures of about scale pixels, scaled to 0-1, generated at a low resolution and interpolated
+    low = rng.random((size // scale + 2, size // scale + 2)).astype(np.float32)
+    noise = ndimage.zoom(ndimage.gaussian_filter(low, 1), scale, order=1)[:size, :size]
+    return (noise - noise.min()) / (noise.max() - noise.min())
+
+def _disc(size: int, row: float, col: float, radius: float) -> Tuple[slice, slice, np.ndarray]:
+    # The bounding box of a disc and the disc inside of it
+    rows = slice(max(int(row - radius), 0), min(int(row + radius) + 1, size))
+    cols = slice(max(int(col - radius), 0), min(int(col + radius) + 1, size))
+    grid_rows, grid_cols = np.ogrid[rows, cols]
+    return rows, cols, (grid_rows - row)**2 + (grid_cols - col)**2 <= radius**2
+
+def scene_bands(size: int = 5490, seed: int = 0, burn_scars: int = 6, small_fires: int = 20) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+    """
+    Returns the reflectances of the bands (B12, B11, B8a, B04, B03, B02) as float32 and the cloud probability in percent.
+    """
+    rng = np.random.default_rng(seed)
+    bare = _smooth_noise(rng, size, 64)
+    water = _smooth_noise(rng, size, 128)
+    water = water > np.quantile(water, 1 - WATER_SHARE)
+    clouds = _smooth_noise(rng, size, 96)
+    texture = rng.normal(0, 0.01, (size, size)).astype(np.float32)
+
+    bands = {}
+    for i, name in enumerate(BAND_NAMES):
+        band = VEGETATION[i] * (1 - bare) + SOIL[i] * bare + texture * VEGETATION[i] * 4
+        band[water] = WATER[i]
+        bands[name] = band
+
+    # Burn scars, fires burn along a part of their edge
+    for _ in range(burn_scars):
+        row, col = rng.uniform(0.1, 0.9, 2) * size
+        radius = rng.uniform(0.01, 0.07) * size
+        rows, cols, scar = _disc(size, row, col, radius)
+        for i, name in enumerate(BAND_NAMES):
+            bands[name][rows, cols][scar] = BURN_SCAR[i] + texture[rows, cols][scar] * 2
+        angle = rng.uniform(0, 2 * np.pi)
+        for step in np.linspace(-0.6, 0.6, 12):
+            fire_row, fire_col = row + radius * np.sin(angle + step), col + radius * np.cos(angle + step)
+            _add_fire(bands, size, fire_row, fire_col, rng.uniform(2, 0.005 * size + 3), rng)
+
+    # Small isolated fires, down to a single pixel
+    for _ in range(small_fires):
+        row, col = rng.uniform(0.02, 0.98, 2) * size
+        _add_fire(bands, size, row, col, rng.uniform(0.5, 3), rng)
+
+    # Clouds cover everything below them, the cloud probability follows their opacity
+    opacity = np.clip((clouds - np.quantile(clouds, 1 - CLOUD_SHARE)) / 0.05, 0, 1)
+    for i, name in enumerate(BAND_NAMES):
+        bands[name] = bands[name] * (1 - opacity) + CLOUD[i] * opacity
+        np.clip(bands[name], 0.0001, 6.5, out=bands[name])
+    cm = np.clip(opacity * 100 + rng.integers(0, 5, (size, size)), 0, 100).astype(np.uint8)
+    return bands, cm
+
+def _add_fire(bands: Dict[str, np.ndarray], size: int, row: float, col: float, radius: float, rng: np.random.Generator):
+    rows, cols, fire = _disc(size, row, col, radius)
+    intensity = rng.uniform(0.6, 1.6)
+    bands["B12"][rows, cols][fire] = intensity
+    bands["B11"][rows, cols][fire] = intensity * rng.uniform(0.3, 0.7)
+    bands["B8a"][rows, cols][fire] = rng.uniform(0.12, 0.3)
+
+def write_scene(directory: str, size: int = 5490, seed: int = 0, prefix: str = SCENE_PREFIX, burn_scars: int = 6, small_fires: int = 20) -> images.Image:
+    """
+    Writes a synthetic scene to directory and returns its image. An existing scene with the same parameters is reused.
+    """
+    params = {"size": size, "seed": seed, "prefix": prefix, "burn_scars": burn_scars, "small_fires": small_fires}
+    params_path = os.path.join(directory, PARAMS_FILE)
+    img = images.Image(directory=os.path.abspath(directory), file_name_prefix=prefix)
+    if os.path.exists(params_path):
+        with open(params_path) as f:
+            if json.load(f) == params:
+                return img
+
+    bands, cm = scene_bands(size, seed, burn_scars, small_fires)
+    os.makedirs(os.path.join(directory, "infrared"), exist_ok=True)
+    os.makedirs(os.path.join(directory, "color"), exist_ok=True)
+    # 20 m pixels of UTM zone 10N, lossless like the Sentinel-2 products
+    profile = dict(driver="JP2OpenJPEG", width=size, height=size, count=1, crs="EPSG:32610",
+                   transform=from_origin(500000, 4200000, 20, 20), reversible=True, quality=100)
+    paths = images.get_band_paths(img)
+    for name, path in zip(BAND_NAMES, paths):
+        with rasterio.open(path, "w", dtype="uint16", **profile) as dst:
+            dst.write(np.round(bands.pop(name) * SCALING).astype(np.uint16), 1)
+    with rasterio.open(paths[6], "w", dtype="uint8", **profile) as dst:
+        dst.write(cm, 1)
+    with open(params_path, "w") as f:
+        json.dump(params, f)
+    return img
@@ -0,0 +1,76 @@
+import os
+import numpy as np
+import pytest
+from band_cache import BandCache
+from bands import get_bands
+from synthetic_scene import write_scene
+
+# Entries, keys and the LRU eviction of the band cache
+
+BAND_BYTES = 100 * 8
+
+@pytest.fixture
+def cache(tmp_path):
+    return BandCache(str(tmp_path / "cache"), max_bytes=2 * BAND_BYTES + 1000) # two entries with their headers
+
+def _band(value: float) -> np.ndarray:
+    return np.full((10, 10), value)
+
+def test_entries_are_read_only_memory_maps(cache):
+    assert cache.get("missing") is None
+    cache.put("a", _band(1))
+    band = cache.get("a")
+    assert isinstance(band, np.memmap) and not band.flags.writeable
+    np.testing.assert_array_equal(band, _band(1))
+
+def test_key_depends_on_source_and_params(tmp_path, cache):
+    path = str(tmp_path / "band.jp2")
+    with open(path, "wb") as f:
+        f.write(b"band")
+    key = cache.key(path, down_scale_factor=1)
+    assert cache.key(path, down_scale_factor=1) == key
+    assert cache.key(path, down_scale_factor=2) != key
+    os.utime(path, ns=(0, 0)) # a changed source is never served from the cache
+    assert cache.key(path, down_scale_factor=1) != key
+
+def test_least_recently_used_entries_are_evicted(cache):
+    cache.put("a", _band(1))
+    cache.put("b", _band(2))
+    # Entries are ordered by their last use, a is used after b
+    os.utime(cache._entry_path("a"), (2, 2))
+    os.utime(cache._entry_path("b"), (1, 1))
+    cache.put("c", _band(3))
+    assert cache.get("b") is None
+    np.testing.assert_array_equal(cache.get("a"), _band(1))
+    np.testing.assert_array_equal(cache.get("c"), _band(3))
+    assert cache.size() <= cache.max_bytes
+
+    # Bands larger than the whole cache are not stored
+    cache.put("large", np.zeros(3 * BAND_BYTES))
+    assert cache.get("large") is None
+    cache.clear()
+    assert cache.size() == 0
+
+def test_get_or_load_loads_once(tmp_path, cache):
+    path = str(tmp_path / "band.jp2")
+    with open(path, "wb") as f:
+        f.write(b"band")
+    loads = []
+    load = lambda: loads.append(1) or _band(4)
+    first = cache.get_or_load(path, load, down_scale_factor=1)
+    second = cache.get_or_load(path, load, down_scale_factor=1)
+    assert len(loads) == 1 and not second.flags.writeable
+    np.testing.assert_array_equal(first, second)
+
+@pytest.mark.parametrize("precision", ["float64", "float32"])
+def test_cached_bands_match_decoded(tmp_path, precision):
+    img = write_scene(str(tmp_path / "scene"), 64, 0)
+    cache = BandCache(str(tmp_path / "cache"))
+    decoded = get_bands(img, precision=precision)
+    cold = get_bands(img, cache=cache, precision=precision)
+    warm = get_bands(img, cache=cache, precision=precision)
+    for band, cold_band, warm_band in zip(decoded, cold, warm):
+        np.testing.assert_array_equal(cold_band, band)
+        np.testing.assert_array_equal(warm_band, band)
+    # float32 bands are scaled from the cached raw values, so they are writable copies
+    assert warm[0].flags.writeable == (precision == "float32")
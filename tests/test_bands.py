@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+import rasterio
+import images
+from bands import band_georeference, get_bands, load_bands, SCALING
+from synthetic_scene import write_scene
+
+# The concurrent and the reduced resolution decoding of the bands
+
+@pytest.fixture(scope="module")
+def img(tmp_path_factory):
+    return write_scene(str(tmp_path_factory.mktemp("bands") / "scene"), 120, 0)
+
+def test_concurrent_decoding_matches_sequential(img):
+    paths = images.get_band_paths(img)
+    bands = get_bands(img)
+    for band, sequential in zip(bands, get_bands(img, max_workers=1)):
+        np.testing.assert_array_equal(band, sequential)
+    for band, path in zip(bands[:6], paths):
+        with rasterio.open(path) as src:
+            np.testing.assert_array_equal(band, src.read(1) / SCALING)
+    assert bands[6] is not None
+
+@pytest.mark.parametrize("precision", ["float64", "float32"])
+def test_reduced_resolution(img, precision):
+    full = get_bands(img, precision=precision)
+    reduced = get_bands(img, down_scale_factor=2, precision=precision)
+    for band, full_band in zip(reduced, full):
+        assert band.shape == (60, 60) and band.dtype == full_band.dtype
+        # Decoded at the lower resolution level, close to the mean of the full resolution pixels
+        area_mean = full_band.reshape(60, 2, 60, 2).mean(axis=(1, 3))
+        assert np.mean(np.abs(band - area_mean)) < 0.02 * np.ptp(full_band)
+
+    transform, _ = band_georeference(images.get_band_paths(img)[0], 2)
+    assert (transform.a, transform.e) == (40, -40)
+
+def test_load_bands_selects_bands(img):
+    b04, cm, b12 = load_bands(img, ("b04", "cm", "b12"))
+    b12_all, _, _, b04_all, _, _, cm_all = get_bands(img)
+    np.testing.assert_array_equal(b04, b04_all)
+    np.testing.assert_array_equal(b12, b12_all)
+    np.testing.assert_array_equal(cm, cm_all)
+    with pytest.raises(ValueError):
+        load_bands(img, ("b05",))
+    with pytest.raises(ValueError):
+        get_bands(img, precision="float16")
@@ -0,0 +1,27 @@
+from unittest import mock
+import pytest
+import catalog
+from synthetic_scene import write_scene
+
+# Scene names are looked up in the catalog, which is only scanned again when a scene is missing
+
+PREFIXES = ("T10TEK_20240725T185921", "T10TEK_20240730T185919")
+
+def test_resolve_refreshes_only_for_missing_scenes(tmp_path):
+    root = str(tmp_path)
+    write_scene(str(tmp_path / "first"), 64, 0, prefix=PREFIXES[0])
+    with mock.patch.object(catalog.Catalog, "refresh", autospec=True, side_effect=catalog.Catalog.refresh) as refresh:
+        assert catalog.resolve(PREFIXES[0], root).file_name_prefix == PREFIXES[0]
+        assert refresh.call_count == 1
+        catalog.resolve(PREFIXES[0], root)
+        assert refresh.call_count == 1
+        catalog.resolve(PREFIXES[0], root, refresh=True)
+        assert refresh.call_count == 2
+
+        # A new scene is found by the refresh after the lookup failed
+        write_scene(str(tmp_path / "second"), 64, 1, prefix=PREFIXES[1])
+        assert catalog.resolve(PREFIXES[1], root).file_name_prefix == PREFIXES[1]
+        assert refresh.call_count == 3
+        with pytest.raises(KeyError):
+            catalog.resolve("T10TEK_20990101T000000", root)
+        assert refresh.call_count == 4
@@ -0,0 +1,69 @@
+import os
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+import cog_writer
+
+# The written results are valid COGs with the values of the arrays
+
+SHAPE = (1300, 1100) # not a multiple of the blocks
+TRANSFORM = from_origin(500000, 4200000, 20, 20)
+CRS = "EPSG:32610"
+
+def _results():
+    rng = np.random.default_rng(0)
+    fire = np.zeros(SHAPE, np.uint8)
+    fire[rng.integers(0, SHAPE[0], 50), rng.integers(0, SHAPE[1], 50)] = 1
+    return {
+        "fire": fire,
+        "labels": rng.integers(0, 1000, SHAPE).astype(np.int32),
+        "burn_index": rng.normal(size=SHAPE).astype(np.float32),
+        "burnt_area": rng.random(SHAPE) < 0.1, # bool
+    }
+
+def _assert_cog(path: str):
+    with rasterio.open(path) as src:
+        assert src.tags(ns="IMAGE_STRUCTURE").get("LAYOUT") == "COG"
+        assert src.profile["tiled"] and src.block_shapes == [(cog_writer.BLOCK_SIZE, cog_writer.BLOCK_SIZE)]
+        assert src.overviews(1) == [2, 4] # down to a single block
+        assert (src.transform, src.crs.to_string(), src.shape) == (TRANSFORM, CRS, SHAPE)
+
+def test_write_results(tmp_path):
+    results = _results()
+    cog_writer.write_results(str(tmp_path), TRANSFORM, CRS, **results)
+    for name, array in results.items():
+        path = cog_writer.result_path(str(tmp_path), name)
+        _assert_cog(path)
+        dtype, mask = cog_writer.RESULTS[name]
+        with rasterio.open(path) as src:
+            written = src.read(1)
+            assert written.dtype == dtype
+            if mask:
+                # Binary masks are 0 and 255, a single pixel stays visible in the averaged overviews
+                np.testing.assert_array_equal(written, np.where(array > 0, 255, 0))
+                overview = src.read(1, out_shape=(SHAPE[0] // 2, SHAPE[1] // 2))
+                assert np.count_nonzero(overview) >= np.count_nonzero(array) // 4
+            else:
+                np.testing.assert_array_equal(written, array)
+
+def test_streaming_writer(tmp_path):
+    fire = _results()["fire"]
+    path = str(tmp_path / "fire.tif")
+    # Tiles in any order, with sizes that don't match the blocks
+    with cog_writer.CogWriter(path, SHAPE, np.uint8, TRANSFORM, CRS, mask=True) as writer:
+        for row in (700, 0):
+            for col in (600, 0):
+                writer.write(fire[row:row + 700, col:col + 600], row, col)
+    _assert_cog(path)
+    with rasterio.open(path) as src:
+        np.testing.assert_array_equal(src.read(1), fire * 255)
+    assert not os.path.exists(path + ".part.tif")
+
+def test_aborted_writer_leaves_no_output(tmp_path):
+    path = str(tmp_path / "fire.tif")
+    with pytest.raises(RuntimeError):
+        with cog_writer.CogWriter(path, SHAPE, np.uint8, TRANSFORM, CRS, mask=True) as writer:
+            writer.write(np.ones((10, 10), np.uint8))
+            raise RuntimeError("detection failed")
+    assert os.listdir(tmp_path) == []
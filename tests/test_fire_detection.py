@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+import detection
+
+# The fused C++ fire masks against the NumPy reference (detection.fire_masks_reference)
+
+SIZE = 300
+BAND_MAX = (1.3, 1.1, 0.9, 1.6, 1.2, 0.8) # B12, B11, B8A, B04, B03, B02
+
+def _bands(seed: int):
+    # Normalized bands with hot spots, so that every threshold is hit, and NaN, zero, saturated and threshold values
+    rng = np.random.default_rng(seed)
+    bands = [rng.random((SIZE, SIZE)) for _ in range(6)]
+    hot = rng.random((SIZE, SIZE)) < 0.002
+    bands[0][hot] = 1.0
+    bands[1][hot] *= 0.3
+    bands[2][hot] *= 0.1
+    for band, band_max in zip(bands, BAND_MAX):
+        special = rng.integers(0, 5, (SIZE, SIZE))
+        band[special == 0] = np.nan
+        band[(special == 1) & (rng.random((SIZE, SIZE)) < 0.05)] = 0.0
+        band[(special == 2) & (rng.random((SIZE, SIZE)) < 0.05)] = 1.0 # the maximum of the scene
+    # B12 exactly on the outer and core threshold
+    bands[0][::7, ::11] = 0.6 / BAND_MAX[0]
+    bands[0][3::13, ::5] = 0.9 / BAND_MAX[0]
+    # A whole saturated and a whole empty block
+    for band in bands:
+        band[:20, :20] = 1.0
+        band[-20:, -20:] = 0.0
+    return bands
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("num_threads", [1, 3, 0])
+def test_fire_masks_match_reference(seed, num_threads):
+    bands = _bands(seed)
+    expected_outer, expected_core = detection.fire_masks_reference(*bands, BAND_MAX)
+    assert expected_outer.any() and expected_core.any()
+    outer, core = detection.fire_masks(*bands, BAND_MAX, num_threads=num_threads)
+    assert outer.dtype == np.uint8 and core.dtype == np.uint8
+    np.testing.assert_array_equal(outer, expected_outer)
+    np.testing.assert_array_equal(core, expected_core)
+
+@pytest.mark.parametrize("num_threads", [1, 3])
+def test_fire_masks_float32_match_reference(num_threads):
+    # float32 bands are compared by their exact value, so they match the reference on the same values in float64
+    bands = [band.astype(np.float32) for band in _bands(3)]
+    expected_outer, expected_core = detection.fire_masks_reference(*[band.astype(np.float64) for band in bands], BAND_MAX)
+    outer, core = detection.fire_masks(*bands, BAND_MAX, num_threads=num_threads)
+    np.testing.assert_array_equal(outer, expected_outer)
+    np.testing.assert_array_equal(core, expected_core)
+
+def test_fire_masks_nan_is_no_fire():
+    bands = [np.full((8, 8), np.nan) for _ in range(6)]
+    outer, core = detection.fire_masks(*bands, BAND_MAX)
+    assert not outer.any() and not core.any()
@@ -0,0 +1,97 @@
+import json
+import numpy as np
+import pytest
+from rasterio import features
+from rasterio.transform import Affine
+from scipy import ndimage
+import detection
+import fire_regions
+
+# The region statistics against scipy.ndimage, the merge of tiles and the GeoJSON export
+
+N8 = ndimage.generate_binary_structure(2, 2)
+TRANSFORM = Affine(20, 0, 499980, 0, -20, 5600040) # 20 m pixels of a UTM tile
+
+def _scene(seed: int, shape=(61, 83), density: float = 0.45):
+    rng = np.random.default_rng(seed)
+    mask = (ndimage.uniform_filter(rng.random(shape), 3) < density).astype(np.uint8) # blobs of different sizes
+    b12 = rng.random(shape).astype(np.float32)
+    b11 = rng.random(shape).astype(np.float32)
+    return mask, b12, b11
+
+def _assert_records_equal(records, expected):
+    for field in ("label", "pixels", "row_min", "col_min", "row_max", "col_max", "max_b12", "max_b11"):
+        np.testing.assert_array_equal(records[field], expected[field])
+    for field in ("area_km2", "centroid_row", "centroid_col"):
+        np.testing.assert_allclose(records[field], expected[field])
+
+@pytest.mark.parametrize("down_scale_factor", [1, 2])
+def test_region_records_match_scipy(down_scale_factor):
+    mask, b12, b11 = _scene(0)
+    labels, regions = fire_regions.region_stats(mask, b12, b11, down_scale_factor)
+    expected, count = ndimage.label(mask, N8)
+    np.testing.assert_array_equal(labels, expected)
+    assert len(regions) == count > 10
+
+    index = np.arange(1, count + 1)
+    pixels = np.bincount(expected.ravel(), minlength=count + 1)[1:]
+    np.testing.assert_array_equal(regions["label"], index)
+    np.testing.assert_array_equal(regions["pixels"], pixels)
+    np.testing.assert_allclose(regions["area_km2"], pixels * detection.PIXEL_AREA * down_scale_factor**2 / 1000000)
+    boxes = ndimage.find_objects(expected)
+    np.testing.assert_array_equal(regions["row_min"], [rows.start for rows, _ in boxes])
+    np.testing.assert_array_equal(regions["row_max"], [rows.stop - 1 for rows, _ in boxes])
+    np.testing.assert_array_equal(regions["col_min"], [cols.start for _, cols in boxes])
+    np.testing.assert_array_equal(regions["col_max"], [cols.stop - 1 for _, cols in boxes])
+    centroids = np.array(ndimage.center_of_mass(mask, expected, index))
+    np.testing.assert_allclose(regions["centroid_row"], centroids[:, 0])
+    np.testing.assert_allclose(regions["centroid_col"], centroids[:, 1])
+    np.testing.assert_array_equal(regions["max_b12"], ndimage.maximum(b12, expected, index))
+    np.testing.assert_array_equal(regions["max_b11"], ndimage.maximum(b11, expected, index))
+
+@pytest.mark.parametrize("axis, split", [(0, 30), (1, 41), (1, 1)])
+def test_merged_halves_match_unsplit_mask(axis, split):
+    mask, b12, b11 = _scene(1)
+    labels, amount_regions, raw_stats = fire_regions.label_regions(mask, b12, b11)
+    assert amount_regions > 10
+
+    # Both halves are labeled on their own, the labels of the second one follow the ones of the first
+    parts = []
+    final_labels = [0]
+    for start, stop in ((0, split), (split, mask.shape[axis])):
+        window = (slice(start, stop), slice(None)) if axis == 0 else (slice(None), slice(start, stop))
+        part_labels, amount, part_stats = fire_regions.label_regions(mask[window], b12[window], b11[window])
+        offset = (start, 0) if axis == 0 else (0, start)
+        parts.append(fire_regions.shift_raw_stats(part_stats, *offset))
+        # A label of a half maps to the label of the unsplit mask at any of its pixels
+        first_pixel = ndimage.minimum_position(part_labels, part_labels, np.arange(1, amount + 1))
+        final_labels += [labels[window][position] for position in first_pixel]
+    # Regions crossing the split are merged from several labels
+    assert len(final_labels) - 1 > amount_regions
+
+    merged = fire_regions.merge_raw_stats(parts, np.array(final_labels), amount_regions)
+    _assert_records_equal(fire_regions.region_records(merged), fire_regions.region_records(raw_stats))
+
+@pytest.mark.parametrize("to_wgs84", [False, True])
+def test_geojson_outlines_the_regions(tmp_path, to_wgs84):
+    mask, b12, b11 = _scene(2)
+    labels, regions = fire_regions.region_stats(mask, b12, b11)
+    path = str(tmp_path / "regions.geojson")
+    fire_regions.write_geojson(path, labels, regions, TRANSFORM, "EPSG:32633", to_wgs84=to_wgs84)
+    with open(path) as f:
+        collection = json.load(f)
+
+    assert collection["type"] == "FeatureCollection"
+    assert len(collection["features"]) == len(regions)
+    for feature, region in zip(collection["features"], regions):
+        properties = feature["properties"]
+        assert properties["label"] == region["label"] and properties["pixels"] == region["pixels"]
+        if to_wgs84:
+            longitude, latitude = properties["centroid"]
+            assert 14 < longitude < 16 and 50 < latitude < 51
+            continue
+        # The outline covers exactly the pixels of the region
+        outline = features.rasterize([(feature["geometry"], 1)], out_shape=labels.shape, transform=TRANSFORM)
+        np.testing.assert_array_equal(outline, labels == region["label"])
+        expected_centroid = TRANSFORM * (region["centroid_col"] + 0.5, region["centroid_row"] + 0.5)
+        np.testing.assert_allclose(properties["centroid"], expected_centroid)
@@ -0,0 +1,44 @@
+import cv2
+import numpy as np
+import pytest
+import binary_morphology_cpp
+import morphology
+
+# The bit-packed C++ morphology against OpenCV, on both sides of the kernel size where morphology.py switches
+
+OPERATIONS = {"dilate": cv2.MORPH_DILATE, "erode": cv2.MORPH_ERODE, "close": cv2.MORPH_CLOSE, "open": cv2.MORPH_OPEN}
+SIZES = [3, 8, morphology.PACKED_MIN_KERNEL_SIZE - 1, morphology.PACKED_MIN_KERNEL_SIZE, morphology.PACKED_MIN_KERNEL_SIZE + 1, 135]
+
+def _mask(seed: int, shape=(173, 251)) -> np.ndarray:
+    # Sparse points and larger blobs, the width isn't a multiple of the packed words
+    rng = np.random.default_rng(seed)
+    mask = (rng.random(shape) < 0.002).astype(np.uint8)
+    mask |= cv2.dilate((rng.random(shape) < 0.0005).astype(np.uint8), np.ones((41, 41), np.uint8))
+    mask[60:100, 120:125] = 1 # a thin bar that opening removes
+    return mask
+
+def _opencv(mask: np.ndarray, size: int, operation: str) -> np.ndarray:
+    return cv2.morphologyEx(mask, OPERATIONS[operation], np.ones((size, size), np.uint8))
+
+@pytest.mark.parametrize("operation", list(OPERATIONS))
+@pytest.mark.parametrize("size", SIZES)
+def test_packed_matches_opencv(operation, size):
+    mask = _mask(size)
+    np.testing.assert_array_equal(getattr(binary_morphology_cpp, operation)(mask, size, size), _opencv(mask, size, operation))
+
+@pytest.mark.parametrize("operation", list(OPERATIONS))
+@pytest.mark.parametrize("size", SIZES)
+@pytest.mark.parametrize("dtype", [np.uint8, bool])
+def test_morphology_matches_opencv(operation, size, dtype):
+    mask = _mask(size)
+    result = getattr(morphology, operation)(mask.astype(dtype), size)
+    assert result.dtype == dtype
+    np.testing.assert_array_equal(result.astype(np.uint8), _opencv(mask, size, operation))
+
+@pytest.mark.parametrize("operation", list(OPERATIONS))
+@pytest.mark.parametrize("value", [0, 1])
+def test_uniform_masks(operation, value):
+    # The borders neither add nor remove pixels
+    mask = np.full((70, 90), value, np.uint8)
+    size = morphology.PACKED_MIN_KERNEL_SIZE + 7
+    np.testing.assert_array_equal(getattr(morphology, operation)(mask, size), _opencv(mask, size, operation))
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+from band_cache import BandCache
+from bands import get_bands, normalize_band, PRECISIONS
+from pipeline import Pipeline
+from synthetic_scene import write_scene
+
+# The stage graph keeps the results of its stages, they must not be changed by the stages using them
+
+@pytest.mark.parametrize("precision", list(PRECISIONS))
+def test_normalized_leaves_the_bands_unchanged(tmp_path, precision):
+    img = write_scene(str(tmp_path / "scene"), 200, 0)
+    pipeline = Pipeline(img, precision=precision)
+    bands = pipeline.get("bands")
+    loaded = [band.copy() for band in (bands.b12, bands.b11, bands.b8a)]
+    pipeline.get("normalized")
+    for band, before in zip((bands.b12, bands.b11, bands.b8a), loaded):
+        np.testing.assert_array_equal(band, before)
+
+@pytest.mark.parametrize("precision", list(PRECISIONS))
+def test_normalized_matches_get_bands(tmp_path, precision):
+    img = write_scene(str(tmp_path / "scene"), 200, 0)
+    dtype = PRECISIONS[precision]
+    expected = [normalize_band(band, dtype=dtype) for band in get_bands(img, precision=precision)[:6]]
+    cache = BandCache(str(tmp_path / "cache"))
+    # The second pipeline reads the bands from the cache as read-only memory maps
+    for _ in range(2):
+        normalized = Pipeline(img, precision=precision, band_cache=cache).get("normalized")
+        for band, reference in zip((normalized.b12, normalized.b11, normalized.b8a, normalized.b04, normalized.b03, normalized.b02), expected):
+            np.testing.assert_array_equal(band, reference)
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+from benchmark_precision import detect, MASK_TOLERANCE
+from pipeline import Pipeline
+from synthetic_scene import write_scene
+
+# The float32 mode against the float64 results, within the tolerance documented in benchmark_precision.py
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_float32_masks_within_tolerance(tmp_path, seed):
+    img = write_scene(str(tmp_path / "scene"), 400, seed)
+    reference, reference_regions, _, _ = detect(img, "float64", 1)
+    masks, amount_regions, _, _ = detect(img, "float32", 1)
+    assert reference["outer fire"].any() and reference["burnt area"].any()
+    assert amount_regions == reference_regions
+    for name, tolerance in MASK_TOLERANCE.items():
+        differing = np.count_nonzero((reference[name] > 0) != (masks[name] > 0))
+        assert differing <= tolerance * reference[name].size, name
+
+def test_float32_pipeline_keeps_float32(tmp_path):
+    img = write_scene(str(tmp_path / "scene"), 200, 0)
+    pipeline = Pipeline(img, precision="float32")
+    bands = pipeline.get("bands")
+    normalized = pipeline.get("normalized")
+    for band in (bands.b12, bands.b11, bands.b8a, normalized.b12, normalized.b04, normalized.b02):
+        assert band.dtype == np.float32
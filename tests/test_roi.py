@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+import roi
+from bands import normalize_band, SCALING
+from pipeline import Pipeline
+from synthetic_scene import write_scene
+
+# The region of interest detection against the full scene
+
+@pytest.mark.parametrize("b12_min, b12_max", [(0.0001, 1.6), (0.0123, 0.9), (0.05, 6.5535)])
+def test_outer_fire_gate_is_the_outer_fire_test(b12_min, b12_max):
+    values = np.arange(65536)
+    passing = normalize_band(values / SCALING, b12_min, b12_max) > 0.6 / b12_max
+    np.testing.assert_array_equal(values >= roi.outer_fire_gate(b12_min, b12_max), passing)
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_roi_matches_full_scene(tmp_path, seed):
+    img = write_scene(str(tmp_path / "scene"), 600, seed)
+    pipeline = Pipeline(img)
+    fire_mask = pipeline.get("fire_masks").final
+    regions = pipeline.get("regions")
+    assert fire_mask.any()
+
+    result = roi.detect_roi(img)
+    np.testing.assert_array_equal(result.final_fire_mask, fire_mask)
+    np.testing.assert_array_equal(result.labeled_fire > 0, regions.labels > 0)
+    assert result.amount_regions == regions.amount
+
+def test_roi_without_fires(tmp_path):
+    img = write_scene(str(tmp_path / "scene"), 300, 0, burn_scars=0, small_fires=0)
+    result = roi.detect_roi(img)
+    assert result.amount_regions == 0 and not result.final_fire_mask.any() and result.windows == []
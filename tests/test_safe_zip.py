@@ -0,0 +1,64 @@
+import os
+import zipfile
+import numpy as np
+import pytest
+import images
+from bands import get_bands
+from synthetic_scene import write_scene, SCENE_PREFIX
+
+# Bands read from zipped SAFE products, against the same bands in a scene directory
+
+PRODUCT = "S2A_MSIL2A_20240801T120000_N0511_R000_T99SYN_20240801T140000.SAFE"
+GRANULE = "GRANULE/L2A_T99SYN_A000001_20240801T120000"
+MANIFEST = """<?xml version="1.0" encoding="UTF-8"?>
+<xfdu:XFDU xmlns:xfdu="urn:ccsds:schema:xfdu:1"><dataObjectSection>
+{}
+</dataObjectSection></xfdu:XFDU>"""
+
+@pytest.fixture(scope="module")
+def scene(tmp_path_factory):
+    return write_scene(str(tmp_path_factory.mktemp("safe") / "scene"), 64, 0)
+
+def _write_product(path: str, scene: images.Image, manifest: bool = True, cloud_mask: bool = True) -> str:
+    # The layout of a L2A product, with the band names of the product (B8A instead of B8a)
+    files = {}
+    scene_paths = images.get_band_paths(scene)
+    for band, scene_path in zip(images.SAFE_BANDS, scene_paths):
+        files[f"{GRANULE}/IMG_DATA/R20m/{SCENE_PREFIX}_{band}_20m.jp2"] = scene_path
+    if cloud_mask:
+        files[f"{GRANULE}/QI_DATA/MSK_CLDPRB_20m.jp2"] = scene_paths[6]
+    with zipfile.ZipFile(path, "w") as archive:
+        if manifest:
+            locations = "\n".join(f'<dataObject><byteStream><fileLocation href="./{member}"/></byteStream></dataObject>' for member in files)
+            archive.writestr(f"{PRODUCT}/manifest.safe", MANIFEST.format(locations))
+        for member, scene_path in files.items():
+            archive.write(scene_path, f"{PRODUCT}/{member}")
+    return path
+
+@pytest.mark.parametrize("manifest", [True, False])
+def test_bands_match_the_extracted_scene(tmp_path, scene, manifest):
+    zip_path = _write_product(str(tmp_path / f"{PRODUCT}.zip"), scene, manifest=manifest)
+    img = images.from_safe_zip(zip_path)
+    assert img.file_name_prefix == SCENE_PREFIX
+    paths = images.get_band_paths(img)
+    assert all(path.startswith(images.VSIZIP) and images.source_file(path) == os.path.abspath(zip_path) for path in paths)
+    assert all(images.band_exists(path) for path in paths) and images.has_cloud_mask(img)
+    with zipfile.ZipFile(zip_path) as archive:
+        assert images.band_size(paths[0]) == archive.getinfo(paths[0].split(".zip/", 1)[1]).compress_size
+
+    for band, extracted in zip(get_bands(img), get_bands(scene)):
+        np.testing.assert_array_equal(band, extracted)
+
+def test_product_without_cloud_mask(tmp_path, scene):
+    zip_path = _write_product(str(tmp_path / f"{PRODUCT}.zip"), scene, cloud_mask=False)
+    img = images.from_safe_zip(zip_path)
+    assert images.get_band_paths(img)[6].endswith(f"{PRODUCT}/{GRANULE}/QI_DATA/MSK_CLDPRB_20m.jp2")
+    assert not images.has_cloud_mask(img)
+    assert get_bands(img)[6] is None
+
+def test_missing_band(tmp_path):
+    zip_path = str(tmp_path / f"{PRODUCT}.zip")
+    with zipfile.ZipFile(zip_path, "w") as archive:
+        archive.writestr(f"{PRODUCT}/{GRANULE}/IMG_DATA/R20m/{SCENE_PREFIX}_B12_20m.jp2", b"")
+    with pytest.raises(FileNotFoundError):
+        images.from_safe_zip(zip_path)
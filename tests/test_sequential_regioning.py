@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from scipy import ndimage
+import sequential_regioning_cpp
+from sequential_regioning import sequential_regioning
+
+# The C++ labeling against scipy.ndimage.label, regions are numbered in order of their first pixel in both
+
+STRUCTURES = {False: ndimage.generate_binary_structure(2, 1), True: ndimage.generate_binary_structure(2, 2)}
+
+def _mask(seed: int, shape=(157, 203), density: float = 0.45) -> np.ndarray:
+    return (np.random.default_rng(seed).random(shape) < density).astype(np.uint8)
+
+@pytest.mark.parametrize("n8", [False, True])
+@pytest.mark.parametrize("num_threads", [1, 2, 3, 8])
+@pytest.mark.parametrize("seed", [0, 1])
+def test_label_matches_scipy(n8, num_threads, seed):
+    mask = _mask(seed)
+    expected, expected_count = ndimage.label(mask, STRUCTURES[n8])
+    labels, count = sequential_regioning_cpp.label(mask, n8=n8, num_threads=num_threads)
+    assert count == expected_count
+    np.testing.assert_array_equal(labels, expected)
+
+@pytest.mark.parametrize("n8", [False, True])
+@pytest.mark.parametrize("num_threads", [1, 4])
+def test_label_stats_matches_scipy(n8, num_threads):
+    mask = _mask(2)
+    intensities = np.random.default_rng(3).random(mask.shape).astype(np.float32)
+    expected, count = ndimage.label(mask, STRUCTURES[n8])
+    labels, n, stats = sequential_regioning_cpp.label_stats(mask, [intensities], n8=n8, num_threads=num_threads)
+    assert n == count
+    np.testing.assert_array_equal(labels, expected)
+    index = np.arange(1, count + 1)
+    np.testing.assert_array_equal(stats["pixels"], np.bincount(expected.ravel(), minlength=count + 1)[1:])
+    np.testing.assert_allclose(stats["max_intensity"][:, 0], ndimage.maximum(intensities, expected, index))
+
+@pytest.mark.parametrize("image", [
+    _mask(4).astype(np.uint16),
+    _mask(4).astype(bool),
+    _mask(4).astype(np.int32) * 256, # truncated to 0 by a uint8 cast
+    _mask(4).astype(np.int16) * -1,
+    _mask(4) * 0.5, # float64
+    (_mask(4) * 0.5).astype(np.float32),
+    np.asfortranarray(_mask(4)),
+    _mask(4).tolist(),
+], ids=["uint16", "bool", "int32", "int16", "float64", "float32", "fortran", "list"])
+@pytest.mark.parametrize("num_threads", [1, 3])
+def test_other_types_are_labeled_by_non_zero(image, num_threads):
+    expected, expected_count = ndimage.label(np.asarray(image) != 0, STRUCTURES[True])
+    labels, count = sequential_regioning_cpp.label(image, num_threads=num_threads)
+    assert count == expected_count
+    np.testing.assert_array_equal(labels, expected)
+    labels, count, stats = sequential_regioning_cpp.label_stats(image, [], num_threads=num_threads)
+    assert count == expected_count
+    np.testing.assert_array_equal(labels, expected)
+
+def test_label_rejects_other_dimensions():
+    with pytest.raises(RuntimeError):
+        sequential_regioning_cpp.label(np.zeros((2, 2, 2), np.uint8))
+
+@pytest.mark.parametrize("n8", [False, True])
+def test_label_matches_python_reference(n8):
+    # The reference colors every region randomly, each label has to map to exactly one color and vice versa
+    mask = _mask(5, shape=(41, 53), density=0.4).astype(np.uint16)
+    colored, reference_count = sequential_regioning(mask, n8=n8)
+    labels, count = sequential_regioning_cpp.label(mask, n8=n8)
+    assert labels.dtype == np.int32
+    assert count == reference_count
+    foreground = labels > 0
+    np.testing.assert_array_equal(foreground, colored.any(axis=2))
+    colors = colored[foreground].astype(np.int64)
+    color_ids = (colors[:, 0] << 32) | (colors[:, 1] << 16) | colors[:, 2]
+    pairs = np.unique(np.stack((labels[foreground], color_ids), axis=1), axis=0)
+    assert len(pairs) == count == len(np.unique(pairs[:, 1]))
@@ -0,0 +1,34 @@
+import numpy as np
+import tiling
+from pipeline import Pipeline
+from synthetic_scene import write_scene
+
+# The tiled detection against the pipeline on the whole scene
+
+# The reach of the canny hysteresis is only approximated by the halo, so the burnt area may differ near tile borders
+EDGE_TOLERANCE = 1e-3 # share of differing pixels
+
+def test_tiled_matches_full_scene(tmp_path):
+    img = write_scene(str(tmp_path / "scene"), 500, 0)
+    pipeline = Pipeline(img)
+    fire_mask = pipeline.get("fire_masks").final
+    regions = pipeline.get("regions")
+    edges = pipeline.get("burnt_area").combined_edges_opened
+    assert fire_mask.any() and edges.any()
+
+    # The tiles don't divide the scene, so the last row and column of tiles are smaller
+    result = tiling.detect_tiled(img, tile_size=192, max_workers=1)
+    np.testing.assert_array_equal(result.final_fire_mask > 0, fire_mask > 0)
+    np.testing.assert_array_equal(result.labeled_fire > 0, regions.labels > 0)
+    assert result.amount_regions == regions.amount
+    assert result.burning_area == pipeline.get("burning_area")
+
+    # Regions crossing tile borders are merged, their statistics must match the ones of the whole scene
+    by_position = lambda records: np.sort(records, order=["row_min", "col_min"])
+    tiled, full = by_position(result.regions), by_position(regions.records)
+    for field in ("pixels", "row_min", "col_min", "row_max", "col_max", "max_b12", "max_b11"):
+        np.testing.assert_array_equal(tiled[field], full[field])
+    np.testing.assert_allclose(tiled["centroid_row"], full["centroid_row"])
+    np.testing.assert_allclose(tiled["centroid_col"], full["centroid_col"])
+
+    assert np.count_nonzero((result.combined_edges_opened > 0) != (edges > 0)) <= EDGE_TOLERANCE * edges.size
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from timeseries import track_fires
+
+# The tracking of the fires between two scenes on small label images
+
+SHAPE = (12, 20)
+
+def _raster(blocks: dict) -> np.ndarray:
+    raster = np.zeros(SHAPE, np.int32)
+    for value, (rows, cols) in blocks.items():
+        raster[rows, cols] = value
+    return raster
+
+PREVIOUS_IDS = _raster({
+    5: (slice(0, 2), slice(0, 4)), # continues with the same area
+    6: (slice(0, 2), slice(6, 8)), # grows
+    7: (slice(4, 6), slice(0, 5)), # shrinks
+    8: (slice(4, 6), slice(7, 15)), # splits into a smaller part keeping its id and a new fire
+    9: (slice(8, 10), slice(0, 4)), # merges with 10
+    10: (slice(8, 10), slice(5, 7)),
+    11: (slice(11, 12), slice(0, 4)), # extinguished
+    12: (slice(11, 12), slice(10, 14)), # below clouds
+})
+LABELS = _raster({
+    1: (slice(0, 2), slice(0, 4)),
+    2: (slice(0, 3), slice(6, 8)),
+    3: (slice(4, 5), slice(0, 5)),
+    4: (slice(4, 6), slice(7, 12)), # the larger part of 8 keeps its id
+    5: (slice(4, 6), slice(13, 15)),
+    6: (slice(8, 10), slice(0, 7)), # covers 9 and 10, 9 overlaps more
+    7: (slice(11, 12), slice(16, 19)), # new
+})
+CLOUDY = _raster({1: (slice(10, 12), slice(9, 15))}) > 0
+
+def _ids(changes: dict) -> dict:
+    return {kind: sorted(change["id"] for change in kind_changes) for kind, kind_changes in changes.items()}
+
+def test_track_fires():
+    fire_ids, changes, next_id = track_fires(LABELS, 7, PREVIOUS_IDS, CLOUDY, 20)
+    assert _ids(changes) == {"new": [20, 21], "grown": [6, 9], "shrunk": [7, 8], "continuing": [5], "merged": [10],
+                             "extinguished": [11], "obscured": [12]}
+    assert next_id == 22
+    expected_ids = np.array([0, 5, 6, 7, 8, 20, 9, 21])
+    np.testing.assert_array_equal(fire_ids, expected_ids[LABELS])
+
+    new = {change["id"]: change for change in changes["new"]}
+    assert new[20]["split_from"] == 8 and "split_from" not in new[21]
+    assert changes["merged"] == [{"id": 10, "into": 9}]
+    grown = {change["id"]: change for change in changes["grown"]}
+    assert grown[9]["area_km2"] == pytest.approx(14 * 400 / 1e6)
+    assert grown[9]["previous_area_km2"] == pytest.approx(8 * 400 / 1e6)
+
+def test_track_fires_without_cloud_mask():
+    _, changes, _ = track_fires(LABELS, 7, PREVIOUS_IDS, None, 20)
+    assert _ids(changes)["extinguished"] == [11, 12] and changes["obscured"] == []
+
+def test_track_fires_without_previous_fires():
+    fire_ids, changes, next_id = track_fires(LABELS, 7, np.zeros(SHAPE, np.int32), None, 1)
+    assert _ids(changes)["new"] == list(range(1, 8)) and next_id == 8
+    np.testing.assert_array_equal(fire_ids, LABELS)
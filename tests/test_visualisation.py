@@ -0,0 +1,100 @@
+import matplotlib
+matplotlib.use("Agg")
+import numpy as np
+import pytest
+import morphology
+from visualisation import ImagePyramid, PYRAMID_MIN_SIZE, ThresholdOverlay
+
+# The incremental threshold overlay against painting the whole image again, and the levels of the image pyramids
+
+SHAPE = (300, 530) # not a multiple of the blocks
+COLOR = (1, 0, 0)
+
+def _bands(dtype):
+    rng = np.random.default_rng(0)
+    bands = [rng.random(SHAPE).astype(dtype) for _ in range(2)]
+    bands[0][::7, ::11] = np.nan # never above a threshold
+    return bands
+
+def _base_img():
+    return np.random.default_rng(1).random(SHAPE + (3,))
+
+def _full(bands, base_img, values, dilate_size):
+    mask = np.logical_and.reduce([band > value for band, value in zip(bands, values)]).astype(np.uint8)
+    if dilate_size > 0:
+        mask = morphology.dilate(mask, dilate_size)
+    img = (np.clip(base_img, 0, 1) * 255 + 0.5).astype(np.uint8)
+    img[mask > 0] = np.array(COLOR, np.uint8) * 255
+    return img
+
+# Small steps are applied incrementally, large ones (more than MAX_INCREMENTAL_SHARE) recompute the mask
+VALUES = [(0.99, 0.99), (0.98, 0.99), (0.985, 0.97), (0.5, 0.5), (0.51, 0.5), (0.2, 0.9), (1.0, 1.0), (0.9, 0.1)]
+
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+@pytest.mark.parametrize("dilate_size", [0, 5])
+def test_incremental_matches_full(dtype, dilate_size):
+    bands, base_img = _bands(dtype), _base_img()
+    overlay = ThresholdOverlay(bands, base_img, col=COLOR, dilate_size=dilate_size)
+    for values in VALUES:
+        np.testing.assert_array_equal(overlay(values), _full(bands, base_img, values, dilate_size), err_msg=str(values))
+
+def test_blocks_outside_of_the_viewport_are_painted_when_visible():
+    bands, base_img = _bands(np.float64), _base_img()
+    overlay = ThresholdOverlay(bands, base_img, col=COLOR, dilate_size=3)
+    rows, cols = slice(10, 120), slice(300, 420)
+    overlay.set_viewport(rows, cols)
+    for values in VALUES[:3]:
+        image = overlay(values)
+        np.testing.assert_array_equal(image[rows, cols], _full(bands, base_img, values, 3)[rows, cols])
+    overlay.set_viewport(slice(0, SHAPE[0]), slice(0, SHAPE[1]))
+    np.testing.assert_array_equal(overlay.image, _full(bands, base_img, VALUES[2], 3))
+
+def test_threshold_between_float32_values():
+    # A float64 threshold between two float32 values of the band, compared like band > value
+    band = np.array([[0.1, 0.2, 0.3]], np.float32)
+    overlay = ThresholdOverlay([band], np.zeros((1, 3, 3)), col=COLOR)
+    overlay((0.9,))
+    image = overlay((np.float64(np.float32(0.2)) - 1e-12,))
+    np.testing.assert_array_equal(image[0, :, 0] > 0, band[0] > np.float64(np.float32(0.2)) - 1e-12)
+
+def _pooled(img: np.ndarray, level: int, pooling: str) -> np.ndarray:
+    # Every pixel of a level covers 2^level x 2^level pixels, the last row and column are repeated for odd sizes
+    step = 2**level
+    rows = -(-img.shape[0] // step) * step
+    cols = -(-img.shape[1] // step) * step
+    padded = np.pad(img, [(0, rows - img.shape[0]), (0, cols - img.shape[1])] + [(0, 0)] * (img.ndim - 2), mode="edge")
+    blocks = padded.reshape(rows // step, step, cols // step, step, *img.shape[2:])
+    return blocks.max(axis=(1, 3)) if pooling == "max" else blocks.mean(axis=(1, 3))
+
+def test_max_pooled_levels_keep_single_pixels():
+    mask = np.zeros((1100, 2100), np.uint8)
+    mask[517, 1333] = 1 # a small fire
+    pyramid = ImagePyramid(mask, "max")
+    assert pyramid.levels[0] is mask
+    assert max(pyramid.levels[-1].shape) <= PYRAMID_MIN_SIZE < max(pyramid.levels[-2].shape)
+    for level in range(pyramid.level_count):
+        np.testing.assert_array_equal(pyramid.levels[level], _pooled(mask, level, "max"))
+        assert np.count_nonzero(pyramid.levels[level]) == 1
+
+def test_mean_pooled_levels():
+    img = np.random.default_rng(2).random((1300, 700, 3)).astype(np.float32)
+    pyramid = ImagePyramid(img)
+    assert pyramid.level_count == 3
+    # Averaging the averages of odd sizes repeats other pixels than averaging all at once, only the first level is exact
+    np.testing.assert_allclose(pyramid.levels[1], _pooled(img, 1, "mean"), rtol=1e-6)
+    assert pyramid.levels[2].shape == (325, 175, 3)
+    assert pyramid.levels[2].dtype == np.float32
+
+def test_crop_and_update():
+    mask = np.zeros((1500, 1500), np.uint8)
+    pyramid = ImagePyramid(mask, "max")
+    rows, cols = slice(700, 900), slice(1010, 1300)
+    mask[800, 1100] = 1
+    pyramid.update(rows, cols)
+    rebuilt = ImagePyramid(mask, "max")
+    for level in range(pyramid.level_count):
+        np.testing.assert_array_equal(pyramid.levels[level], rebuilt.levels[level])
+        crop = pyramid.crop(level, rows, cols)
+        step = 2**level
+        assert crop.shape == (-(-900 // step) - 700 // step, -(-1300 // step) - 1010 // step)
+        assert crop.any()
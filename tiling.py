@@ -0,0 +1,313 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from rasterio.windows import Window
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+import images
+import detection
+import fire_regions
+import profiling
+from cog_writer import CogWriter
+from bands import load_band, band_shape, normalize_band, SCALING
+
+# The magnitude of a 3x3 sobel on values between 0 and 1 can't exceed 4 * sqrt(2)
+SOBEL_MAGNITUDE_LIMIT = 4 * np.sqrt(2)
+SOBEL_HISTOGRAM_BINS = 1 << 16
+
+@dataclass
+class Tile:
+    row: int
+    col: int
+    height: int
+    width: int
+
+    def window(self, shape: Tuple[int, int], halo: int = 0) -> Window:
+        """
+        Returns the window of the tile enlarged by the halo, clipped to the scene.
+        """
+        row_start, col_start = max(self.row - halo, 0), max(self.col - halo, 0)
+        row_end = min(self.row + self.height + halo, shape[0])
+        col_end = min(self.col + self.width + halo, shape[1])
+        return Window(col_start, row_start, col_end - col_start, row_end - row_start)
+
+    def core(self, shape: Tuple[int, int], halo: int = 0) -> Tuple[slice, slice]:
+        """
+        Returns the slices of the tile inside of the array read with window(shape, halo).
+        """
+        window = self.window(shape, halo)
+        row_start, col_start = self.row - window.row_off, self.col - window.col_off
+        return slice(row_start, row_start + self.height), slice(col_start, col_start + self.width)
+
+@dataclass
+class SceneStats:
+    """
+    Statistics of the whole scene that the per-tile processing depends on.
+    """
+    band_min: Tuple[float, ...] # B12, B11, B8A, B04, B03, B02
+    band_max: Tuple[float, ...]
+    ratio_range: Tuple[float, float]
+    fill_value: float
+    thresholds: Optional[detection.EdgeThresholds] = None
+
+@dataclass
+class TiledResult:
+    final_fire_mask: np.ndarray
+    labeled_fire: np.ndarray # int32 labels, 0 is background
+    amount_regions: int
+    regions: np.ndarray # fire_regions.REGION_DTYPE records, one per label
+    combined_edges_opened: np.ndarray
+    burning_area: float # km^2
+
+
+def tile_grid(shape: Tuple[int, int], tile_size: int) -> List[Tile]:
+    height, width = shape
+    return [
+        Tile(row, col, min(tile_size, height - row), min(tile_size, width - col))
+        for row in range(0, height, tile_size)
+        for col in range(0, width, tile_size)
+    ]
+
+def _read(paths, window: Window) -> List[np.ndarray]:
+    return [load_band(path, window) / SCALING for path in paths]
+
+
+# Pass 1 - band ranges and burn ratio statistics
+
+def _band_stats(paths, tile: Tile, shape):
+    b12, b11, b8a, b04, b03, b02 = _read(paths, tile.window(shape))
+    scene_bands = (b12, b11, b8a, b04, b03, b02)
+
+    ratio = detection.burn_ratio(b12, b11)
+    ratio_min = ratio.min()
+    mean_mask = np.clip(b11, 0, 1) >= 0.2
+    at_min = mean_mask & (ratio == ratio_min)
+    return {
+        "band_min": [band.min() for band in scene_bands],
+        "band_max": [band.max() for band in scene_bands],
+        "ratio_min": ratio_min,
+        "ratio_max": ratio.max(),
+        # The mean only includes ratios above the scene minimum, so the pixels at the tile minimum
+        # are counted separately and removed if the tile minimum turns out to be the scene minimum
+        "mask_sum": ratio[mean_mask].sum(),
+        "mask_count": np.count_nonzero(mean_mask),
+        "at_min_count": np.count_nonzero(at_min),
+    }
+
+def _combine_band_stats(tile_stats) -> SceneStats:
+    band_min = tuple(np.min([s["band_min"] for s in tile_stats], axis=0))
+    band_max = tuple(np.max([s["band_max"] for s in tile_stats], axis=0))
+    ratio_min = min(s["ratio_min"] for s in tile_stats)
+    ratio_max = max(s["ratio_max"] for s in tile_stats)
+
+    mask_sum, mask_count = 0.0, 0
+    for s in tile_stats:
+        at_min_count = s["at_min_count"] if s["ratio_min"] == ratio_min else 0
+        mask_sum += s["mask_sum"] - at_min_count * ratio_min
+        mask_count += s["mask_count"] - at_min_count
+
+    # Mean of the normalized burn index (normalization is linear, so it can be applied to the mean)
+    mean_ratio = mask_sum / mask_count if mask_count > 0 else np.nan
+    fill_value = (mean_ratio - ratio_min) / (ratio_max - ratio_min + 1e-6)
+    return SceneStats(band_min, band_max, (ratio_min, ratio_max), fill_value)
+
+
+# Pass 2 - distribution of the sobel magnitude for the edge thresholds
+
+def _sobel_bins(edges_sobel: np.ndarray) -> np.ndarray:
+    bins = (edges_sobel * (SOBEL_HISTOGRAM_BINS / SOBEL_MAGNITUDE_LIMIT)).astype(np.int64)
+    return np.minimum(bins, SOBEL_HISTOGRAM_BINS - 1)
+
+def _tile_sobel(paths, tile: Tile, shape, stats: SceneStats) -> np.ndarray:
+    halo = detection.smoothing_halo()
+    b12, b11, b8a = _read(paths[:3], tile.window(shape, halo))
+    burn_index = detection.burn_index(b12, b11, b8a, stats.ratio_range, stats.fill_value)
+    return detection.sobel_magnitude(burn_index)[tile.core(shape, halo)]
+
+def _edge_stats(paths, tile: Tile, shape, stats: SceneStats):
+    edges_sobel = _tile_sobel(paths, tile, shape, stats)
+    histogram = np.bincount(_sobel_bins(edges_sobel).ravel(), minlength=SOBEL_HISTOGRAM_BINS)
+    return edges_sobel.min(), edges_sobel.max(), histogram
+
+def _edge_bin_values(paths, tile: Tile, shape, stats: SceneStats, bins):
+    edges_sobel = _tile_sobel(paths, tile, shape, stats)
+    edge_bins = _sobel_bins(edges_sobel)
+    return {b: edges_sobel[edge_bins == b] for b in bins}
+
+def _percentile_ranks(count: int, q: float) -> Tuple[int, int, float]:
+    # Same ranks and interpolation as np.percentile (linear)
+    rank = (count - 1) * q / 100
+    return int(np.floor(rank)), int(np.ceil(rank)), rank - np.floor(rank)
+
+def _edge_thresholds(tile_stats, bin_values_of_tiles, histogram) -> detection.EdgeThresholds:
+    sobel_min = float(min(s[0] for s in tile_stats))
+    sobel_max = float(max(s[1] for s in tile_stats))
+    cumulative = np.cumsum(histogram)
+
+    def value_at(rank):
+        # The histogram tells the bin of the rank, the values of that bin tell the exact value
+        b = int(np.searchsorted(cumulative, rank, side="right"))
+        before = cumulative[b - 1] if b > 0 else 0
+        values = np.sort(np.concatenate([v[b] for v in bin_values_of_tiles]))
+        return values[rank - before]
+
+    def normalized_percentile(q):
+        low, high, fraction = _percentile_ranks(int(cumulative[-1]), q)
+        value = value_at(low) + (value_at(high) - value_at(low)) * fraction
+        return float(detection.normalize_sobel(value, sobel_min, sobel_max))
+
+    return detection.EdgeThresholds(
+        sobel_min=sobel_min,
+        sobel_max=sobel_max,
+        sobel_threshold=normalized_percentile(98),
+        canny_low=normalized_percentile(90),
+        canny_high=normalized_percentile(95),
+    )
+
+def _percentile_bins(histogram: np.ndarray) -> List[int]:
+    # Bins that hold the values np.percentile interpolates between
+    cumulative = np.cumsum(histogram)
+    bins = set()
+    for q in (90, 95, 98):
+        for rank in _percentile_ranks(int(cumulative[-1]), q)[:2]:
+            bins.add(int(np.searchsorted(cumulative, rank, side="right")))
+    return sorted(bins)
+
+
+# Pass 3 - detection
+
+def _detect_tile(paths, tile: Tile, shape, stats: SceneStats, halo: int):
+    b12, b11, b8a, b04, b03, b02 = _read(paths, tile.window(shape, halo))
+    core = tile.core(shape, halo)
+
+    # 1. Fire-detection
+    normalized = [
+        normalize_band(band, band_min, band_max)
+        for band, band_min, band_max in zip((b12, b11, b8a, b04, b03, b02), stats.band_min, stats.band_max)
+    ]
+    outer_fire_mask, core_fire_mask = detection.fire_masks(*normalized, stats.band_max)
+    del normalized
+    final_fire_mask = outer_fire_mask | core_fire_mask
+
+    # 2. Regioning of the fires, only the core is labeled, the tiles are merged when stitching
+    combined_region_opened = detection.prepare_regions(final_fire_mask)[core]
+    labeled_fire, amount_regions, region_stats = fire_regions.label_regions(combined_region_opened, b12[core], b11[core], n8=True)
+    region_stats = fire_regions.shift_raw_stats(region_stats, tile.row, tile.col)
+
+    # 3. Detecting the burned area
+    burn_index = detection.burn_index(b12, b11, b8a, stats.ratio_range, stats.fill_value)
+    _, _, combined_edges_opened = detection.burnt_area_edges(burn_index, stats.thresholds)
+
+    return (
+        final_fire_mask[core].astype(np.uint8),
+        labeled_fire,
+        amount_regions,
+        region_stats,
+        combined_edges_opened[core].astype(np.uint8),
+        burn_index[core].astype(np.float32),
+    )
+
+def _seam_pairs(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # Label pairs of two neighbouring lines that touch (8-neighbourhood)
+    pairs = []
+    for a_line, b_line in ((a, b), (a[:-1], b[1:]), (a[1:], b[:-1])):
+        touching = (a_line > 0) & (b_line > 0)
+        pairs.append(np.stack((a_line[touching], b_line[touching]), axis=1))
+    return np.concatenate(pairs)
+
+def merge_regions(labeled_fire: np.ndarray, tiles: List[Tile], amount_labels: int) -> Tuple[int, np.ndarray]:
+    """
+    Merges the regions that continue across tile borders and relabels in place.
+    Returns the region count and the mapping from the tile labels to the merged labels.
+    """
+    pairs = [np.empty((0, 2), np.int32)]
+    for row in sorted({t.row for t in tiles if t.row > 0}):
+        pairs.append(_seam_pairs(labeled_fire[row - 1], labeled_fire[row]))
+    for col in sorted({t.col for t in tiles if t.col > 0}):
+        pairs.append(_seam_pairs(labeled_fire[:, col - 1], labeled_fire[:, col]))
+    pairs = np.concatenate(pairs)
+
+    graph = coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(amount_labels + 1, amount_labels + 1))
+    # The background (0) is never connected, so it stays component 0 and the regions become 1..n
+    amount_components, components = connected_components(graph, directed=False)
+    components = components.astype(np.int32)
+    for tile in tiles:
+        rows, cols = slice(tile.row, tile.row + tile.height), slice(tile.col, tile.col + tile.width)
+        labeled_fire[rows, cols] = components[labeled_fire[rows, cols]]
+    return amount_components - 1, components
+
+def _map(function, items, executor):
+    return executor.map(function, items) if executor is not None else map(function, items)
+
+def detect_tiled(img: images.Image, tile_size: int = 1024, max_workers: Optional[int] = None, halo: Optional[int] = None,
+                 writers: Optional[Dict[str, CogWriter]] = None) -> TiledResult:
+    """
+    Runs fire detection, regioning and burnt area detection tile by tile.
+    Every tile is read through a rasterio window with an overlap (halo) for the smoothing and the morphology kernels,
+    so the fire mask and the regions match the ones of the whole scene. The burnt area can differ near the tile
+    borders, since the halo only approximates the reach of the canny hysteresis (see detection.edge_halo).
+    The bands and intermediate results are only held per tile, the returned fire mask, labels and burnt area
+    are full-scene arrays (6 bytes per pixel).
+    max_workers = 1 processes the tiles in this process, otherwise a process pool is used.
+    The tiles of the fire mask, the burnt area and the burn index are written to the writers given for
+    "fire", "burnt_area" and "burn_index" as soon as they are detected (see cog_writer.py).
+
+    The thresholds depend on statistics of the whole scene, so the tiles are read in several passes:
+    band ranges and burn index mean, the histogram of the sobel magnitude, the values of the histogram
+    bins holding the percentiles and finally the detection itself.
+    """
+    paths = images.get_band_paths(img)[:6]
+    shape = band_shape(paths[0])
+    halo = detection.pipeline_halo() if halo is None else halo
+    tiles = tile_grid(shape, tile_size)
+
+    executor = ProcessPoolExecutor(max_workers) if max_workers != 1 else None
+    try:
+        # The passes are profiled as a whole, the tiles may run in other processes
+        with profiling.stage("tiled.band_stats", tiles=len(tiles)):
+            stats = _combine_band_stats(list(_map(partial(_band_stats, paths, shape=shape), tiles, executor)))
+        with profiling.stage("tiled.edge_stats", tiles=len(tiles)):
+            edge_stats = list(_map(partial(_edge_stats, paths, shape=shape, stats=stats), tiles, executor))
+            histogram = np.sum([s[2] for s in edge_stats], axis=0)
+            bins = _percentile_bins(histogram)
+            bin_values = list(_map(partial(_edge_bin_values, paths, shape=shape, stats=stats, bins=bins), tiles, executor))
+            stats.thresholds = _edge_thresholds(edge_stats, bin_values, histogram)
+
+        final_fire_mask = np.zeros(shape, np.uint8)
+        labeled_fire = np.zeros(shape, np.int32)
+        combined_edges_opened = np.zeros(shape, np.uint8)
+        amount_labels = 0
+        region_stats = []
+        detect = partial(_detect_tile, paths, shape=shape, stats=stats, halo=halo)
+        writers = writers or {}
+        with profiling.stage("tiled.detect", tiles=len(tiles), halo=halo) as record:
+            for tile, (fire, labels, amount, stats_of_tile, edges, burn_index) in zip(tiles, _map(detect, tiles, executor)):
+                for name, tile_result in (("fire", fire), ("burnt_area", edges), ("burn_index", burn_index)):
+                    if name in writers:
+                        writers[name].write(tile_result, tile.row, tile.col)
+                rows, cols = slice(tile.row, tile.row + tile.height), slice(tile.col, tile.col + tile.width)
+                final_fire_mask[rows, cols] = fire
+                labels[labels > 0] += amount_labels # unique labels over all tiles
+                labeled_fire[rows, cols] = labels
+                region_stats.append(stats_of_tile)
+                combined_edges_opened[rows, cols] = edges
+                amount_labels += amount
+            record.output((final_fire_mask, labeled_fire, combined_edges_opened))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    with profiling.stage("tiled.merge_regions") as record:
+        amount_regions, components = merge_regions(labeled_fire, tiles, amount_labels)
+        regions = fire_regions.region_records(fire_regions.merge_raw_stats(region_stats, components, amount_regions))
+        record.set(regions=amount_regions)
+    return TiledResult(
+        final_fire_mask=final_fire_mask,
+        labeled_fire=labeled_fire,
+        amount_regions=amount_regions,
+        regions=regions,
+        combined_edges_opened=combined_edges_opened,
+        burning_area=detection.burning_area(final_fire_mask),
+    )
@@ -0,0 +1,245 @@
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+import rasterio
+from rasterio.transform import Affine, array_bounds
+from rasterio.warp import reproject, Resampling, transform_bounds
+import images
+import cog_writer
+import detection
+from bands import band_georeference, SCALING
+from batch import find_scenes
+from catalog import parse_scene_name
+from pipeline import Pipeline
+
+# Fire progression over repeated acquisitions. Every MGRS tile keeps the state of its last scene in <state>/<tile>/:
+# the fire ids (labels.tif, the labels of the regions, but a fire keeps its id from scene to scene), the burn index
+# (burn_index.tif), the burnt area of all scenes so far (burnt_area.tif) and state.json.
+# A new scene is only compared with the states sensed before it, of its own tile and of all overlapping tiles,
+# reprojected onto the grid of the new scene, so the history is never processed again.
+# Usage: python timeseries.py SCENE_OR_DIRECTORY [...] --state state --output changes
+#
+# The changes of a scene are new, grown, shrunk, continuing, merged and extinguished fires and the newly burnt area.
+# A previous fire that is mostly below clouds is obscured instead of extinguished.
+
+STATE_FILE = "state.json"
+NEXT_ID_FILE = "next_fire_id.json" # fire ids are unique over all tiles
+GROWTH_SHARE = 0.1 # a fire grew or shrank if its area changed by more than this share
+OBSCURED_CLOUD_PROBABILITY = 50 # percent
+OBSCURED_SHARE = 0.5 # share of a previous fire below clouds that makes it obscured
+
+def _km2(pixels) -> float:
+    return round(float(pixels) * detection.PIXEL_AREA / 1000000, 4)
+
+def tile_states(state_dir: str) -> List[dict]:
+    """
+    Returns the states of all tiles (contents of their state.json), oldest first.
+    """
+    states = []
+    for tile in sorted(os.listdir(state_dir)) if os.path.isdir(state_dir) else []:
+        path = os.path.join(state_dir, tile, STATE_FILE)
+        if os.path.exists(path):
+            with open(path) as f:
+                states.append(json.load(f))
+    return sorted(states, key=lambda state: state["sensing_time"])
+
+def _reprojected(path: str, shape: Tuple[int, int], transform: Affine, crs, resampling: Resampling, dtype, nodata) -> np.ndarray:
+    # A raster of a state on the grid of the new scene, nodata outside of it
+    destination = np.full(shape, nodata, dtype)
+    with rasterio.open(path) as src:
+        if src.crs == crs and src.transform == transform and src.shape == shape:
+            return src.read(1).astype(dtype, copy=False)
+        reproject(rasterio.band(src, 1), destination, dst_transform=transform, dst_crs=crs, dst_nodata=nodata, resampling=resampling)
+    return destination
+
+def _footprint(state: dict, tile_dir: str):
+    # Bounds and CRS of a state, those of states written before they were stored are read from the header of its burn index
+    if "bounds" in state and "crs" in state:
+        return state["bounds"], state["crs"]
+    with rasterio.open(cog_writer.result_path(tile_dir, "burn_index")) as src:
+        return tuple(src.bounds), src.crs
+
+def _overlaps(bounds, state_crs, shape: Tuple[int, int], transform: Affine, crs) -> bool:
+    # The bounds of a state in the CRS of the new scene enclose its footprint, so a state outside of them is skipped safely
+    left, bottom, right, top = transform_bounds(state_crs, crs, *bounds)
+    scene_left, scene_bottom, scene_right, scene_top = array_bounds(shape[0], shape[1], transform)
+    return left < scene_right and scene_left < right and bottom < scene_top and scene_bottom < top
+
+def previous_state(state_dir: str, shape: Tuple[int, int], transform: Affine, crs, before: datetime):
+    """
+    Returns the fire ids, burn index (NaN where no state covers the scene) and burnt area of all states sensed before
+    the given time on the grid of the new scene, and the scenes they come from.
+    Where states overlap, the fire ids and burn index of the latest one are used and the burnt areas are combined.
+    Only the rasters of states whose footprint intersects the new scene are read.
+    """
+    fire_ids = np.zeros(shape, np.int32)
+    burn_index = np.full(shape, np.nan, np.float32)
+    burnt_area = np.zeros(shape, bool)
+    scenes = []
+    for state in tile_states(state_dir):
+        if datetime.fromisoformat(state["sensing_time"]) >= before:
+            continue
+        tile_dir = os.path.join(state_dir, state["tile"])
+        if not _overlaps(*_footprint(state, tile_dir), shape, transform, crs):
+            continue
+        state_burn_index = _reprojected(cog_writer.result_path(tile_dir, "burn_index"), shape, transform, crs, Resampling.bilinear, np.float32, np.nan)
+        covered = ~np.isnan(state_burn_index)
+        if not covered.any():
+            continue
+        state_fire_ids = _reprojected(cog_writer.result_path(tile_dir, "labels"), shape, transform, crs, Resampling.nearest, np.int32, 0)
+        fire_ids[covered] = state_fire_ids[covered]
+        burn_index[covered] = state_burn_index[covered]
+        burnt_area |= _reprojected(cog_writer.result_path(tile_dir, "burnt_area"), shape, transform, crs, Resampling.nearest, np.uint8, 0) > 0
+        scenes.append(state["scene"])
+    return fire_ids, burn_index, burnt_area, scenes
+
+def _next_fire_id(state_dir: str) -> int:
+    path = os.path.join(state_dir, NEXT_ID_FILE)
+    if not os.path.exists(path):
+        return 1
+    with open(path) as f:
+        return json.load(f)["next_fire_id"]
+
+def _write_json(path: str, content: dict):
+    # Renamed into place, a state is never read half written
+    with open(path + ".tmp", "w") as f:
+        json.dump(content, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def track_fires(labels: np.ndarray, amount: int, previous_ids: np.ndarray, cloudy: Optional[np.ndarray], next_id: int):
+    """
+    Gives the regions of the new scene the ids of the previous fires they overlap most and new ids otherwise.
+    Returns the fire ids raster, the changes of the fires and the next free id.
+    """
+    current_area = np.bincount(labels.ravel(), minlength=amount + 1)
+    previous_area = np.bincount(previous_ids.ravel())
+    overlap = (labels > 0) & (previous_ids > 0)
+    pairs, counts = np.unique(np.stack([labels[overlap], previous_ids[overlap]]), axis=1, return_counts=True)
+
+    # A previous fire continues in the region overlapping it most, other regions overlapping it split off as new fires
+    best = {} # label -> (overlap, previous id)
+    for (label, previous_id), count in zip(pairs.T, counts):
+        if count > best.get(label, (0, 0))[0]:
+            best[label] = (count, previous_id)
+    keeper = {} # previous id -> (overlap, label)
+    for label, (count, previous_id) in best.items():
+        if count > keeper.get(previous_id, (0, 0))[0]:
+            keeper[previous_id] = (count, label)
+
+    lookup = np.zeros(amount + 1, np.int32)
+    changes = {"new": [], "grown": [], "shrunk": [], "continuing": [], "merged": [], "extinguished": [], "obscured": []}
+    for label in range(1, amount + 1):
+        area = int(current_area[label])
+        previous_id = best.get(label, (0, 0))[1]
+        if previous_id and keeper[previous_id][1] == label:
+            lookup[label] = previous_id
+            before = int(previous_area[previous_id])
+            kind = "grown" if area > before * (1 + GROWTH_SHARE) else "shrunk" if area < before * (1 - GROWTH_SHARE) else "continuing"
+            changes[kind].append({"id": int(previous_id), "area_km2": _km2(area), "previous_area_km2": _km2(before)})
+        else:
+            lookup[label] = next_id
+            change = {"id": next_id, "area_km2": _km2(area)}
+            if previous_id:
+                change["split_from"] = int(previous_id)
+            changes["new"].append(change)
+            next_id += 1
+
+    # Previous fires overlapping a region that continues another fire merged into it, the others are gone
+    merged_into = {int(pairs[1, i]): int(lookup[pairs[0, i]]) for i in np.argsort(counts)} # the largest overlap last
+    for previous_id in np.flatnonzero(previous_area):
+        if previous_id == 0 or previous_id in keeper:
+            continue
+        if previous_id in merged_into:
+            changes["merged"].append({"id": int(previous_id), "into": merged_into[previous_id]})
+            continue
+        below_clouds = cloudy is not None and np.count_nonzero(cloudy[previous_ids == previous_id]) > OBSCURED_SHARE * previous_area[previous_id]
+        changes["obscured" if below_clouds else "extinguished"].append({"id": int(previous_id), "previous_area_km2": _km2(previous_area[previous_id])})
+    return lookup[labels], changes, next_id
+
+def update_tile(img: images.Image, state_dir: str = "state", output_dir: Optional[str] = None) -> dict:
+    """
+    Detects the fires and burnt area of a scene, compares them with the previous states and replaces the state of its
+    tile. Returns the changes, which are also written to <output_dir>/<scene>/changes.json with the new fire ids and
+    the newly burnt area as COGs.
+    """
+    tile, sensing_time = parse_scene_name(img.file_name_prefix)
+    tile_dir = os.path.join(state_dir, tile)
+    state_path = os.path.join(tile_dir, STATE_FILE)
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+        if datetime.fromisoformat(state["sensing_time"]) >= sensing_time:
+            raise ValueError(f"The state of tile {tile} is from {state['scene']}, {img.file_name_prefix} isn't newer")
+
+    pipeline = Pipeline(img)
+    bands = pipeline.get("bands")
+    regions = pipeline.get("regions")
+    burn_index = pipeline.get("burn_index").astype(np.float32)
+    burnt_area = pipeline.get("burnt_area").combined_edges_opened > 0
+    transform, crs = band_georeference(images.get_band_paths(img)[0])
+    shape = burn_index.shape
+
+    previous_ids, previous_burn_index, previous_burnt_area, previous_scenes = previous_state(state_dir, shape, transform, crs, sensing_time)
+    cloudy = bands.cm * SCALING >= OBSCURED_CLOUD_PROBABILITY if bands.cm is not None else None
+    fire_ids, changes, next_id = track_fires(regions.labels, regions.amount, previous_ids, cloudy, _next_fire_id(state_dir))
+
+    new_burnt_area = burnt_area & ~previous_burnt_area
+    covered_new = new_burnt_area & ~np.isnan(previous_burn_index)
+    changes = {
+        "scene": img.file_name_prefix,
+        "tile": tile,
+        "sensing_time": sensing_time.isoformat(),
+        "previous_scenes": previous_scenes,
+        **changes,
+        "new_burnt_area_km2": _km2(np.count_nonzero(new_burnt_area)),
+        "burnt_area_km2": _km2(np.count_nonzero(burnt_area | previous_burnt_area)),
+        # Mean change of the burn index in the newly burnt area, where a previous state covers it
+        "new_burnt_burn_index_change": round(float(np.mean(burn_index[covered_new] - previous_burn_index[covered_new])), 4) if covered_new.any() else None,
+    }
+
+    # The state of the tile is replaced, state.json is written last, so an interrupted update keeps the previous state usable
+    os.makedirs(tile_dir, exist_ok=True)
+    cog_writer.write_results(tile_dir, transform, crs, labels=fire_ids, burn_index=burn_index, burnt_area=burnt_area | previous_burnt_area)
+    _write_json(os.path.join(state_dir, NEXT_ID_FILE), {"next_fire_id": next_id})
+    _write_json(state_path, {"tile": tile, "scene": img.file_name_prefix, "sensing_time": sensing_time.isoformat(), "directory": img.directory,
+                             "crs": crs.to_string(), "bounds": list(array_bounds(shape[0], shape[1], transform))})
+
+    if output_dir:
+        scene_dir = os.path.join(output_dir, img.file_name_prefix)
+        os.makedirs(scene_dir, exist_ok=True)
+        cog_writer.write_cog(os.path.join(scene_dir, "fire_ids.tif"), fire_ids, transform, crs)
+        cog_writer.write_cog(os.path.join(scene_dir, "new_burnt_area.tif"), new_burnt_area, transform, crs, mask=True)
+        _write_json(os.path.join(scene_dir, "changes.json"), changes)
+    return changes
+
+def print_changes(changes: dict):
+    print(f"{changes['scene']} (tile {changes['tile']}), compared with {', '.join(changes['previous_scenes']) or 'nothing'}:")
+    for kind in ("new", "grown", "shrunk", "continuing", "merged", "extinguished", "obscured"):
+        if changes[kind]:
+            print(f"  {kind}: {', '.join(str(change['id']) for change in changes[kind])}")
+    print(f"  newly burnt: {changes['new_burnt_area_km2']:.2f} km^2, burnt in total: {changes['burnt_area_km2']:.2f} km^2")
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Fire progression over repeated acquisitions, scene by scene in order of the sensing time.")
+    parser.add_argument("scenes", nargs="+", help="image names of images.py, zipped SAFE products or directories to search for scenes")
+    parser.add_argument("--state", default="state", help="directory of the states of the tiles")
+    parser.add_argument("--output", help="directory for the changes, one subdirectory per scene")
+    args = parser.parse_args(argv)
+
+    scenes = sorted(find_scenes(args.scenes), key=lambda scene: parse_scene_name(scene.name)[1])
+    states = {state["tile"]: datetime.fromisoformat(state["sensing_time"]) for state in tile_states(args.state)}
+    for scene in scenes:
+        tile, sensing_time = parse_scene_name(scene.name)
+        if tile in states and states[tile] >= sensing_time:
+            print(f"Skipping {scene.name}, the state of tile {tile} is newer or the same")
+            continue
+        print_changes(update_tile(scene.img, args.state, args.output))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,14 @@
-from typing import Callable, Dict, Optional, Tuple, List # Added List
+from typing import Callable, Dict, Optional, Sequence, Set, Tuple, List # Added List
 from matplotlib.widgets import Slider
 import numpy as np
 import matplotlib.pyplot as plt
 from dataclasses import dataclass
+import morphology
+
+# Slider events are applied at most once per interval, with the latest values
+SLIDER_UPDATE_INTERVAL_MS = 50
+# Every level of an image pyramid halves the previous one, until its longer side is at most this size
+PYRAMID_MIN_SIZE = 512
 
 @dataclass
 class SliderConfig:
@@ -17,6 +23,7 @@ class Subplot:
     cmap: Optional[str] = None
     slider_configs: Optional[List[SliderConfig]] = None
     slider_update_function: Optional[Callable[[Tuple[float, ...]], np.ndarray]] = None
+    pooling: Optional[str] = None # "max" or "mean" for the downsampled levels, by default "max" for binary masks
 
     def __post_init__(self):
         # Only initialize img if slider_configs and slider_update_function are provided
@@ -25,6 +32,224 @@ class Subplot:
             self.img = self.slider_update_function(tuple(initial_values))
 
 
+def _to_rgb8(img: np.ndarray) -> np.ndarray:
+    if img.dtype == np.uint8:
+        return img.copy()
+    return (np.clip(img, 0, 1) * 255 + 0.5).astype(np.uint8)
+
+def _pool(img: np.ndarray, pooling: str) -> np.ndarray:
+    # Halves both sides, the last row and column are repeated for odd sizes
+    padding = [(0, img.shape[0] % 2), (0, img.shape[1] % 2)] + [(0, 0)] * (img.ndim - 2)
+    if img.shape[0] % 2 or img.shape[1] % 2:
+        img = np.pad(img, padding, mode="edge")
+    blocks = img.reshape(img.shape[0] // 2, 2, img.shape[1] // 2, 2, *img.shape[2:])
+    if pooling == "max":
+        return blocks.max(axis=(1, 3))
+    pooled = blocks.mean(axis=(1, 3), dtype=np.float32)
+    return (np.rint(pooled) if np.issubdtype(img.dtype, np.integer) else pooled).astype(img.dtype)
+
+def _level_slices(rows: slice, cols: slice, level: int) -> Tuple[slice, slice]:
+    # Rows and columns of a level that cover the given full resolution pixels
+    step = 2**level
+    return slice(rows.start // step, -(-rows.stop // step)), slice(cols.start // step, -(-cols.stop // step))
+
+def _is_mask(img: np.ndarray) -> bool:
+    return img.ndim == 2 and (img.dtype == bool or (np.issubdtype(img.dtype, np.integer) and img.size > 0 and img.min() >= 0 and img.max() <= 1))
+
+class ImagePyramid:
+    """
+    The image and versions of it downsampled by 2, 4, 8, ..., so plot can show a zoomed out image with about one pixel
+    per screen pixel. With max pooling a pixel of a downsampled level is set if any of its pixels is, so small fires
+    in binary masks stay visible, mean pooling averages them. The first level is the image itself, not a copy.
+    """
+
+    def __init__(self, img: np.ndarray, pooling: str = "mean"):
+        self.shape = img.shape[:2]
+        self.pooling = pooling
+        self.levels = [img]
+        while max(self.levels[-1].shape[:2]) > PYRAMID_MIN_SIZE:
+            self.levels.append(_pool(self.levels[-1], pooling))
+
+    @property
+    def level_count(self) -> int:
+        return len(self.levels)
+
+    def crop(self, level: int, rows: slice, cols: slice) -> np.ndarray:
+        level_rows, level_cols = _level_slices(rows, cols, level)
+        return self.levels[level][level_rows, level_cols]
+
+    def update(self, rows: slice, cols: slice):
+        """
+        Downsamples a region again after the image changed inside of it.
+        """
+        for level in range(1, len(self.levels)):
+            level_rows, level_cols = _level_slices(rows, cols, 1)
+            parent = self.levels[level - 1]
+            rows = slice(2 * level_rows.start, min(2 * level_rows.stop, parent.shape[0]))
+            cols = slice(2 * level_cols.start, min(2 * level_cols.stop, parent.shape[1]))
+            self.levels[level][level_rows, level_cols] = _pool(parent[rows, cols], self.pooling)
+            rows, cols = level_rows, level_cols
+
+def _first_above(sorted_values: np.ndarray, value: float) -> int:
+    # Index of the first value above the threshold, compared like band > value
+    dtype = sorted_values.dtype
+    if np.result_type(sorted_values, value) == dtype:
+        return int(np.searchsorted(sorted_values, dtype.type(value), side="right"))
+    # Threshold of a higher precision than the band (e.g. float64 for float32), searching it would convert
+    # the whole band. The first value above it is the same as the first one from the next value of the band's dtype
+    above = dtype.type(value)
+    if not above > value:
+        above = np.nextafter(above, dtype.type(np.inf))
+    return int(np.searchsorted(sorted_values, above, side="left"))
+
+class ThresholdOverlay:
+    """
+    Slider update function that marks the pixels where every band is above its slider value in a copy of base_img,
+    like update_img in wildfire-detection.py. The i-th slider of the subplot sets the threshold of bands[i].
+
+    The pixel values of every band are sorted once, so a new threshold only touches the pixels that entered or
+    left the mask. The overlay is updated in place and only in the blocks of pixels that changed. plot shows only
+    the part inside the viewport, blocks outside of it are painted once they are visible (see set_viewport).
+    Zoomed out, plot shows the downsampled base image with the max pooled marks painted on it (see crop).
+    """
+    BLOCK_SIZE = 256
+    # Share of the pixels that may change with one update, beyond it comparing all pixels once is faster
+    # than the scattered updates of the changed ones
+    MAX_INCREMENTAL_SHARE = 1 / 16
+
+    def __init__(self, bands: Sequence[np.ndarray], base_img: np.ndarray, col=(0, 1, 0), dilate_size: int = 0):
+        self.shape = bands[0].shape
+        self.base_img = _to_rgb8(base_img)
+        self.image = self.base_img.copy()
+        self.col = _to_rgb8(np.asarray(col, float))
+        self.dilate_size = dilate_size
+        self.mask = np.zeros(self.shape, np.uint8)
+        self.marks = np.zeros(self.shape, np.uint8) # the painted pixels, the dilated mask
+        self._base_pyramid = ImagePyramid(self.base_img)
+        self._marks_pyramid = ImagePyramid(self.marks, "max")
+
+        index_dtype = np.int32 if self.mask.size < 2**31 else np.int64
+        self._bands = [band.ravel() for band in bands]
+        self._order = []
+        self._sorted = []
+        self._positions = [] # pixels order[position:] of a band are above its threshold
+        self._ends = [] # NaN is sorted to the end and never above a threshold
+        for band in bands:
+            values = band.ravel()
+            order = np.argsort(values, kind="stable").astype(index_dtype)
+            sorted_values = values[order]
+            self._order.append(order)
+            self._sorted.append(sorted_values)
+            self._ends.append(len(sorted_values) - np.count_nonzero(np.isnan(sorted_values)))
+            self._positions.append(self._ends[-1])
+        self._hits = np.zeros(self.mask.size, np.uint8) # amount of bands above their threshold
+
+        blocks = (-(-self.shape[0] // self.BLOCK_SIZE), -(-self.shape[1] // self.BLOCK_SIZE))
+        self._dirty = np.zeros(blocks, bool)
+        self._viewport = (slice(0, self.shape[0]), slice(0, self.shape[1]))
+
+    def __call__(self, values: Tuple[float, ...]) -> np.ndarray:
+        width = self.shape[1]
+        dirty = np.zeros_like(self._dirty)
+        positions = [min(_first_above(sorted_values, value), end) for sorted_values, value, end in zip(self._sorted, values, self._ends)]
+        if sum(abs(new - old) for new, old in zip(positions, self._positions)) > self.MAX_INCREMENTAL_SHARE * self.mask.size:
+            self._hits[:] = 0
+            for band, value in zip(self._bands, values):
+                self._hits += band > value
+            np.equal(self._hits, len(self._order), out=self.mask.ravel(), casting="unsafe")
+            self._positions = positions
+            self._dirty[:] = True
+            self._repaint_viewport()
+            return self.image
+
+        for band_index, position in enumerate(positions):
+            old_position = self._positions[band_index]
+            if position == old_position:
+                continue
+            changed = self._order[band_index][min(position, old_position):max(position, old_position)]
+            if position < old_position:
+                self._hits[changed] += 1 # entered the mask of the band
+            else:
+                self._hits[changed] -= 1
+            self._positions[band_index] = position
+
+            self.mask.ravel()[changed] = self._hits[changed] == len(self._order)
+            dirty[changed // width // self.BLOCK_SIZE, changed % width // self.BLOCK_SIZE] = True
+
+        if dirty.any():
+            if self.dilate_size > 0:
+                # Changed pixels also change the dilated mask in the neighbouring blocks
+                reach = -(-self.dilate_size // self.BLOCK_SIZE)
+                dirty = morphology.dilate(dirty.astype(np.uint8), 2 * reach + 1) > 0
+            self._dirty |= dirty
+            self._repaint_viewport()
+        return self.image
+
+    def set_viewport(self, rows: slice, cols: slice):
+        """
+        Limits the painting to the visible part of the image, pending changes inside of it are painted now.
+        """
+        self._viewport = (rows, cols)
+        self._repaint_viewport()
+
+    @property
+    def level_count(self) -> int:
+        return self._base_pyramid.level_count
+
+    def crop(self, level: int, rows: slice, cols: slice) -> np.ndarray:
+        """
+        The overlay of the given full resolution pixels at a level of the pyramid (see ImagePyramid).
+        """
+        if level == 0:
+            return self.image[rows, cols]
+        img = self._base_pyramid.crop(level, rows, cols).copy()
+        img[self._marks_pyramid.crop(level, rows, cols) > 0] = self.col
+        return img
+
+    def _repaint_viewport(self):
+        rows, cols = self._viewport
+        block_rows = slice(rows.start // self.BLOCK_SIZE, -(-rows.stop // self.BLOCK_SIZE))
+        block_cols = slice(cols.start // self.BLOCK_SIZE, -(-cols.stop // self.BLOCK_SIZE))
+        visible = np.zeros_like(self._dirty)
+        visible[block_rows, block_cols] = True
+        repaint = self._dirty & visible
+        # One region per row of blocks, from the first to the last block to repaint
+        for block_row in np.flatnonzero(repaint.any(axis=1)):
+            block_cols_to_repaint = np.flatnonzero(repaint[block_row])
+            self._repaint(
+                slice(block_row * self.BLOCK_SIZE, min((block_row + 1) * self.BLOCK_SIZE, self.shape[0])),
+                slice(block_cols_to_repaint[0] * self.BLOCK_SIZE, min((block_cols_to_repaint[-1] + 1) * self.BLOCK_SIZE, self.shape[1])),
+            )
+        self._dirty &= ~repaint
+
+    def _repaint(self, rows: slice, cols: slice):
+        if self.dilate_size > 0:
+            # The dilation of the region only depends on the mask up to the kernel size around it
+            outer_rows = slice(max(rows.start - self.dilate_size, 0), min(rows.stop + self.dilate_size, self.shape[0]))
+            outer_cols = slice(max(cols.start - self.dilate_size, 0), min(cols.stop + self.dilate_size, self.shape[1]))
+            dilated = morphology.dilate(self.mask[outer_rows, outer_cols], self.dilate_size)
+            mask = dilated[rows.start - outer_rows.start:rows.stop - outer_rows.start, cols.start - outer_cols.start:cols.stop - outer_cols.start]
+        else:
+            mask = self.mask[rows, cols]
+        self.marks[rows, cols] = mask > 0
+        self._marks_pyramid.update(rows, cols)
+        region = self.image[rows, cols]
+        np.copyto(region, self.base_img[rows, cols])
+        np.copyto(region, self.col, where=mask[..., None] > 0)
+
+def _viewport(ax, shape: Tuple[int, ...]) -> Tuple[slice, slice]:
+    # Pixel rows and columns inside the axes limits, pixel centers are at integer coordinates
+    (x0, x1), (y0, y1) = sorted(ax.get_xlim()), sorted(ax.get_ylim())
+    rows = slice(int(np.clip(np.floor(y0 + 0.5), 0, shape[0] - 1)), int(np.clip(np.ceil(y1 + 0.5), 1, shape[0])))
+    cols = slice(int(np.clip(np.floor(x0 + 0.5), 0, shape[1] - 1)), int(np.clip(np.ceil(x1 + 0.5), 1, shape[1])))
+    return rows, cols
+
+def _level(ax, rows: slice, cols: slice, level_count: int) -> int:
+    # Coarsest level that still has at least one pixel per screen pixel of the axes
+    bbox = ax.get_window_extent()
+    pixels_per_screen_pixel = max((cols.stop - cols.start) / max(bbox.width, 1), (rows.stop - rows.start) / max(bbox.height, 1))
+    return int(np.clip(np.floor(np.log2(max(pixels_per_screen_pixel, 1))), 0, level_count - 1))
+
 def plot(subplots_data: List[Subplot], plot_sync_zoom: bool = True):
 
     num_rows = int(np.ceil(len(subplots_data) / 3))
@@ -38,24 +263,71 @@ def plot(subplots_data: List[Subplot], plot_sync_zoom: bool = True):
     image_artists: Dict[int, plt.AxesImage] = {}
     subplot_slider_value_lists: Dict[int, List[float]] = {}
     subplot_update_functions: Dict[int, Callable[[Tuple[float, ...]], np.ndarray]] = {}
+    renderers: Dict[int, ImagePyramid] = {} # ImagePyramid or ThresholdOverlay of every subplot
     all_sliders = [] 
+    pending_subplots: Set[int] = set() # subplots with slider changes that are not applied yet
+
+    def _pooling(subplot_data: Subplot, img: np.ndarray) -> str:
+        return subplot_data.pooling or ("max" if _is_mask(img) else "mean")
+
+    def _show(subplot_idx: int):
+        # Only the visible part is handed to matplotlib, which copies the data it is given, at the level
+        # of the pyramid that matches the size of the axes on the screen
+        im_ref = image_artists[subplot_idx]
+        renderer = renderers[subplot_idx]
+        rows, cols = _viewport(im_ref.axes, renderer.shape)
+        update_func = subplot_update_functions.get(subplot_idx)
+        if hasattr(update_func, "set_viewport"):
+            update_func.set_viewport(rows, cols)
+        level = _level(im_ref.axes, rows, cols, renderer.level_count)
+        level_rows, level_cols = _level_slices(rows, cols, level)
+        step = 2**level
+        im_ref.set_data(renderer.crop(level, rows, cols))
+        im_ref.set_extent((level_cols.start * step - 0.5, level_cols.stop * step - 0.5, level_rows.stop * step - 0.5, level_rows.start * step - 0.5))
+
+    def _apply_pending_updates():
+        for subplot_idx in sorted(pending_subplots):
+            update_func = subplot_update_functions[subplot_idx]
+            new_img = update_func(tuple(subplot_slider_value_lists[subplot_idx]))
+            if not hasattr(update_func, "crop"):
+                renderers[subplot_idx] = ImagePyramid(new_img, _pooling(subplots_data[subplot_idx], new_img))
+            _show(subplot_idx)
+        pending_subplots.clear()
+        fig.canvas.draw_idle()
+
+    # Dragging a slider fires an event for every mouse move, they are applied together once per interval
+    update_timer = fig.canvas.new_timer(interval=SLIDER_UPDATE_INTERVAL_MS)
+    update_timer.single_shot = True
+    update_timer.add_callback(_apply_pending_updates)
 
     def _global_update_callback(new_val: float, slider_idx: int, subplot_idx: int):
         # Retrieve the specific list of slider values for this subplot
         current_values_list = subplot_slider_value_lists[subplot_idx]
         current_values_list[slider_idx] = new_val # Update the specific slider's value
 
-        im_ref = image_artists[subplot_idx]
-        update_func = subplot_update_functions[subplot_idx]
-
-        new_img = update_func(tuple(current_values_list))
-        im_ref.set_data(new_img)
-        fig.canvas.draw_idle()
+        if not pending_subplots:
+            update_timer.start()
+        pending_subplots.add(subplot_idx)
 
 
     for subplot_index, subplot_data in enumerate(subplots_data):
         ax = axes[subplot_index]
-        im = ax.imshow(subplot_data.img, cmap=subplot_data.cmap)
+        img = subplot_data.img
+        if hasattr(subplot_data.slider_update_function, "crop"):
+            renderer = subplot_data.slider_update_function
+        else:
+            renderer = ImagePyramid(img, _pooling(subplot_data, img))
+        renderers[subplot_index] = renderer
+        # The color limits of the full image, imshow would only see the shown part
+        color_limits = {"vmin": np.nanmin(img), "vmax": np.nanmax(img)} if img.ndim == 2 else {}
+        full_rows, full_cols = slice(0, renderer.shape[0]), slice(0, renderer.shape[1])
+        im = ax.imshow(renderer.crop(renderer.level_count - 1, full_rows, full_cols), cmap=subplot_data.cmap, **color_limits)
+        # The extent of the shown part must not change the limits, zooming and panning shows the visible part
+        ax.set_xlim(-0.5, renderer.shape[1] - 0.5)
+        ax.set_ylim(renderer.shape[0] - 0.5, -0.5)
+        ax.set_autoscale_on(False)
+        ax.callbacks.connect("xlim_changed", lambda _, p_idx=subplot_index: _show(p_idx))
+        ax.callbacks.connect("ylim_changed", lambda _, p_idx=subplot_index: _show(p_idx))
         ax.set_title(subplot_data.title)
         ax.axis('off')
         image_artists[subplot_index] = im
@@ -69,7 +341,6 @@ def plot(subplots_data: List[Subplot], plot_sync_zoom: bool = True):
             subplot_slider_value_lists[subplot_index] = current_subplot_slider_values
             subplot_update_functions[subplot_index] = subplot_data.slider_update_function # Store the update function
 
-
             for slider_idx, slider_config in enumerate(subplot_data.slider_configs):
                 slider_ax = fig.add_axes([bbox_img.x0, current_slider_y, bbox_img.width, slider_height])
                 slider = Slider(
@@ -89,4 +360,11 @@ def plot(subplots_data: List[Subplot], plot_sync_zoom: bool = True):
     for i in range(len(subplots_data), len(axes)):
         axes[i].axis('off')
 
+    # The level depends on the size of the axes on the screen
+    def _show_all(_=None):
+        for subplot_idx in renderers:
+            _show(subplot_idx)
+    fig.canvas.mpl_connect("resize_event", _show_all)
+    _show_all()
+
     plt.show()
\ No newline at end of file
@@ -1,192 +1,167 @@
 import numpy as np
-from sequential_regioning import sequential_regioning
-import visualisation
-from visualisation import Subplot, SliderConfig
-import time
+import os
 import images
-from bands import get_bands, normalize_band
-import cv2
-from scipy.ndimage import gaussian_filter, laplace
-from skimage.feature import canny
-from skimage import measure, morphology
-from skimage.exposure import rescale_intensity
-import sequential_regioning_cpp
-
-# Stacking the image
-def stack_img(band_1, band_2, band_3):
-    img = np.dstack((band_1, band_2, band_3)) # Stacking the bands
-    img /= np.percentile(img, 98) # Optimize contrast
-    img = np.clip(img, 0, 1) # Normalize
-    return img
+from bands import band_georeference, band_shape
+import fire_regions
+import morphology
+import profiling
+from pipeline import Pipeline
+from typing import Optional, Union
+from contextlib import ExitStack
 
 def update_img(orignal_band, value, base_img, col = [0, 1, 0], dilate_size=50):
     mask = orignal_band > value
     if dilate_size > 0:
-        area_dilatation = np.ones((dilate_size, dilate_size), np.uint16)
-        mask = cv2.morphologyEx(mask.astype(np.uint8), cv2.MORPH_DILATE, area_dilatation)
+        mask = morphology.dilate(mask.astype(np.uint8), dilate_size)
     band = base_img.copy()
     band[mask > 0] = col
     return band
 
-def main(img: images.Image, plot_sync_zoom: bool = True, down_scale: bool = True, down_scale_factor: int = 2):
-    time_start = time.time()
-
-    # Loading the bands
-    b12, b11, b8a, b04, b03, b02, cm = get_bands(img)
-
-    # Getting the max value for scaling
-    b12_max = b12.max()
-    b11_max = b11.max()
-    b8a_max = b8a.max()
-    b04_max = b04.max()
-    b03_max = b03.max()
-    b02_max = b02.max()
-
-    print(b12_max, b11_max, b8a_max, b04_max, b03_max, b02_max)
-
-    # Normalizing bands
-    b12_norm = normalize_band(b12)
-    b11_norm = normalize_band(b11)
-    b8a_norm = normalize_band(b8a)
-    b04_norm = normalize_band(b04)
-    b03_norm = normalize_band(b03)
-    b02_norm = normalize_band(b02)
-    
-    # Downscaling the images if required
-    if down_scale:
-        f = down_scale_factor
-        b12_norm = cv2.resize(b12_norm, (b12_norm.shape[1] // f, b12_norm.shape[0] // f), interpolation=cv2.INTER_LINEAR)
-        b11_norm = cv2.resize(b11_norm, (b11_norm.shape[1] // f, b11_norm.shape[0] // f), interpolation=cv2.INTER_LINEAR)
-        b8a_norm = cv2.resize(b8a_norm, (b8a_norm.shape[1] // f, b8a_norm.shape[0] // f), interpolation=cv2.INTER_LINEAR)
-        b04_norm = cv2.resize(b04_norm, (b04_norm.shape[1] // f, b04_norm.shape[0] // f), interpolation=cv2.INTER_LINEAR)
-        b03_norm = cv2.resize(b03_norm, (b03_norm.shape[1] // f, b03_norm.shape[0] // f), interpolation=cv2.INTER_LINEAR)
-        b02_norm = cv2.resize(b02_norm, (b02_norm.shape[1] // f, b02_norm.shape[0] // f), interpolation=cv2.INTER_LINEAR)
-
-    # Stacking the bands
-    infrared = stack_img(b12_norm, b11_norm, b8a_norm)
-    color = stack_img(b04_norm, b03_norm, b02_norm)
-    
-
-    # 1. Fire-detection
-
-    # b11 threshold should be higher the hotter the fire is
-    b11_dynamic_thresh = 0.2 + 0.3 * b12_norm 
-    # Low b11 and b8a (G, B) to exclude clouds and vegetation
-    outer_fire_mask = (b12_norm > (0.6 / b12_max)) & (b11_norm < (b11_dynamic_thresh / b11_max)) & (b8a_norm < (0.5 / b8a_max))
-    outer_fire_mask = outer_fire_mask.astype(np.uint16)
-
-    # Dilate the fire to enlarge the detection radius for the core fire
-    fire_closing = np.ones((135, 135), np.uint16)
-    closed_fire_mask = cv2.morphologyEx(outer_fire_mask, cv2.MORPH_CLOSE, fire_closing)
-
-    # Search for yellow/white fire pixels near the red pixels
-    core_fire = (b12_norm > (0.9 / b12_max)) & (b11_norm > (0.8 / b11_max)) & (closed_fire_mask == 1) # searching for yellow fire pixels
-    cloud_filter = (b04_norm < (0.7 / b04_max)) & (b03_norm < (0.7 / b03_max)) & (b02_norm < (0.7 / b02_max)) # filtering the clouds
-    core_fire_mask = core_fire & cloud_filter
-    core_fire_mask = core_fire_mask.astype(np.uint16)
-
-    # TODO: Problem ==> Fehldetektierte rot-angestrahlte Wolken herausfiltern
-    # Problem an Anwendung von Cloudmask: Unter den Wolken liegende Feuer werden nicht mehr erkannt
-
-    # TODO: Groesse der Filtermasken evtl. je nach Groesse des Feuers dynamisch anpassen
-
-    # Storing the indices of the fire masks
-    outer_fire_indices = np.where(outer_fire_mask)
-    core_fire_indices = np.where(core_fire_mask)
-
-    # Mark the fire in the color image in red and yellow
-    color_marked = color.copy()
-    color_marked[outer_fire_indices[0], outer_fire_indices[1]] = [1, 0, 0] # Mark the outer fire in red
-    color_marked[core_fire_indices[0], core_fire_indices[1]] = [1, 1, 0] # Mark the core fire in yellow
-
-    # Combine the fire masks
-    final_fire_mask = outer_fire_mask | core_fire_mask
-
-    # Increasing the size of the fire marks for visualization
-    visual_dilatation = np.ones((50, 50), np.uint16)
-    final_fire_mask_dilated = cv2.morphologyEx(final_fire_mask.astype(np.uint8), cv2.MORPH_DILATE, visual_dilatation)
-    final_fire_indices = np.where(final_fire_mask_dilated)   
-    color_marked_dilated = color.copy()
-    color_marked_dilated[final_fire_indices[0], final_fire_indices[1]] = [1, 0, 0]
-    
-
-    # 2. Regioning of the fires
-
-    kernel_medium = np.ones((7,7),np.uint16)
-    combined_region_closed = cv2.morphologyEx(final_fire_mask, cv2.MORPH_CLOSE, kernel_medium)
-
-    kernel_small = np.ones((2,2),np.uint16)
-    combined_region_opened = cv2.morphologyEx(combined_region_closed, cv2.MORPH_OPEN, kernel_small)
+def finish_profile(profile_path: Optional[str]):
+    # Written before the plots are shown, which block until they are closed
+    if profiling.disable() is not None:
+        print(f"Profile written to {profile_path}.jsonl and {profile_path}.trace.json")
+
+def export_regions(img: images.Image, labels: np.ndarray, regions: np.ndarray, geojson_path: Optional[str], down_scale_factor: int = 1):
+    fire_regions.print_regions(regions)
+    if geojson_path:
+        transform, crs = band_georeference(images.get_band_paths(img)[0], down_scale_factor)
+        fire_regions.write_geojson(geojson_path, labels, regions, transform, crs)
+        print(f"Fire regions written to {geojson_path}")
+
+def main_tiled(img: images.Image, plot_sync_zoom: bool = True, tile_size: int = 1024, max_workers: Optional[int] = None, geojson_path: Optional[str] = None, output_dir: Optional[str] = None, profile_path: Optional[str] = None, plot: bool = True):
+    with profiling.stage("main_tiled", category="scene", scene=img.file_name_prefix, tile_size=tile_size):
+        # Processing the scene tile by tile, only the resulting masks are kept in memory
+        from tiling import detect_tiled
+        with ExitStack() as stack:
+            writers = {}
+            if output_dir:
+                # The tiles are written as COGs while they are detected
+                import cog_writer
+                os.makedirs(output_dir, exist_ok=True)
+                b12_path = images.get_band_paths(img)[0]
+                transform, crs = band_georeference(b12_path)
+                shape = band_shape(b12_path)
+                writers = {name: stack.enter_context(cog_writer.result_writer(output_dir, name, shape, transform, crs)) for name in ("fire", "burnt_area", "burn_index")}
+            result = detect_tiled(img, tile_size=tile_size, max_workers=max_workers, writers=writers)
+        if output_dir:
+            cog_writer.write_results(output_dir, transform, crs, labels=result.labeled_fire)
+            print(f"Results written to {output_dir}")
+        print(f"Size of active fire area: {result.burning_area}km^2")
+        export_regions(img, result.labeled_fire, result.regions, geojson_path)
+    finish_profile(profile_path)
+    if not plot:
+        return
+    # matplotlib is only imported to show the plots
+    import visualisation
+    from visualisation import Subplot
 
-    # labeled_fire, amount_regions = sequential_regioning(combinedRegion_opened, n8=True) # using the pure Python implementation
-    labeled_fire, amount_regions  = sequential_regioning_cpp.run(combined_region_opened, n8=True) # using the C++ implementation for performance
-
-
-    # 3. Detecting the burned area
-
-    # Clip bands to ignore outliers of the fire / clouds
-    b12_clipped = np.clip(b12, 0, 1)
-    b11_clipped = np.clip(b11, 0, 1)
-    b8a_clipped = np.clip(b8a, 0, 1)
-
-    # Converting the bands to greyscale by dividing b12 with b11 for brightening the burned area
-    burn_index = b12_clipped / (b11_clipped + 1e-6) # added constant denominator to avoid dividing by zero
-
-    # Normalize burn_index to 0–1
-    burn_index = (burn_index - burn_index.min()) / (burn_index.max() - burn_index.min() + 1e-6)
-
-    # Filtering sharp edges that aren't part of the burned area
-    mean_mask = (burn_index > 0) & ((b11_clipped) >= 0.2) # avoid black areas or water for computing the mean
-    mean = burn_index[mean_mask].mean()
-    burn_index[(b11_clipped) < 0.2] = mean     # filtering water
-    burn_index[(b8a_clipped) > 0.5] = mean     # filtering vegetation
-    burn_index[(b11_clipped) > 0.3] = mean     # filtering bright areas
-
-    # Gamma correction to make the image brighter
-    burn_index = burn_index**0.5 
-
-    # Applying sobel operator for edge detection of the burned area
-    smoothed = gaussian_filter(burn_index, sigma=2.0) # applying gaussian filter to smooth small edges
-    sobelx = cv2.Sobel(smoothed, cv2.CV_64F, 1, 0, ksize=3) # in x-direction
-    sobely = cv2.Sobel(smoothed, cv2.CV_64F, 0, 1, ksize=3) # in y-direction
-    edges_sobel = np.hypot(sobelx, sobely) # combine filters
-    edges_sobel = cv2.normalize(edges_sobel, None, 0, 1, cv2.NORM_MINMAX) # normalize
-    binary_edges_sobel = edges_sobel > np.percentile(edges_sobel, 98) # only keep strongest edges
-
-    # Applying canny operator for detecting sharp edges only
-    edges_canny = canny(burn_index, sigma=2.0, low_threshold=np.percentile(edges_sobel, 90), high_threshold=np.percentile(edges_sobel, 95)) 
-    dilated_edges = cv2.morphologyEx(edges_canny.astype(np.uint8), cv2.MORPH_DILATE, kernel_medium)
-
-    # Dilate detected edges by canny in order to limit the detection radius of sobel
-    area_dilatation = np.ones((200, 200), np.uint16)
-    dilated_edges_canny = cv2.morphologyEx(dilated_edges.astype(np.uint8), cv2.MORPH_DILATE, area_dilatation)
+    subplots_data = [
+        Subplot("Aktive Feuer-Pixel (weiß)", result.final_fire_mask, cmap='gray'),
+        Subplot(f"Regionenmarkiertes Feuer | Regions: {result.amount_regions}", result.labeled_fire, cmap='nipy_spectral', pooling="max"),
+        Subplot("Verbrannte Fläche (kombiniert)", result.combined_edges_opened, cmap='gray'),
+    ]
+    visualisation.plot(subplots_data, plot_sync_zoom=plot_sync_zoom)
 
-    combined_edges = binary_edges_sobel & dilated_edges_canny # Keep all sobel pixels that overlap dilated canny area
-    combined_edges_closed = cv2.morphologyEx(combined_edges, cv2.MORPH_CLOSE, kernel_medium) # Close holes in burned area
-    combined_edges_opened = cv2.morphologyEx(combined_edges_closed, cv2.MORPH_OPEN, kernel_small) # Remove artifacts
+def main_roi(img: images.Image, plot_sync_zoom: bool = True, geojson_path: Optional[str] = None, output_dir: Optional[str] = None, profile_path: Optional[str] = None, plot: bool = True):
+    with profiling.stage("main_roi", category="scene", scene=img.file_name_prefix):
+        # Only the windows around the fire candidates are processed (see roi.py)
+        from roi import detect_roi
+        result = detect_roi(img)
+        print(f"{len(result.windows)} windows, {result.processed_share:.1%} of the scene processed at full resolution")
+        if output_dir:
+            import cog_writer
+            transform, crs = band_georeference(images.get_band_paths(img)[0])
+            cog_writer.write_results(output_dir, transform, crs, fire=result.final_fire_mask, labels=result.labeled_fire)
+            print(f"Results written to {output_dir}")
+        print(f"Size of active fire area: {result.burning_area}km^2")
+        export_regions(img, result.labeled_fire, result.regions, geojson_path)
+    finish_profile(profile_path)
+    if not plot:
+        return
+    # matplotlib is only imported to show the plots
+    import visualisation
+    from visualisation import Subplot
 
-    # Computing the size of the burning area
-    number_fire_pixels = np.count_nonzero(final_fire_mask)
-    burning_area = (400 * number_fire_pixels) / 1000000
-    print(f"Size of active fire area: {burning_area}km^2")
+    subplots_data = [
+        Subplot("Aktive Feuer-Pixel (weiß)", result.final_fire_mask, cmap='gray'),
+        Subplot(f"Regionenmarkiertes Feuer | Regions: {result.amount_regions}", result.labeled_fire, cmap='nipy_spectral', pooling="max"),
+    ]
+    visualisation.plot(subplots_data, plot_sync_zoom=plot_sync_zoom)
 
-    time_end = time.time()
-    print(f"Complete Processing time: {time_end - time_start:.2f} seconds")
+def main(img: Union[images.Image, str], plot_sync_zoom: bool = True, down_scale: bool = True, down_scale_factor: int = 2, tiled: bool = False, tile_size: int = 1024, cache_dir: Optional[str] = None, cache_size_gb: float = 4, geojson_path: Optional[str] = None, precision: str = "float64", output_dir: Optional[str] = None, roi: bool = False, profile_path: Optional[str] = None, plot: bool = True):
+    # A scene name (e.g. "T13UFA_20250602T175931") is looked up in the scene catalog of the images folder
+    if isinstance(img, str):
+        import catalog
+        img = catalog.resolve(img)
+    if profile_path:
+        profiling.enable(f"{profile_path}.jsonl", f"{profile_path}.trace.json")
+    if roi:
+        return main_roi(img, plot_sync_zoom=plot_sync_zoom, geojson_path=geojson_path, output_dir=output_dir, profile_path=profile_path, plot=plot)
+    if tiled:
+        return main_tiled(img, plot_sync_zoom=plot_sync_zoom, tile_size=tile_size, geojson_path=geojson_path, output_dir=output_dir, profile_path=profile_path, plot=plot)
+
+    f = down_scale_factor if down_scale else 1
+    with profiling.stage("main", category="scene", scene=img.file_name_prefix, down_scale_factor=f, precision=precision) as record:
+        # The detection as lazily evaluated stages, every stage is computed once when its result is needed first
+        cache = None
+        if cache_dir:
+            from band_cache import BandCache
+            cache = BandCache(cache_dir, int(cache_size_gb * 1024**3))
+        pipeline = Pipeline(img, down_scale_factor=f, precision=precision, band_cache=cache)
+
+        # Loading (downscaled while decoding if required) and normalizing the bands
+        normalized = pipeline.get("normalized")
+        record.set(band_max=[float(value) for value in normalized.band_max])
+
+        # 1. Fire-detection
+        fire_masks = pipeline.get("fire_masks")
+
+        # 2. Regioning of the fires
+        # labeled_fire, amount_regions = sequential_regioning.sequential_regioning(combinedRegion_opened, n8=True) # using the pure Python implementation
+        # using the C++ implementation for performance, the statistics of every fire are collected while labeling
+        regions = pipeline.get("regions")
+        amount_regions = regions.amount
+
+        # 3. Detecting the burned area
+        burn_index = pipeline.get("burn_index")
+        burnt_area = pipeline.get("burnt_area")
+
+        # Computing the size of the burning area
+        burning_area = pipeline.get("burning_area")
+        print(f"Size of active fire area: {burning_area}km^2")
+        export_regions(img, regions.labels, regions.records, geojson_path, f)
+        if output_dir:
+            import cog_writer
+            transform, crs = band_georeference(images.get_band_paths(img)[0], f)
+            cog_writer.write_results(output_dir, transform, crs, fire=fire_masks.final, labels=regions.labels, burn_index=burn_index, burnt_area=burnt_area.combined_edges_opened)
+            print(f"Results written to {output_dir}")
+
+        # Stacked, marked and labeled images, only needed for the plots
+        visual = pipeline.get("visual") if plot else None
+    finish_profile(profile_path)
+    if not plot:
+        return
+    # matplotlib is only imported to show the plots
+    import visualisation
+    from visualisation import Subplot, SliderConfig, ThresholdOverlay
+    b12_norm, b11_norm, b8a_norm = normalized.b12, normalized.b11, normalized.b8a
+    color, infrared = visual.color, visual.infrared
 
     # Visualization
     subplots_data = [
         Subplot("Farbbild (B04, B03, B02 – 20m)", color),
-        Subplot("Farbbild (makiert) (B04, B03, B02 – 20m)", color_marked),
-        Subplot("Farbbild (makiert - groß) (B04, B03, B02 – 20m)", color_marked_dilated),
+        Subplot("Farbbild (makiert) (B04, B03, B02 – 20m)", visual.color_marked),
+        Subplot("Farbbild (makiert - groß) (B04, B03, B02 – 20m)", visual.color_marked_dilated),
         Subplot("Infrarotbild (B12, B11, B8A – 20m)", infrared),
-        #Subplot("Aktive Feuer-Pixel (weiß)", final_fire_mask, cmap='gray'),
+        #Subplot("Aktive Feuer-Pixel (weiß)", fire_masks.final, cmap='gray'),
         #Subplot("Kombiniertes Feuer (Closed))", combinedRegion_closed, cmap='gray'),
         #Subplot("Kombiniertes Feuer (Closed-Open)", combinedRegion_opened, cmap='gray'),
-        Subplot(f"Regionenmarkiertes Feuer | Regions: {amount_regions}", labeled_fire, cmap='gray'),
+        Subplot(f"Regionenmarkiertes Feuer | Regions: {amount_regions}", visual.labeled_fire, cmap='gray', pooling="max"),
         Subplot("Verbrannte Fläche", burn_index, cmap='gray'),
-        Subplot("Verbrannte Fläche (Sobel)", binary_edges_sobel, cmap='gray'),
-        Subplot("Verbrannte Fläche (Canny)", dilated_edges, cmap='gray'),
-        Subplot("Verbrannte Fläche (kombiniert)", combined_edges_opened, cmap='gray'),
+        Subplot("Verbrannte Fläche (Sobel)", burnt_area.binary_edges_sobel, cmap='gray'),
+        Subplot("Verbrannte Fläche (Canny)", burnt_area.dilated_edges, cmap='gray'),
+        Subplot("Verbrannte Fläche (kombiniert)", burnt_area.combined_edges_opened, cmap='gray'),
         #Subplot("b12_norm", b12_norm, cmap='hot'),
         #Subplot("b11_norm", b11_norm, cmap='hot'),
         #Subplot("b8a_norm", b8a_norm, cmap='hot'),
@@ -194,19 +169,19 @@ def main(img: images.Image, plot_sync_zoom: bool = True, down_scale: bool = True
         #     "b12_norm (markiert)",
         #     infrared,
         #     slider_configs=[SliderConfig(initial_value=0.5, range=(0, b12_norm.max()))],
-        #     slider_update_function=lambda x: update_img(b12_norm, x[0], base_img=infrared, col=[0, 1, 0], dilate_size=0)
+        #     slider_update_function=ThresholdOverlay([b12_norm], infrared, col=[0, 1, 0])
         # ),
         # Subplot(
         #     "b11_norm (markiert)",
         #     infrared,
         #     slider_configs=[SliderConfig(initial_value=0.5, range=(0, b11_norm.max()))],
-        #     slider_update_function=lambda x: update_img(b11_norm, x[0], base_img=infrared, col=[0, 1, 0], dilate_size=0)
+        #     slider_update_function=ThresholdOverlay([b11_norm], infrared, col=[0, 1, 0])
         # ),
         # Subplot(
         #     "b8a_norm (markiert)",
         #     infrared,
         #     slider_configs=[SliderConfig(initial_value=0.5, range=(0, b8a_norm.max()))],
-        #     slider_update_function=lambda x: update_img(b8a_norm, x[0], base_img=infrared, col=[0, 1, 0], dilate_size=0)
+        #     slider_update_function=ThresholdOverlay([b8a_norm], infrared, col=[0, 1, 0])
         # ),
         # Subplot(
         #     "ultimate threshold finder",
@@ -216,7 +191,7 @@ def main(img: images.Image, plot_sync_zoom: bool = True, down_scale: bool = True
         #         SliderConfig(initial_value=0.5, label="B11 Green"),
         #         SliderConfig(initial_value=0.5, label="B8A Blue")
         #     ],
-        #     slider_update_function=lambda x: update_ultimate_threshoold_finder(*x, base_image=infrared)
+        #     slider_update_function=ThresholdOverlay([b12_norm, b11_norm, b8a_norm], infrared)
         # ),
     ]
 
@@ -234,8 +209,18 @@ def main(img: images.Image, plot_sync_zoom: bool = True, down_scale: bool = True
 
 if __name__ == "__main__":
     main(
-        images.Flin_Flon,  # Change to any image from the images module
+        images.Flin_Flon,  # Change to any image from the images module or to a scene name of the catalog (catalog.py)
         plot_sync_zoom=True,  # Set to False to disable synchronized zooming
         down_scale=False,  # Set to False to disable downscaling of the images
-        down_scale_factor=4  # Factor by which the images are downscaled (2 means half the size)
+        down_scale_factor=4,  # Factor by which the images are downscaled (2 means half the size)
+        tiled=False,  # Set to True to process the image tile by tile with bounded memory (no downscaling)
+        tile_size=1024,  # Size of the tiles in pixels (without the overlap for the morphology kernels)
+        cache_dir="cache/bands",  # Decoded bands are cached here for faster reruns, set to None to disable
+        cache_size_gb=4,  # Size limit of the band cache, the least recently used bands are removed first
+        geojson_path=None,  # Set to a file path (e.g. "fires.geojson") to export the outlines and statistics of the fires
+        precision="float64",  # "float32" halves the memory of the bands, the masks can differ slightly (see benchmark_precision.py)
+        output_dir=None,  # Set to a directory (e.g. "results") to write the masks, labels and burn index as Cloud-Optimized GeoTIFFs
+        roi=False,  # Set to True to process only the surroundings of fire candidates (no burnt area)
+        profile_path=None,  # Set to a path prefix (e.g. "profile") to record the stages to profile.jsonl and profile.trace.json (see profiling.py)
+        plot=True  # Set to False to only print and write the results, matplotlib is then never imported
     )
\ No newline at end of file